@@ -1,7 +1,12 @@
 import os
 import sys
 import time
-import json
+import random
+import shlex
+import signal
+import socket
+import logging
+import argparse
 from pathlib import Path
 try:
     from typing import Optional, Tuple
@@ -10,62 +15,80 @@ except ImportError:
     Optional = None
     Tuple = None
 
-import requests
-
 # 导入基础通用能力
+# requests、h2、分片与多节点协同等模块只在对应模式用到时加载，缩短 --once 等短时运行的启动时间；
+# 基于 asyncio 的探测引擎与按主机限流只在多目标模式加载，单目标模式不加载 asyncio
 from src.base import BaseApp
+from src.probe_options import (
+	PROBE_METHODS, DEFAULT_PROBE_METHOD, HEAD_REJECTED_STATUS, PHASES, PHASE_NAMES, drain_length, parse_thresholds
+)
+from src.scheduler import Scheduler, AdaptiveInterval
+from src.log_handlers import RepeatSampler
+from src.alert_state import AlertStateMachine
+from src.assertions import ContentAssertions
+from src.certificates import CertCache, cert_key, parse_warn_days
+from src.mail_queue import MailDispatcher
+from src.state_store import StateStore, TargetState
 
 
+# 异常持续超过20分钟（1200秒）后再次发送邮件
+ALERT_INTERVAL_SECONDS = 20 * 60
 
+# 服务器拒绝 HEAD 的目标改用的探测方式：{url: method}
+_METHOD_FALLBACK = {}
 
-## ========begin 业务代码 =============
+# 目标列表文件中每个目标可配置的选项及其类型
+TARGET_OPTIONS = {
+	"interval": int,  # 该目标的检查间隔（秒），默认 CHECK_INTERVAL_SECONDS
+	"degraded_ms": int,  # 该目标总耗时超过该毫秒数视为响应变慢，覆盖 DEGRADED_THRESHOLDS_MS 中的 total
+	# 内容断言（见 src.assertions.ContentAssertions），不通过时视为不可达
+	"contains": str,  # 响应体包含该文本
+	"regex": str,  # 响应体匹配该正则
+	"json": str,  # JSON 字段值，如 data.status=ok
+	"header": str,  # 响应头，如 Content-Type:text/html
+	"max_bytes": int,  # 响应体大小上限（字节）
+}
+
+# 多目标模式下修改后无需重启即可生效的配置项（其余配置项的修改在重启后生效）
+RELOADABLE_KEYS = {
+	"TARGET_URLS", "TARGETS_FILE", "CHECK_INTERVAL_SECONDS", "SCHEDULE_JITTER_SECONDS", "REQUEST_TIMEOUT_SECONDS",
+	"DEGRADED_THRESHOLDS_MS", "DEGRADED_THRESHOLDS", "CONFIRM_RETRIES", "CONFIRM_TIMEOUT_SECONDS",
+	"LOG_SAMPLE_SUCCESS_EVERY", "SMTP_HOST", "SMTP_PORT", "SMTP_USERNAME", "SMTP_PASSWORD", "SMTP_USE_TLS",
+	"MAIL_FROM", "MAIL_TO", "CONFIG_RELOAD_SECONDS", "CERT_EXPIRY_WARN_DAYS", "CERT_WARN_DAYS",
+}
 
-def read_state(state_file):
-	"""读取状态信息。
-	
-	返回: (last_ok, first_ng_ts, first_ok_ts, last_update_ts, last_alert_ts)
-	- last_ok: 最新一次检查的状态（True/False/None）
-	- first_ng_ts: 最早发现异常的时间戳（None表示当前正常）
-	- first_ok_ts: 最早转为正常的时间戳（None表示当前异常）
-	- last_update_ts: 最新一次登记的时间戳
-	- last_alert_ts: 上次发送告警/统计邮件的时间戳（None表示未发送过）
-	"""
-	if not state_file.exists():
-		return None, None, None, None, None
-	try:
-		data = json.loads(state_file.read_text(encoding="utf-8"))
-		return (
-			data.get("last_ok"),
-			data.get("first_ng_ts"),
-			data.get("first_ok_ts"),
-			data.get("last_update_ts"),
-			data.get("last_alert_ts")
-		)
-	except Exception:
-		return None, None, None, None, None
 
 
-def write_state(state_file, last_ok, first_ng_ts=None, first_ok_ts=None, last_alert_ts=None):
-	"""写入状态到文件。
+
+## ========begin 业务代码 =============
+
+def merge_state(existing, last_ok, first_ng_ts=None, first_ok_ts=None, last_alert_ts=None, current_time=None,
+		degraded=False, latency_ms=None):
+	"""根据现有状态和本次检查结果计算新状态（不读写文件）。
 	
 	Args:
+		existing: 现有状态（TargetState 或从状态文件读取的字典，可为空字典）
 		last_ok: 最新一次检查的状态
-		first_ng_ts: 最早发现异常的时间戳（如果为None，则从现有状态读取或设置）
-		first_ok_ts: 最早转为正常的时间戳（如果为None，则从现有状态读取或设置）
-		last_alert_ts: 上次发送告警/统计邮件的时间戳（如果为None，则从现有状态读取）
-	"""
-	current_time = int(time.time())
+		first_ng_ts: 最早发现异常的时间戳（如果为None，则从现有状态继承或设置）
+		first_ok_ts: 最早转为正常的时间戳（如果为None，则从现有状态继承或设置）
+		last_alert_ts: 上次发送告警/统计邮件的时间戳（如果为None，则从现有状态继承）
+		current_time: 当前时间戳，为None时取当前时间
+		degraded: 本次检查是否可达但响应变慢
+		latency_ms: 本次检查的总耗时（毫秒）
 	
-	# 读取现有状态（如果存在）
-	existing_last_ok, existing_first_ng_ts, existing_first_ok_ts, _, existing_last_alert_ts = read_state(state_file)
+	返回: 新状态（src.state_store.TargetState，写盘时转为与原来相同的字典）
+	"""
+	if current_time is None:
+		current_time = int(time.time())
+	existing_last_ok = existing.get("last_ok")
 	
 	# 如果未指定，则从现有状态继承
 	if first_ng_ts is None:
-		first_ng_ts = existing_first_ng_ts
+		first_ng_ts = existing.get("first_ng_ts")
 	if first_ok_ts is None:
-		first_ok_ts = existing_first_ok_ts
+		first_ok_ts = existing.get("first_ok_ts")
 	if last_alert_ts is None:
-		last_alert_ts = existing_last_alert_ts
+		last_alert_ts = existing.get("last_alert_ts")
 	
 	# 如果状态从正常变为异常，记录最早异常时间，清除告警时间
 	if last_ok is False and (existing_last_ok is True or existing_last_ok is None):
@@ -81,33 +104,1417 @@ def write_state(state_file, last_ok, first_ng_ts=None, first_ok_ts=None, last_al
 		first_ng_ts = None  # 清除异常时间
 		last_alert_ts = None  # 清除上次告警时间
 	
-	state = {
-		"last_ok": last_ok,
-		"first_ng_ts": first_ng_ts,
-		"first_ok_ts": first_ok_ts,
-		"last_update_ts": current_time,
-		"last_alert_ts": last_alert_ts
-	}
-	state_file.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+	return TargetState(
+		last_ok=last_ok,
+		first_ng_ts=first_ng_ts,
+		first_ok_ts=first_ok_ts,
+		last_update_ts=current_time,
+		last_alert_ts=last_alert_ts,
+		degraded=degraded,
+		latency_ms=latency_ms,
+	)
 
 
-def check_url(url, timeout_seconds):
+def parse_target_line(line, lineno=None):
+	"""解析目标列表文件中的一行：URL 后可跟 key=value 形式的目标选项，如 "https://a.com interval=30"。
+	
+	含空格的选项值用引号括起，如 contains="Welcome home"（反斜杠按原样保留，便于书写正则）。
+	返回: (url, 选项字典)
+	"""
+	if not any(char in line for char in " \t\"'"):
+		# 只有 URL、不带选项的行（大型目标列表的绝大多数）不经 shlex 解析
+		return sys.intern(line), {}
+	where = "目标列表第 {} 行".format(lineno) if lineno is not None else "TARGET_URL"
+	lexer = shlex.shlex(line, posix=True)
+	lexer.whitespace_split = True
+	lexer.commenters = ""
+	lexer.escape = ""
+	try:
+		fields = list(lexer)
+	except ValueError as exc:
+		raise ValueError("{}格式无效: {}".format(where, exc))
+	# URL 驻留，状态、调度、告警状态与历史中的同一目标共用一个字符串
+	url, options = sys.intern(fields[0]), {}
+	for field in fields[1:]:
+		key, sep, value = field.partition("=")
+		if not sep or key not in TARGET_OPTIONS:
+			raise ValueError("{}选项无效: {}（可选: {}）".format(
+				where, field, ", ".join(sorted(TARGET_OPTIONS))))
+		try:
+			options[key] = TARGET_OPTIONS[key](value)
+		except ValueError:
+			raise ValueError("{}选项值无效: {}".format(where, field))
+	try:
+		ContentAssertions.from_options(options)
+	except ValueError as exc:
+		raise ValueError("{}: {}".format(where, exc))
+	return url, options
+
+
+def load_targets(app, cfg):
+	"""读取多目标列表：TARGETS_FILE 文件与 TARGET_URLS（逗号或空白分隔）合并去重。
+	
+	TARGETS_FILE 每行一个URL，#开头为注释，URL 后可跟目标选项（见 parse_target_line）。
+	返回: {url: 选项字典}，保持配置中的顺序
+	"""
+	targets = {}
+	path = targets_path(app, cfg)
+	if path is not None:
+		if not path.exists():
+			raise FileNotFoundError("目标列表文件不存在: {}".format(path))
+		for lineno, line in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+			line = line.strip()
+			if line and not line.startswith("#"):
+				url, options = parse_target_line(line, lineno)
+				targets.setdefault(url, options)
+	if cfg.get("TARGET_URLS"):
+		for url in cfg["TARGET_URLS"].replace(",", " ").split():
+			targets.setdefault(sys.intern(url), {})
+	return targets
+
+
+def targets_path(app, cfg):
+	"""TARGETS_FILE 的路径（相对路径基于项目根目录），未配置时返回 None。"""
+	if not cfg.get("TARGETS_FILE"):
+		return None
+	path = Path(cfg["TARGETS_FILE"])
+	return path if path.is_absolute() else app.root / path
+
+
+def reload_config(app, cfg, logger, mailer):
+	"""配置文件或目标列表文件有变化时重新加载配置（每 CONFIG_RELOAD_SECONDS 秒检查一次的调用方负责节流）。
+	
+	RELOADABLE_KEYS 中的配置项原地更新到 cfg（邮件队列等持有 cfg 的对象随之生效），其余配置项的修改记录警告，
+	重启后生效。新配置无效时记录错误并沿用原配置。
+	返回: 新的目标字典；没有变化或新配置无效时返回 None
+	"""
+	if not app.config_changed(targets_path(app, cfg)):
+		return None
+	try:
+		new_cfg = app.reload_config()
+		targets = prepare_config(app, new_cfg)
+		if not targets:
+			raise ValueError("多目标模式不能在运行中切换为单目标模式，请重启")
+	except (FileNotFoundError, ValueError) as exc:
+		logger.error("重新加载配置失败，沿用原配置: {}".format(exc))
+		return None
+	changed = sorted(key for key, value in new_cfg.items() if value != cfg.get(key))
+	applied = [key for key in changed if key in RELOADABLE_KEYS]
+	for key in applied:
+		cfg[key] = new_cfg[key]
+	if any(key.startswith("SMTP_") for key in applied):
+		mailer.reconnect()
+	pending = [key for key in changed if key not in RELOADABLE_KEYS]
+	if pending:
+		logger.warning("以下配置项的修改需重启后生效: {}".format(", ".join(pending)))
+	# 密码等配置项只记录名称
+	logger.info("配置已重新加载{}".format("，已生效: " + ", ".join(applied) if applied else ""))
+	return targets
+
+
+def make_session(pool_size, ca_file=None):
+	"""创建带 keep-alive 连接池的 requests 会话，重复检查时复用 TCP/TLS 连接；ca_file 为校验目标证书的 CA 文件。"""
+	import functools
+	import requests
+	import requests.adapters
+
+	session = requests.Session()
+	if ca_file:
+		# 环境变量 REQUESTS_CA_BUNDLE 的优先级高于 session.verify，按请求传入才能确保使用该 CA 文件
+		session.verify = ca_file
+		session.request = functools.partial(session.request, verify=ca_file)
+	adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
+
+
+def check_url(url, timeout_seconds, session=None, method="get", stream_bytes=0, assertions=None, certs=None):
 	"""检查目标URL是否可达。
 
+	Args:
+		session: requests 会话，传入时复用其连接池；为None时每次新建连接
+		method: 探测方式 get/head/range/stream（见 src.probe_options.PROBE_METHODS），除 get 外都不下载完整响应体
+		stream_bytes: stream 方式下读取的响应体字节数
+		assertions: 内容断言（src.assertions.ContentAssertions），状态码 <400 时检查，不通过视为不可达
+			需要响应体时（assertions.needs_body）总是以 GET 边读边匹配，忽略 method 与 HEAD 回退
+		certs: 证书缓存（src.certificates.CertCache），https 目标从本次请求的连接取得证书
+
 	返回: (是否可达, HTTP状态码或None, 错误消息或None)
 	"""
+	client = session
+	if client is None:
+		import requests
+		client = requests
+	method = _METHOD_FALLBACK.get(url, method)
 	try:
-		resp = requests.get(url, timeout=timeout_seconds)
+		if assertions is not None and assertions.needs_body:
+			# 边读边匹配，断言有结论或达到读取上限即断开，不下载完整响应体
+			resp = client.get(url, timeout=timeout_seconds, stream=True)
+			if certs is not None:
+				observe_certificate(certs, resp)
+			mismatch = None
+			if resp.status_code < 400:
+				mismatch = assertions.check_headers(resp.headers)
+				if mismatch is None:
+					matcher = assertions.matcher()
+					for chunk in resp.iter_content(64 * 1024):
+						if matcher.feed(chunk):
+							break
+					mismatch = matcher.finish()
+			resp.close()
+			if mismatch is not None:
+				return False, resp.status_code, "内容检查失败: {}".format(mismatch)
+			return resp.status_code < 400, resp.status_code, None
+		# 都以 stream 方式发出，读取响应体（连接归还连接池）之前可以从连接上取得证书
+		if method == "head":
+			resp = client.head(url, timeout=timeout_seconds, allow_redirects=True, stream=True)
+			if certs is not None:
+				observe_certificate(certs, resp)
+			resp.content
+			if resp.status_code in HEAD_REJECTED_STATUS:
+				# 服务器不支持 HEAD，该目标以后改用 range 探测
+				_METHOD_FALLBACK[url] = "range"
+				return check_url(url, timeout_seconds, session, "range", stream_bytes, assertions, certs)
+		elif method == "get":
+			resp = client.get(url, timeout=timeout_seconds, stream=True)
+			if certs is not None:
+				observe_certificate(certs, resp)
+			resp.content
+		else:
+			headers = {"Range": "bytes=0-0"} if method == "range" else None
+			resp = client.get(url, timeout=timeout_seconds, headers=headers, stream=True)
+			if certs is not None:
+				observe_certificate(certs, resp)
+			# 服务器支持 Range 时响应体只有1字节，较小的响应体也读完，以便连接可复用；否则只读前 N 字节后断开
+			if (method == "range" and resp.status_code == 206) or drain_length(resp.headers) is not None:
+				resp.content
+			else:
+				if stream_bytes > 0:
+					resp.raw.read(stream_bytes)
+				resp.close()
 		# 认为 <400 为可达；>=400 为不可达
 		ok = resp.status_code < 400
+		if ok and assertions is not None:
+			mismatch = assertions.check_headers(resp.headers)
+			if mismatch is not None:
+				return False, resp.status_code, "内容检查失败: {}".format(mismatch)
 		return ok, resp.status_code, None
 	except Exception as exc:
+		if certs is not None:
+			observe_certificate_failure(certs, url, exc)
 		return False, None, str(exc)
 
+def observe_certificate(certs, resp):
+	"""从 requests 响应所在的连接取得 TLS 证书记入证书缓存，需在读取响应体（连接归还连接池）之前调用。"""
+	connection = getattr(resp.raw, "connection", None) or getattr(resp.raw, "_connection", None)
+	sock = getattr(connection, "sock", None)
+	key = cert_key(resp.url)
+	if key is None or not hasattr(sock, "getpeercert"):
+		return
+	host, _, port = key.rpartition(":")
+	certs.observe(host, int(port), sock, resp.url)
+
+def observe_certificate_failure(certs, url, exc):
+	"""请求因证书校验失败（如证书已过期）而出错时记入证书缓存，以便照常发送过期提醒。"""
+	key = cert_key(url)
+	if key is None:
+		return
+	host, _, port = key.rpartition(":")
+	certs.observe_failure(host, int(port), exc, url)
+
+def notify_check_result(mailer, logger, url, ok, status_text, error_msg, last_ok, first_ng_ts, last_alert_ts, current_time, timing_text=""):
+	"""根据本次检查结果与上次状态发送告警/恢复/持续异常邮件。
+	
+	邮件通过 mailer（src.mail_queue.MailDispatcher）异步发送，不阻塞检查。
+	timing_text 为本次探测的耗时摘要，非空时附在邮件末尾。
+	
+	返回: 更新后的 last_alert_ts
+	"""
+	# 1. 如果状态从异常恢复为正常，发送恢复通知
+	if ok is True and last_ok is False:
+		try:
+			# 计算异常持续时间
+			duration_minutes = 0
+			if first_ng_ts:
+				duration_seconds = current_time - first_ng_ts
+				duration_minutes = duration_seconds // 60
+			
+			subject = "axure网站已恢复正常"
+			content = (
+				"axure网站已恢复正常\n\n"
+				"URL: {}\n"
+				"状态: {}\n"
+				"异常持续时间: {} 分钟\n"
+				"恢复时间: {}\n"
+			).format(
+				url, 
+				status_text, 
+				duration_minutes,
+				time.strftime('%Y-%m-%d %H:%M:%S')
+			)
+			mail_sent = mailer.submit(subject, _with_timing(content, timing_text))
+			if mail_sent:
+				logger.info("恢复通知邮件已加入发送队列")
+				last_alert_ts = current_time  # 记录发送恢复通知的时间
+		except Exception as mail_exc:
+			logger.error("发送邮件失败: {}".format(mail_exc))
+	
+	# 2. 如果状态从正常变为异常，发送首次告警
+	elif ok is False and (last_ok is True or last_ok is None):
+		try:
+			subject = "axure网站挂了"
+			content = (
+				"axure网站挂了\n\n"
+				"URL: {}\n"
+				"状态: {}\n"
+				"错误: {}\n"
+				"时间: {}\n"
+			).format(url, status_text, error_msg or '', time.strftime('%Y-%m-%d %H:%M:%S'))
+			mail_sent = mailer.submit(subject, _with_timing(content, timing_text))
+			if mail_sent:
+				logger.info("告警邮件已加入发送队列")
+				last_alert_ts = current_time  # 记录发送首次告警的时间
+		except Exception as mail_exc:
+			logger.error("发送邮件失败: {}".format(mail_exc))
+	
+	# 3. 如果持续异常，且距离上次发送告警时间超过20分钟，再次发送统计邮件
+	elif ok is False and last_ok is False:
+		# 计算距离最早异常时间
+		if first_ng_ts:
+			elapsed_seconds = current_time - first_ng_ts
+			# 如果异常持续时间超过20分钟，且距离上次发送告警超过20分钟
+			if elapsed_seconds >= ALERT_INTERVAL_SECONDS:
+				# 检查距离上次发送告警的时间
+				time_since_last_alert = current_time - last_alert_ts if last_alert_ts else elapsed_seconds
+				if time_since_last_alert >= ALERT_INTERVAL_SECONDS:
+					try:
+						duration_minutes = elapsed_seconds // 60
+						subject = "axure网站持续异常"
+						content = (
+							"axure网站持续异常\n\n"
+							"URL: {}\n"
+							"状态: {}\n"
+							"错误: {}\n"
+							"异常持续时间: {} 分钟\n"
+							"统计时间: {}\n"
+						).format(
+							url, 
+							status_text, 
+							error_msg or '',
+							duration_minutes,
+							time.strftime('%Y-%m-%d %H:%M:%S')
+						)
+						mail_sent = mailer.submit(subject, _with_timing(content, timing_text))
+						if mail_sent:
+							logger.info("持续异常统计邮件已加入发送队列（异常持续 {} 分钟）".format(duration_minutes))
+							last_alert_ts = current_time  # 记录发送统计邮件的时间
+					except Exception as mail_exc:
+						logger.error("发送邮件失败: {}".format(mail_exc))
+	
+	return last_alert_ts
+
+
+def notify_verdict(mailer, logger, alerts, url, verdict, state, status_text, error_msg, current_time, timing_text=""):
+	"""按状态机结论发送告警：待确认时只记录日志，抖动期间只发送抖动开始/结束通知，其余按 notify_check_result 处理。
+	
+	返回: 更新后的 last_alert_ts
+	"""
+	last_alert_ts = state.get("last_alert_ts")
+	if verdict.pending:
+		logger.warning("疑似{}，待确认: {}（{}/{}）".format(
+			"恢复" if verdict.ok is False else "异常", url, verdict.count, verdict.needed))
+		return last_alert_ts
+	if verdict.flap is not None:
+		return notify_flapping(mailer, logger, url, verdict, alerts, current_time) or last_alert_ts
+	if verdict.flapping or verdict.ok is None:
+		return last_alert_ts
+	return notify_check_result(
+		mailer, logger, url, verdict.ok, status_text, error_msg,
+		state.get("last_ok"), state.get("first_ng_ts"), last_alert_ts, current_time, timing_text
+	)
+
+
+def notify_flapping(mailer, logger, url, verdict, alerts, current_time):
+	"""抖动开始时发送一封汇总通知（之后暂停单次告警），抖动结束时再发送一封。返回发送时间或 None。"""
+	state_text = "正常" if verdict.ok else "异常"
+	window_minutes = alerts.flap_window // 60
+	if verdict.flap == "start":
+		subject = "axure网站状态频繁抖动"
+		content = (
+			"axure网站状态频繁抖动\n\n"
+			"URL: {}\n"
+			"最近 {} 分钟内状态变化 {} 次，抖动期间暂停单次告警\n"
+			"当前状态: {}\n"
+			"时间: {}\n"
+		).format(url, window_minutes, alerts.transitions(url), state_text, time.strftime('%Y-%m-%d %H:%M:%S'))
+	else:
+		subject = "axure网站状态抖动已结束"
+		content = (
+			"axure网站状态抖动已结束\n\n"
+			"URL: {}\n"
+			"最近 {} 分钟内状态未再变化，恢复单次告警\n"
+			"当前状态: {}\n"
+			"时间: {}\n"
+		).format(url, window_minutes, state_text, time.strftime('%Y-%m-%d %H:%M:%S'))
+	logger.warning("{}: {}".format(subject, url))
+	if mailer.submit(subject, content):
+		logger.info("{}通知已加入发送队列".format(subject))
+		return current_time
+	return None
+
+
+def check_certificates(mailer, logger, certs, current_time, sweep=False, is_primary=None):
+	"""记录新取得（或已更换）的证书并检查其到期时间；sweep 为 True 时检查缓存中的所有证书。
+	
+	is_primary(url) 为 False 的证书不发送提醒（多节点协同时由目标的主节点发送）。
+	"""
+	changed = certs.pop_changed()
+	for key in changed:
+		info = certs.get(key)
+		logger.info("证书: {} {}，剩余 {} 天".format(key, info.summary(), info.days_left(current_time)))
+	for key in ([key for key, _ in certs.items()] if sweep else changed):
+		info = certs.get(key)
+		if is_primary is not None and not (info.url and is_primary(info.url)):
+			continue
+		notify_cert_expiry(mailer, logger, certs, key, current_time)
+
+
+def notify_cert_expiry(mailer, logger, certs, key, current_time):
+	"""证书剩余天数到达新的提醒档位（如30、14、7天）或已过期时发送提醒，每个档位只发送一次。"""
+	days = certs.expiry_alert(key, current_time)
+	if days is None:
+		return
+	info = certs.get(key)
+	if days < 0:
+		subject = "axure网站证书已过期"
+		remaining = "已过期"
+	else:
+		subject = "axure网站证书将在 {} 天后过期".format(days)
+		remaining = "{} 天".format(days)
+	content = (
+		"{}\n\n"
+		"主机: {}\n"
+		"URL: {}\n"
+		"到期时间: {}\n"
+		"剩余: {}\n"
+		"颁发者: {}\n"
+		"证书主题: {}\n"
+		"主机名匹配: {}\n"
+		"证书指纹(SHA-256): {}\n"
+		"时间: {}\n"
+	).format(subject, key, info.url or "",
+		time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info.expires)) if info.expires is not None else "未知（握手时证书校验失败）",
+		remaining, info.issuer or "", info.subject or "", "是" if info.hostname_ok else "否", info.fingerprint or "",
+		time.strftime('%Y-%m-%d %H:%M:%S'))
+	logger.warning("{}: {}".format(subject, key))
+	if mailer.submit(subject, content):
+		logger.info("证书到期提醒已加入发送队列: {}".format(key))
+
+
+def make_alert_machine(cfg):
+	"""按配置创建告警状态机。"""
+	return AlertStateMachine(
+		confirm_failures=cfg["ALERT_CONFIRM_FAILURES"],
+		confirm_window=cfg["ALERT_CONFIRM_WINDOW"],
+		recover_successes=cfg["ALERT_RECOVER_SUCCESSES"],
+		confirm_retries=cfg["CONFIRM_RETRIES"],
+		flap_window=cfg["FLAP_WINDOW_SECONDS"],
+		flap_threshold=cfg["FLAP_THRESHOLD"],
+	)
+
+
+def confirmed_since(verdict, state, ok):
+	"""确认状态刚变为 ok 时返回变化最早出现的时间，否则沿用状态中保存的时间。"""
+	key = "first_ok_ts" if ok else "first_ng_ts"
+	if verdict.changed and verdict.ok is ok:
+		return verdict.since
+	return state.get(key)
+
+
+def log_check_result(logger, sampler, url, status_text, ok, timing_text, quiet):
+	"""记录检查结果；quiet（可达且未变慢）的重复结果按 sampler 抽样，异常结果总是记录。"""
+	if not quiet:
+		sampler.forget(url)
+	else:
+		# 每个目标保留上次的状态文本，驻留后所有目标共用同一个 "200"
+		skipped = sampler.take(url, sys.intern(status_text))
+		if skipped is None:
+			return
+		if skipped:
+			timing_text = "{}（省略 {} 条相同结果）".format(timing_text, skipped)
+	logger.info("检查结果 - URL: {}, 状态: {}, 可达: {}, 耗时: {}".format(url, status_text, ok, timing_text))
+
+
+def _with_timing(content, timing_text):
+	"""在邮件内容末尾附上耗时摘要。"""
+	if not timing_text:
+		return content
+	return "{}耗时: {}\n".format(content, timing_text)
+
+
+def notify_degraded(mailer, logger, url, status_text, degraded, last_degraded, exceeded, timing_text):
+	"""可达但响应变慢（或变慢后恢复）时发送通知，只在状态切换时发送一次。"""
+	if degraded and not last_degraded:
+		subject = "axure网站响应变慢"
+		content = (
+			"axure网站响应变慢\n\n"
+			"URL: {}\n"
+			"状态: {}\n"
+			"超过阈值的阶段: {}\n"
+			"耗时: {}\n"
+			"时间: {}\n"
+		).format(url, status_text, ", ".join(PHASE_NAMES[name] for name in exceeded), timing_text,
+			time.strftime('%Y-%m-%d %H:%M:%S'))
+	elif last_degraded and not degraded:
+		subject = "axure网站响应已恢复"
+		content = (
+			"axure网站响应已恢复\n\n"
+			"URL: {}\n"
+			"状态: {}\n"
+			"耗时: {}\n"
+			"时间: {}\n"
+		).format(url, status_text, timing_text, time.strftime('%Y-%m-%d %H:%M:%S'))
+	else:
+		return
+	if mailer.submit(subject, content):
+		logger.info("{}通知已加入发送队列: {}".format(subject, url))
+
+
+def target_thresholds(thresholds, options):
+	"""目标的耗时阈值：全局 DEGRADED_THRESHOLDS_MS，目标选项 degraded_ms 覆盖总耗时阈值。"""
+	if "degraded_ms" not in options:
+		return thresholds
+	merged = dict(thresholds)
+	merged["total"] = options["degraded_ms"] / 1000.0
+	return merged
+
+
+def make_adaptive(cfg, logger):
+	"""按配置创建自适应检查间隔策略，未启用时返回 None（固定间隔）。"""
+	if not cfg["ADAPTIVE_INTERVAL"]:
+		return None
+	logger.info("自适应检查间隔已启用: 状态变化后每 {}s 复查，持续正常的目标间隔最长 {}s".format(
+		cfg["ADAPTIVE_MIN_INTERVAL_SECONDS"], cfg["ADAPTIVE_MAX_INTERVAL_SECONDS"]))
+	return AdaptiveInterval(
+		cfg["ADAPTIVE_MIN_INTERVAL_SECONDS"],
+		cfg["ADAPTIVE_MAX_INTERVAL_SECONDS"],
+		stable_after=cfg["ADAPTIVE_STABLE_CHECKS"],
+	)
+
+
+def make_dns_cache(cfg):
+	"""按配置创建探测共享的 DNS 缓存，未启用时返回 None（每次新建连接都调用系统解析）。"""
+	if not cfg["DNS_CACHE_ENABLED"]:
+		return None
+	from src.dns_cache import DnsCache
+
+	nameservers = (cfg["DNS_NAMESERVERS"] or "").replace(",", " ").split()
+	return DnsCache(
+		ttl=cfg["DNS_CACHE_TTL_SECONDS"],
+		negative_ttl=cfg["DNS_NEGATIVE_TTL_SECONDS"],
+		max_entries=cfg["DNS_CACHE_MAX_ENTRIES"],
+		stale_ttl=cfg["DNS_STALE_SECONDS"],
+		nameservers=nameservers,
+	)
+
+
+def make_ssl_context(cfg):
+	"""按 TLS_CA_FILE 创建校验目标证书的 TLS 上下文，未配置时返回 None（使用系统默认证书）。"""
+	if not cfg["TLS_CA_FILE"]:
+		return None
+	import ssl
+
+	return ssl.create_default_context(cafile=cfg["TLS_CA_FILE"])
+
+
+def http2_available():
+	"""是否已安装 h2（只在启用 PROBE_HTTP2 时加载 src.http2）。"""
+	from src import http2
+	return http2.available()
+
+
+def make_host_limiter(cfg):
+	"""按配置创建按主机的限流，未配置速率与并发上限时返回 None。"""
+	from src.host_limiter import HostLimiter
+	limiter = HostLimiter(
+		rate=cfg["HOST_RATE_PER_SECOND"],
+		burst=cfg["HOST_BURST"],
+		max_active=cfg["HOST_MAX_CONNECTIONS"],
+	)
+	return limiter if limiter.enabled else None
+
+
+def make_cluster(cfg, part=None):
+	"""按配置创建多节点协同视图，未配置 CLUSTER_DIR 时返回 None。"""
+	if not cfg["CLUSTER_DIR"]:
+		return None
+	from src.cluster import ClusterView
+
+	return ClusterView(
+		cfg["CLUSTER_DIR"], cfg["CLUSTER_NODE_ID"], part=part,
+		replicas=cfg["CLUSTER_REPLICAS"],
+		quorum=cfg["CLUSTER_QUORUM"],
+		node_ttl=cfg["CLUSTER_NODE_TTL_SECONDS"],
+		result_max_age=cfg["CLUSTER_RESULT_MAX_AGE_SECONDS"] or cfg["CHECK_INTERVAL_SECONDS"] * 3,
+		sync_interval=cfg["CLUSTER_SYNC_SECONDS"],
+	)
+
+
+def register_target_metrics(registry, urls, get_state, scheduler):
+	"""登记各目标状态与调度延迟的指标。
+
+	返回: (探测耗时直方图（按阶段）, forget(url))，目标被移除时调用 forget 丢弃其标签缓存
+	"""
+	from src.metrics import Histogram
+
+	url_labels = {}
+
+	def forget(url):
+		# 调用前目标已移出 urls；forget_labels 等待进行中的抓取结束，之后的抓取不会再加回该目标的标签
+		registry.forget_labels(url=url)
+		url_labels.pop(url, None)
+
+	def collect(writer):
+		rows = []
+		for url in list(urls):
+			state = get_state(url)
+			if state and state.get("last_ok") is not None:
+				label = url_labels.get(url)
+				if label is None:
+					label = url_labels[url] = registry.labels(url=url)
+				rows.append((label, state))
+		writer.family("target_up", "gauge", "目标是否可达（1 可达，0 不可达）")
+		for label, state in rows:
+			writer.sample("target_up", state["last_ok"], label)
+		writer.family("target_degraded", "gauge", "目标是否可达但响应变慢")
+		for label, state in rows:
+			writer.sample("target_degraded", bool(state.get("degraded")), label)
+		writer.family("target_latency_seconds", "gauge", "目标最近一次探测的总耗时（秒）")
+		for label, state in rows:
+			if state.get("latency_ms") is not None:
+				writer.sample("target_latency_seconds", state["latency_ms"] / 1000.0, label)
+		writer.family("scheduler_lag_seconds", "gauge", "最近一次触发相对计划时间的延迟（秒）")
+		writer.sample("scheduler_lag_seconds", scheduler.last_lag)
+		writer.family("scheduler_fired_total", "counter", "调度触发的检查次数")
+		writer.sample("scheduler_fired_total", scheduler.fired_total)
+		writer.family("scheduler_skipped_total", "counter", "因落后超过一个周期而跳过的检查轮次")
+		writer.sample("scheduler_skipped_total", scheduler.skipped_total)
+
+	registry.register(collect)
+	return Histogram(registry, "probe_duration_seconds", "探测各阶段耗时（秒）", label_name="phase"), forget
+
+
+def register_engine_metrics(registry, engine, store):
+	"""登记探测引擎（按结果类别的探测次数、进行中探测数、连接池、DNS缓存）与状态写入的指标。"""
+	def collect(writer):
+		writer.family("probes_total", "counter", "按结果类别（ok 或错误类别）累计的探测次数")
+		for outcome, count in list(engine.outcomes.items()):
+			writer.sample("probes_total", count, registry.labels(outcome=outcome))
+		writer.family("probes_inflight", "gauge", "正在进行中的探测数（含排队等待的）")
+		writer.sample("probes_inflight", engine.inflight_count())
+		if engine.host_limiter is not None:
+			writer.family("host_limiter_queued", "gauge", "因主机限流正在排队等待的探测数")
+			writer.sample("host_limiter_queued", engine.host_limiter.queued())
+		if engine.pool is not None:
+			writer.family("pool_idle_connections", "gauge", "连接池中的空闲连接数")
+			writer.sample("pool_idle_connections", engine.pool.idle_count())
+		if engine.h2_pool is not None:
+			writer.family("http2_connections", "gauge", "各源站共享的 HTTP/2 连接数")
+			writer.sample("http2_connections", engine.h2_pool.session_count())
+			writer.family("http2_fallback_origins", "gauge", "未协商出 HTTP/2、改用 HTTP/1.1 的源站数")
+			writer.sample("http2_fallback_origins", len(engine.h2_pool.h1_origins))
+		if engine.dns_cache is not None:
+			dns = engine.dns_cache.stats()
+			writer.family("dns_cache_entries", "gauge", "DNS缓存中的主机数")
+			writer.sample("dns_cache_entries", dns["entries"])
+			writer.family("dns_cache_lookups_total", "counter", "DNS缓存查询次数，按结果分类")
+			for result in ("hits", "misses", "coalesced", "negative_hits", "stale_hits"):
+				writer.sample("dns_cache_lookups_total", dns[result], registry.labels(result=result))
+			writer.family("dns_resolve_failures_total", "counter", "DNS解析失败次数")
+			writer.sample("dns_resolve_failures_total", dns["failures"])
+		writer.family("state_writes_total", "counter", "状态文件写盘次数")
+		writer.sample("state_writes_total", store.writes)
+
+	registry.register(collect)
+
+
+def register_mail_metrics(registry, mailer):
+	"""登记告警邮件队列的指标。"""
+	def collect(writer):
+		writer.family("alert_queue_depth", "gauge", "告警邮件队列中等待发送的邮件数")
+		writer.sample("alert_queue_depth", mailer.depth())
+		writer.family("alert_mails_total", "counter", "告警邮件数，按结果分类（sent/dropped/failed）")
+		writer.sample("alert_mails_total", mailer.sent, registry.labels(result="sent"))
+		writer.sample("alert_mails_total", mailer.dropped, registry.labels(result="dropped"))
+		writer.sample("alert_mails_total", mailer.failed, registry.labels(result="failed"))
+
+	registry.register(collect)
+
+
+def load_state(store, logger):
+	"""加载状态（快照 + 重放崩溃前未写入快照的变化），记录恢复情况。"""
+	start = time.monotonic()
+	data = store.load()
+	if store.load_error:
+		logger.warning(store.load_error)
+	if store.replayed:
+		logger.info("状态已恢复: 重放上次退出前未写入快照的 {} 条变化，耗时 {:.1f}ms".format(
+			store.replayed, (time.monotonic() - start) * 1000))
+	return data
+
+
+def resume_delay(state, interval, now):
+	"""重启后续接调度：距上次检查不足一个间隔时返回到下次检查的秒数，否则返回 None（首次检查打散进行）。"""
+	last = (state or {}).get("last_update_ts")
+	if not last or not 0 <= now - last < interval:
+		return None
+	return interval - (now - last)
+
+
+def open_history(app, cfg):
+	"""按配置打开检查历史（rundata/history），未启用时返回 None。"""
+	if not cfg["HISTORY_ENABLED"]:
+		return None
+	from src.history import HistoryStore
+
+	return HistoryStore(app.root / "rundata" / "history", retention_days=cfg["HISTORY_RETENTION_DAYS"],
+		raw_days=cfg["HISTORY_RAW_DAYS"])
+
+
+def open_cert_cache(app, cfg, logger, urls, name="certs-state.json"):
+	"""按配置创建证书缓存（保存在 rundata/ 下，只保留 urls 中 https 目标的证书），未配置提醒天数时返回 None。"""
+	if not cfg["CERT_WARN_DAYS"]:
+		return None
+	rundata_dir = app.root / "rundata"
+	rundata_dir.mkdir(exist_ok=True)
+	store = StateStore(rundata_dir / name, cfg["STATE_FLUSH_INTERVAL_SECONDS"])
+	certs = CertCache(cfg["CERT_WARN_DAYS"], store)
+	certs.restore(load_state(store, logger))
+	certs.prune(cert_keys(urls))
+	return certs
+
+
+def cert_keys(urls):
+	return {key for key in map(cert_key, urls) if key is not None}
+
+
+def register_cert_metrics(registry, certs):
+	"""登记证书到期时间的指标。"""
+	def collect(writer):
+		items = certs.items()
+		writer.family("cert_expiry_timestamp_seconds", "gauge", "证书（含证书链中的中间证书）最早的到期时间")
+		for key, info in items:
+			if info.expires is not None:
+				writer.sample("cert_expiry_timestamp_seconds", info.expires, registry.labels(host=key))
+		writer.family("cert_hostname_match", "gauge", "主机名是否与证书的 SAN 匹配")
+		for key, info in items:
+			writer.sample("cert_hostname_match", bool(info.hostname_ok), registry.labels(host=key))
+		writer.family("cert_inspections_total", "counter", "解析证书的次数（首次见到或证书指纹变化时）")
+		writer.sample("cert_inspections_total", certs.inspected)
+
+	registry.register(collect)
+
+
+def run_single_target(app, cfg, logger, mailer, once=False, stop=None):
+	"""单目标模式：按 TARGET_URL 循环检查（保持原有 state.json 格式）。
+	
+	once 为 True 时只检查一次（含确认复查）后返回，返回值为确认不可达的目标数。
+	stop 为 threading.Event，被设置后在下一次检查前退出循环（与中断时一样保存状态），供在其他线程中运行时停止。
+	"""
+	# 创建 rundata 目录（如果不存在）
+	rundata_dir = app.root / "rundata"
+	rundata_dir.mkdir(exist_ok=True)
+	
+	# 读取上次状态，之后以内存中的状态为准，按间隔写回
+	store = StateStore(rundata_dir / "state.json", cfg["STATE_FLUSH_INTERVAL_SECONDS"], indent=2)
+	state = load_state(store, logger)
+	history = open_history(app, cfg)
+
+	# TARGET_URL 同样可以带目标选项，如 "https://a.com contains=OK"
+	url, options = parse_target_line(cfg["TARGET_URL"])
+	interval = options.get("interval", cfg["CHECK_INTERVAL_SECONDS"])
+	assertions = ContentAssertions.from_options(options, cfg["CONTENT_SCAN_BYTES"])
+	request_timeout = cfg["REQUEST_TIMEOUT_SECONDS"]
+	
+	idle_timeout = cfg["POOL_IDLE_TIMEOUT_SECONDS"]
+	cold_sample_rate = cfg["COLD_CONNECT_SAMPLE_RATE"]
+	session = make_session(cfg["POOL_SIZE_PER_HOST"], cfg["TLS_CA_FILE"])
+	last_probe = time.monotonic()
+	total_threshold = target_thresholds(cfg["DEGRADED_THRESHOLDS"], options)
+	sampler = RepeatSampler(cfg["LOG_SAMPLE_SUCCESS_EVERY"])
+	certs = open_cert_cache(app, cfg, logger, [url])
+	
+	if once:
+		logger.info("单次检查: {}".format(url))
+	else:
+		logger.info("监控启动: {}，检查间隔: {}s，日志保留: {}天".format(url, interval, cfg['LOG_RETENTION_DAYS']))
+	logger.info("进程ID: {}".format(os.getpid()))
+
+	# 以固定节奏触发检查，检查与发送邮件的耗时不会累加到周期上
+	# 重启后距上次检查不足一个间隔时按原节奏续接，不立即检查（单次运行时立即检查）
+	scheduler = Scheduler()
+	scheduler.add(url, interval, delay=0 if once else resume_delay(state, interval, time.time()) or 0)
+	adaptive = make_adaptive(cfg, logger)
+	alerts = make_alert_machine(cfg)
+	confirm_timeout = min(cfg["CONFIRM_TIMEOUT_SECONDS"], request_timeout)
+	latency = None
+	if app.metrics is not None:
+		latency, _ = register_target_metrics(app.metrics, [url], lambda _: state, scheduler)
+		if certs is not None:
+			register_cert_metrics(app.metrics, certs)
+
+	try:
+		while True:
+			if not once:
+				if stop is None:
+					time.sleep(scheduler.seconds_until_next())
+				elif stop.wait(scheduler.seconds_until_next()):
+					break
+			scheduler.pop_due()
+			if scheduler.last_lag >= interval:
+				logger.warning("调度延迟 {:.1f}s，已跳过错过的检查".format(scheduler.last_lag))
+			probe_timeout = request_timeout
+			while True:
+				# 连接空闲超时或被抽中做冷连接测量时，关闭连接池中的旧连接
+				if time.monotonic() - last_probe >= idle_timeout or random.random() < cold_sample_rate:
+					session.close()
+				last_probe = time.monotonic()
+				ok, status_code, error_msg = check_url(
+					url, probe_timeout, session, cfg["PROBE_METHOD"], cfg["STREAM_READ_BYTES"], assertions, certs)
+				elapsed_ms = (time.monotonic() - last_probe) * 1000
+				if latency is not None:
+					latency.observe(elapsed_ms / 1000.0, "total")
+				status_text = "{}".format(status_code) if status_code is not None else "EXCEPTION"
+				current_time = int(time.time())
+				# 单目标模式只能测得总耗时，仅 total 阈值生效
+				degraded = bool(ok and "total" in total_threshold and elapsed_ms > total_threshold["total"] * 1000)
+				timing_text = "总 {:.0f}ms".format(elapsed_ms)
+				if history:
+					if ok:
+						error_class = None
+					elif status_code is None:
+						error_class = "other"
+					else:
+						# 状态码 <400 仍不可达说明内容断言不通过
+						error_class = "http" if status_code >= 400 else "content"
+					history.append(url, current_time, status_code, elapsed_ms, error_class, ok, degraded=degraded)
+		
+				# 记录检查结果到日志
+				log_check_result(logger, sampler, url, status_text, ok, timing_text, ok and not degraded)
+				if error_msg:
+					logger.warning("请求异常: {}".format(error_msg))
+				if degraded:
+					logger.warning("响应变慢: 总耗时超过阈值 {}ms".format(int(total_threshold["total"] * 1000)))
+
+				# 确认状态由状态机按最近多次结果决定
+				last_ok = state.get("last_ok")
+				verdict = alerts.observe(url, ok, current_time, last_ok)
+				last_alert_ts = notify_verdict(
+					mailer, logger, alerts, url, verdict, state, status_text, error_msg, current_time, timing_text)
+				if ok and verdict.ok and last_ok is not False and not verdict.flapping:
+					notify_degraded(mailer, logger, url, status_text, degraded, state.get("degraded"), ["total"], timing_text)
+
+				# 更新内存中的状态（无论是否变化都更新 last_update_ts），状态或告警时间变化才需要落盘
+				new_state = merge_state(
+					state, verdict.ok, confirmed_since(verdict, state, False), confirmed_since(verdict, state, True),
+					last_alert_ts, current_time, degraded, int(elapsed_ms))
+				state_changed = (last_ok != verdict.ok or bool(state.get("degraded")) != degraded)
+				store.replace(new_state, changed=state_changed or new_state["last_alert_ts"] != state.get("last_alert_ts"))
+				state = new_state
+				if last_ok != verdict.ok:
+					logger.info("状态变更: {} -> {}".format(last_ok, verdict.ok))
+				if adaptive is not None:
+					scheduler.set_interval(url, adaptive.update(url, interval, ok))
+				if not verdict.retry:
+					break
+				# 待确认：立即以短超时复查
+				probe_timeout = confirm_timeout
+			if certs is not None:
+				check_certificates(mailer, logger, certs, int(time.time()), sweep=True)
+				certs.store.maybe_flush()
+			store.maybe_flush()
+			if history:
+				history.maybe_flush()
+			if once:
+				return int(state.get("last_ok") is False)
+	finally:
+		store.close()
+		if history:
+			history.close()
+		if certs is not None:
+			certs.store.close()
+
+
+def run_multi_target(app, cfg, logger, mailer, targets, shard=None, once=False, stop=None):
+	"""多目标模式：在一个事件循环上按各目标的间隔并发探测，状态按URL保存在 targets-state.json。
+	
+	shard 为分片工作进程的 src.shard.ShardWorker，此时状态与历史发回主进程保存。
+	once 为 True 时所有目标并发检查一次（含确认复查）后返回，返回值为确认不可达的目标数。
+	stop 为 threading.Event，被设置后一秒内退出循环（与中断时一样保存状态），供在其他线程中运行时停止。
+	"""
+	from src.probe import ProbeEngine, check_degraded
+	if shard is None:
+		rundata_dir = app.root / "rundata"
+		rundata_dir.mkdir(exist_ok=True)
+		store = StateStore(rundata_dir / "targets-state.json", cfg["STATE_FLUSH_INTERVAL_SECONDS"], record=TargetState)
+		history = open_history(app, cfg)
+	else:
+		store, history = shard.store, shard.history
+	states = load_state(store, logger) if shard is None else store.load()
+	# 丢弃已不在目标列表中的状态
+	store.prune(targets)
+
+	interval = cfg["CHECK_INTERVAL_SECONDS"]
+	jitter = cfg["SCHEDULE_JITTER_SECONDS"]
+	thresholds = cfg["DEGRADED_THRESHOLDS"]
+	sampler = RepeatSampler(cfg["LOG_SAMPLE_SUCCESS_EVERY"])
+	certs = open_cert_cache(app, cfg, logger, targets,
+		"certs-state.json" if shard is None else "certs-state-{}.json".format(shard.index))
+	use_http2 = cfg["PROBE_HTTP2"]
+	if use_http2 and not http2_available():
+		logger.warning("未安装 h2（pip install h2），PROBE_HTTP2 不生效，继续使用 HTTP/1.1 探测")
+		use_http2 = False
+	engine = ProbeEngine(
+		concurrency=cfg["PROBE_CONCURRENCY"],
+		timeout_seconds=cfg["REQUEST_TIMEOUT_SECONDS"],
+		pool_size=cfg["POOL_SIZE_PER_HOST"],
+		idle_timeout=cfg["POOL_IDLE_TIMEOUT_SECONDS"],
+		cold_sample_rate=cfg["COLD_CONNECT_SAMPLE_RATE"],
+		method=cfg["PROBE_METHOD"],
+		stream_bytes=cfg["STREAM_READ_BYTES"],
+		dns_cache=make_dns_cache(cfg),
+		host_limiter=make_host_limiter(cfg),
+		http2=use_http2,
+		certs=certs,
+		ssl_context=make_ssl_context(cfg),
+	)
+	
+	# 每个目标按自己的间隔调度，首次检查在 [0, jitter] 内打散（未配置时打散到整个间隔）
+	scheduler = Scheduler()
+	adaptive = make_adaptive(cfg, logger)
+	alerts = make_alert_machine(cfg)
+	confirm_timeout = min(cfg["CONFIRM_TIMEOUT_SECONDS"], cfg["REQUEST_TIMEOUT_SECONDS"])
+	# 多节点协同时只探测归属本节点的目标
+	cluster = make_cluster(cfg, shard.index if shard is not None else None)
+	probing = {}
+	forget_metrics = None
+
+	def assign_targets():
+		"""按归属把目标加入或移出调度，返回新加入的目标中按上次检查时间续接调度的数量。"""
+		now = time.time()
+		resumed = 0
+		for url, options in targets.items():
+			owned = cluster is None or cluster.owns(url)
+			if owned and url not in probing:
+				target_interval = options.get("interval", interval)
+				delay = resume_delay(states.get(url), target_interval, now)
+				if delay is None:
+					scheduler.add(url, target_interval, jitter=target_interval if jitter is None else jitter)
+				else:
+					scheduler.add(url, target_interval, delay=delay)
+					resumed += 1
+				probing[url] = options
+				set_assertions(url, options)
+			elif not owned and url in probing:
+				drop_target(url)
+		return resumed
+
+	def set_assertions(url, options):
+		# 每个目标的断言只在加入或选项变化时编译一次
+		assertions = ContentAssertions.from_options(options, cfg["CONTENT_SCAN_BYTES"])
+		if assertions is None:
+			engine.assertions.pop(url, None)
+		else:
+			engine.assertions[url] = assertions
+
+	def drop_target(url):
+		scheduler.remove(url)
+		del probing[url]
+		engine.assertions.pop(url, None)
+		alerts.forget(url)
+		sampler.forget(url)
+		if cluster is not None:
+			cluster.forget(url)
+		if adaptive is not None:
+			adaptive.forget(url)
+		if forget_metrics is not None:
+			forget_metrics(url)
+
+	def apply_config(new_targets):
+		"""应用重新加载的配置：只增删变化的目标、按新间隔重新调度，其余目标的状态与连接池保持不变。"""
+		nonlocal interval, jitter, thresholds, confirm_timeout
+		interval = cfg["CHECK_INTERVAL_SECONDS"]
+		jitter = cfg["SCHEDULE_JITTER_SECONDS"]
+		thresholds = cfg["DEGRADED_THRESHOLDS"]
+		confirm_timeout = min(cfg["CONFIRM_TIMEOUT_SECONDS"], cfg["REQUEST_TIMEOUT_SECONDS"])
+		engine.timeout_seconds = cfg["REQUEST_TIMEOUT_SECONDS"]
+		alerts.confirm_retries = cfg["CONFIRM_RETRIES"]
+		sampler.every = max(1, cfg["LOG_SAMPLE_SUCCESS_EVERY"])
+		if certs is not None:
+			certs.warn_days = cfg["CERT_WARN_DAYS"]
+		removed = [url for url in targets if url not in new_targets]
+		added = [url for url in new_targets if url not in targets]
+		for url in removed:
+			del targets[url]
+			if url in probing:
+				drop_target(url)
+		if shard is None:
+			store.prune(new_targets)
+		if certs is not None:
+			certs.prune(cert_keys(new_targets))
+		for url, options in new_targets.items():
+			targets[url] = options
+			if url in probing:
+				if options != probing[url]:
+					set_assertions(url, options)
+				probing[url] = options
+				scheduler.set_interval(url, options.get("interval", interval))
+		assign_targets()
+		logger.info("目标列表已更新: 新增 {}，移除 {}，共 {} 个目标，本{}探测 {} 个".format(
+			len(added), len(removed), len(targets), "分片" if shard is not None else "节点", len(probing)))
+
+	if cluster is not None:
+		cluster.sync()
+	resumed = assign_targets()
+	latency = None
+	queue_wait = None
+	if app.metrics is not None:
+		latency, forget_metrics = register_target_metrics(app.metrics, probing, states.get, scheduler)
+		register_engine_metrics(app.metrics, engine, store)
+		if certs is not None:
+			register_cert_metrics(app.metrics, certs)
+		if engine.host_limiter is not None:
+			from src.metrics import Histogram
+			queue_wait = Histogram(app.metrics, "probe_queue_wait_seconds", "探测开始前因主机限流排队的时间（秒），不计入探测耗时")
+	
+	if once:
+		logger.info("单次检查: {} 个目标，并发上限: {}".format(len(targets), engine.concurrency))
+	else:
+		logger.info("多目标监控启动: {} 个目标，并发上限: {}，检查间隔: {}s，日志保留: {}天".format(
+			len(targets), engine.concurrency, interval, cfg['LOG_RETENTION_DAYS']))
+	if cluster is not None:
+		logger.info("多节点协同: 本节点 {}，存活节点 {}，本节点探测 {} 个目标，法定数 {}/{}".format(
+			cluster.node_id, ", ".join(cluster.nodes), len(probing), cluster.quorum, cluster.replicas))
+	if engine.h2_pool is not None:
+		logger.info("HTTP/2 探测已启用: 同一源站的 https 目标共用一条连接，不支持 h2 的源站改用 HTTP/1.1")
+	if engine.host_limiter is not None:
+		limiter = engine.host_limiter
+		logger.info("主机限流: 每个主机每秒最多 {} 次探测（突发 {}），同时最多 {} 个探测".format(
+			"{:g}".format(limiter.rate) if limiter.rate else "不限", limiter.burst, limiter.max_active or "不限"))
+	if resumed and not once:
+		logger.info("续接调度: {} 个目标按上次检查时间继续，其余 {} 个目标的首次检查打散进行".format(
+			resumed, len(probing) - resumed))
+	logger.info("进程ID: {}".format(os.getpid()))
+
+	# 统计日志与配置检查的节流
+	report = {"last_report": time.monotonic(), "last_reload": time.monotonic()}
+
+	def handle_result(result):
+		# 探测期间目标已被移除或转给其他节点
+		if result.url not in probing:
+			return
+		try:
+			url = result.url
+			current_time = int(time.time())
+			state = states.get(url, {})
+			last_ok = state.get("last_ok")
+			status_text = "{}".format(result.status_code) if result.status_code is not None else "EXCEPTION"
+			exceeded = check_degraded(result, target_thresholds(thresholds, targets.get(url, {})))
+			timing_text = result.timing_text()
+			if latency is not None:
+				for phase in PHASES:
+					value = result.phase(phase)
+					if value is not None:
+						latency.observe(value, phase)
+			if queue_wait is not None:
+				queue_wait.observe(result.queue_wait)
+			if history:
+				history.append(url, current_time, result.status_code, result.elapsed * 1000,
+					result.error_class, result.ok, result.reused, result.degraded)
+
+			log_check_result(logger, sampler, url, status_text, result.ok, timing_text, result.ok and not result.degraded)
+			if result.error:
+				logger.warning("请求异常: {} - {}".format(url, result.error))
+			if result.degraded:
+				logger.warning("响应变慢: {} - 超过阈值: {}".format(url, ", ".join(PHASE_NAMES[name] for name in exceeded)))
+
+			# 多节点协同时按各归属节点的结果判定，达到法定数的节点都失败才算不可达
+			ok = result.ok
+			if cluster is not None:
+				cluster.record(url, result.ok, current_time)
+				ok, failing, voters = cluster.decide(url, result.ok, current_time)
+				if ok is None:
+					# 其他归属节点的结果缺失或过期，不足以判定：保持上次的状态，不告警
+					if result.ok != last_ok:
+						logger.info("多节点判定: {} 本节点{}，其他节点的结果缺失或过期（{}/{} 个节点有结果），保持上次状态".format(
+							url, "可达" if result.ok else "不可达", voters, len(cluster.owners(url))))
+					return
+				if ok != result.ok:
+					logger.info("多节点判定: {} 本节点{}，{}/{} 个节点探测失败，判定为{}".format(
+						url, "可达" if result.ok else "不可达", failing, voters, "可达" if ok else "不可达"))
+
+			# 确认状态由状态机按最近多次结果决定，待确认时立即以短超时复查
+			verdict = alerts.observe(url, ok, current_time, last_ok)
+			if verdict.retry:
+				engine.submit(url, handle_result, confirm_timeout)
+			# 多节点协同时只由目标的主节点发送告警
+			last_alert_ts = state.get("last_alert_ts")
+			if cluster is None or cluster.is_primary(url):
+				last_alert_ts = notify_verdict(
+					mailer, logger, alerts, url, verdict, state, status_text, result.error, current_time, timing_text)
+				if result.ok and verdict.ok and last_ok is not False and not verdict.flapping:
+					notify_degraded(mailer, logger, url, status_text, result.degraded, state.get("degraded"),
+						exceeded, timing_text)
+			new_state = merge_state(
+				state, verdict.ok, confirmed_since(verdict, state, False), confirmed_since(verdict, state, True),
+				last_alert_ts, current_time, result.degraded, int(result.elapsed * 1000)
+			)
+			state_changed = last_ok != verdict.ok or bool(state.get("degraded")) != result.degraded
+			store.set(url, new_state, changed=state_changed or new_state["last_alert_ts"] != state.get("last_alert_ts"))
+			if last_ok != verdict.ok:
+				logger.info("状态变更: {} {} -> {}".format(url, last_ok, verdict.ok))
+			if adaptive is not None:
+				scheduler.set_interval(url, adaptive.update(url, targets[url].get("interval", interval), result.ok))
+		except Exception as exc:
+			logger.error("处理检查结果失败: {} - {}".format(result.url, exc))
+
+	def on_tick():
+		now = time.monotonic()
+		if shard is not None:
+			shard.poll()
+			# 分片模式由主进程重新加载配置并下发
+			if shard.reloaded is not None:
+				new_cfg, new_targets = shard.reloaded
+				shard.reloaded = None
+				cfg.update(new_cfg)
+				apply_config(new_targets)
+		elif cfg["CONFIG_RELOAD_SECONDS"] and now - report["last_reload"] >= cfg["CONFIG_RELOAD_SECONDS"]:
+			report["last_reload"] = now
+			new_targets = reload_config(app, cfg, logger, mailer)
+			if new_targets is not None:
+				apply_config(new_targets)
+		if cluster is not None and cluster.sync():
+			assign_targets()
+			logger.info("集群节点变化: 存活节点 {}，本节点探测 {} 个目标".format(", ".join(cluster.nodes), len(probing)))
+		# 新取得的证书立即检查到期时间，其余证书随统计日志定期检查
+		sweep = now - report["last_report"] >= interval
+		if certs is not None:
+			check_certificates(mailer, logger, certs, int(time.time()), sweep,
+				cluster.is_primary if cluster is not None else None)
+			certs.store.maybe_flush()
+		store.maybe_flush()
+		if history:
+			history.maybe_flush()
+		if sweep:
+			up_count = sum(1 for url in probing if states.get(url, {}).get("last_ok"))
+			lag = scheduler.stats()
+			logger.info("监控统计: 可达 {}/{}，调度延迟 平均 {:.1f}ms 最大 {:.1f}ms，跳过 {} 轮".format(
+				up_count, len(probing), lag["avg_lag"] * 1000, lag["max_lag"] * 1000, lag["skipped"]))
+			scheduler.reset_stats()
+			# 排队时间单独统计，不计入探测耗时，不会被当作网站变慢
+			if engine.host_limiter is not None:
+				queue = engine.host_limiter.stats()
+				logger.info("主机限流: 排队 {} 次，等待 平均 {:.1f}ms 最大 {:.1f}ms，当前排队 {}".format(
+					queue["waited"], queue["avg_wait"] * 1000, queue["max_wait"] * 1000, queue["queued"]))
+				engine.host_limiter.reset_stats()
+			# 按结果类别累计，DNS 解析失败与 HTTP 错误分开统计
+			logger.info("探测结果累计: {}".format(
+				", ".join("{} {}".format(name, count) for name, count in sorted(engine.outcomes.items()))))
+			if engine.dns_cache is not None:
+				dns = engine.dns_cache.stats()
+				logger.info("DNS缓存: 条目 {}，命中 {}，解析 {}，合并 {}，负缓存命中 {}，解析失败 {}，沿用过期结果 {}".format(
+					dns["entries"], dns["hits"], dns["misses"], dns["coalesced"], dns["negative_hits"],
+					dns["failures"], dns["stale_hits"]))
+			report["last_report"] = now
+
+	try:
+		if once:
+			started = time.monotonic()
+			engine.run_once(list(probing), handle_result)
+			if certs is not None:
+				check_certificates(mailer, logger, certs, int(time.time()), True,
+					cluster.is_primary if cluster is not None else None)
+			up_count = sum(1 for url in probing if states.get(url, {}).get("last_ok"))
+			down = sum(1 for url in probing if states.get(url, {}).get("last_ok") is False)
+			logger.info("单次检查完成: 可达 {}/{}，不可达 {}，耗时 {:.1f}s".format(
+				up_count, len(probing), down, time.monotonic() - started))
+			return down
+		engine.run_forever(scheduler, handle_result, on_tick, stop)
+	finally:
+		engine.close()
+		if cluster is not None:
+			cluster.close()
+		store.close()
+		if history:
+			history.close()
+		if certs is not None:
+			certs.store.close()
+
+def run_shard_worker(shard, cfg, targets):
+	"""分片工作进程入口：只探测本分片的目标，日志、状态、历史、告警与指标都交给主进程。"""
+	app = BaseApp("check-web-alive")
+	app.metrics = shard.registry
+	logger = logging.getLogger(app.app_name)
+	run_multi_target(app, cfg, logger, shard.mailer, targets, shard)
+
+
+def run_sharded(app, cfg, logger, mailer, targets):
+	"""分片模式：按一致性哈希把目标分给 SHARD_WORKERS 个工作进程探测，本进程汇总状态、历史、告警与指标。"""
+	from src.shard import ShardSupervisor, split_targets
+
+	rundata_dir = app.root / "rundata"
+	rundata_dir.mkdir(exist_ok=True)
+	
+	store = StateStore(rundata_dir / "targets-state.json", cfg["STATE_FLUSH_INTERVAL_SECONDS"], record=TargetState)
+	load_state(store, logger)
+	store.prune(targets)
+	history = open_history(app, cfg)
+	shards = split_targets(targets, cfg["SHARD_WORKERS"])
+	supervisor = ShardSupervisor(
+		run_shard_worker, cfg, shards, store.data, logger,
+		history=history is not None,
+		metrics_prefix=app.metrics.prefix if app.metrics is not None else None,
+	)
+	if app.metrics is not None:
+		app.metrics.register(supervisor.collect_metrics)
+	handlers = {"state": store.set, "mail": mailer.submit}
+	if history:
+		handlers["history"] = history.append
+	
+	logger.info("分片监控启动: {} 个目标，{} 个工作进程（各 {} 个目标），检查间隔: {}s，日志保留: {}天".format(
+		len(targets), len(shards), "/".join(str(len(shard)) for shard in shards),
+		cfg["CHECK_INTERVAL_SECONDS"], cfg['LOG_RETENTION_DAYS']))
+	logger.info("进程ID: {}".format(os.getpid()))
+
+	reload = {"last": time.monotonic()}
+
+	def on_tick():
+		now = time.monotonic()
+		if cfg["CONFIG_RELOAD_SECONDS"] and now - reload["last"] >= cfg["CONFIG_RELOAD_SECONDS"]:
+			reload["last"] = now
+			new_targets = reload_config(app, cfg, logger, mailer)
+			if new_targets is not None:
+				# 分片数不变，一致性哈希保证已有目标仍由原工作进程探测
+				store.prune(new_targets)
+				supervisor.reconfigure(cfg, split_targets(new_targets, len(shards)))
+				logger.info("目标列表已更新: 共 {} 个目标（各分片 {}）".format(
+					len(new_targets), "/".join(str(len(shard)) for shard in supervisor.shards)))
+		store.maybe_flush()
+		if history:
+			history.maybe_flush()
+
+	supervisor.start()
+	try:
+		supervisor.run(handlers, on_tick)
+	finally:
+		# 退出时忽略重复的中断信号，保证工作进程发回的剩余结果与状态都能写盘
+		previous_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+		try:
+			supervisor.stop(handlers)
+			store.close()
+			if history:
+				history.close()
+		finally:
+			signal.signal(signal.SIGINT, previous_handler)
+
+
+def config_keys():
+	"""网站监控程序的配置项定义。
+	
+	返回: (必需配置项列表, 可选配置项及默认值, 类型转换规则)
+	"""
+	## ========按具体业务代码需求定义配置项=============
+	# 定义网站监控程序必需的配置项
+	required_keys = [
+		"CHECK_INTERVAL_SECONDS", 
+		"SMTP_HOST",
+		"SMTP_PORT",
+		"SMTP_USERNAME",
+		"SMTP_PASSWORD",
+		"MAIL_FROM",
+		"MAIL_TO",
+		"REQUEST_TIMEOUT_SECONDS",
+		"LOG_RETENTION_DAYS",
+		"SMTP_USE_TLS",  # 是否启用TLS，避免后续发送邮件时报 KeyError
+	]
+	
+	# 定义可选配置项及默认值
+	# TARGET_URL 为单目标模式；配置 TARGET_URLS 或 TARGETS_FILE 时进入多目标模式
+	optional_keys = {
+		"TARGET_URL": None,
+		"TARGET_URLS": None,
+		"TARGETS_FILE": None,
+		"PROBE_CONCURRENCY": 200,
+		"POOL_SIZE_PER_HOST": 4,
+		"POOL_IDLE_TIMEOUT_SECONDS": 120,
+		"COLD_CONNECT_SAMPLE_RATE": 0.0,
+		"PROBE_METHOD": DEFAULT_PROBE_METHOD,
+		"STREAM_READ_BYTES": 0,
+		"SCHEDULE_JITTER_SECONDS": None,
+		"ALERT_QUEUE_SIZE": 1000,
+		"ALERT_COALESCE_SECONDS": 5,
+		"ALERT_MAX_RETRIES": 3,
+		"SMTP_IDLE_TIMEOUT_SECONDS": 60,
+		"STATE_FLUSH_INTERVAL_SECONDS": 30,
+		"HISTORY_ENABLED": True,
+		"HISTORY_RETENTION_DAYS": 365,
+		"HISTORY_RAW_DAYS": 30,
+		"DEGRADED_THRESHOLDS_MS": "",
+		"DNS_CACHE_ENABLED": True,
+		"DNS_CACHE_TTL_SECONDS": 300,
+		"DNS_NEGATIVE_TTL_SECONDS": 30,
+		"DNS_STALE_SECONDS": 300,
+		"DNS_CACHE_MAX_ENTRIES": 10000,
+		"DNS_NAMESERVERS": None,
+		"METRICS_PORT": None,
+		"METRICS_HOST": "127.0.0.1",
+		"LOG_JSON": False,
+		"LOG_SAMPLE_SUCCESS_EVERY": 1,
+		"LOG_MAX_TOTAL_MB": 0,
+		"LOG_COMPRESS": False,
+		"LOG_CLEANUP_INTERVAL_SECONDS": 3600,
+		"ADAPTIVE_INTERVAL": False,
+		"ADAPTIVE_MIN_INTERVAL_SECONDS": 10,
+		"ADAPTIVE_MAX_INTERVAL_SECONDS": 600,
+		"ADAPTIVE_STABLE_CHECKS": 5,
+		"ALERT_CONFIRM_FAILURES": 2,
+		"ALERT_CONFIRM_WINDOW": 3,
+		"ALERT_RECOVER_SUCCESSES": 2,
+		"CONFIRM_RETRIES": 2,
+		"CONFIRM_TIMEOUT_SECONDS": 5,
+		"FLAP_WINDOW_SECONDS": 3600,
+		"FLAP_THRESHOLD": 4,
+		"SHARD_WORKERS": 0,
+		"CLUSTER_DIR": None,
+		"CLUSTER_NODE_ID": None,
+		"CLUSTER_REPLICAS": 3,
+		"CLUSTER_QUORUM": 2,
+		"CLUSTER_NODE_TTL_SECONDS": 30,
+		"CLUSTER_RESULT_MAX_AGE_SECONDS": None,
+		"CLUSTER_SYNC_SECONDS": 5,
+		"CONFIG_RELOAD_SECONDS": 5,
+		"CONTENT_SCAN_BYTES": 1024 * 1024,
+		"HOST_RATE_PER_SECOND": 0.0,
+		"HOST_BURST": 0,
+		"HOST_MAX_CONNECTIONS": 0,
+		"PROBE_HTTP2": False,
+		"TLS_CA_FILE": None,
+		"CERT_EXPIRY_WARN_DAYS": "30,14,7,3,1",
+	}
+	
+	## ========按具体业务代码需求定义类型转换规则=============
+	# 定义类型转换规则
+	type_conversions = {
+		"CHECK_INTERVAL_SECONDS": "int",
+		"SMTP_PORT": "int", 
+		"REQUEST_TIMEOUT_SECONDS": "int",
+		"LOG_RETENTION_DAYS": "int",
+		"SMTP_USE_TLS": "bool",
+		"PROBE_CONCURRENCY": "int",
+		"POOL_SIZE_PER_HOST": "int",
+		"POOL_IDLE_TIMEOUT_SECONDS": "int",
+		"COLD_CONNECT_SAMPLE_RATE": "float",
+		"STREAM_READ_BYTES": "int",
+		"SCHEDULE_JITTER_SECONDS": "int",
+		"ALERT_QUEUE_SIZE": "int",
+		"ALERT_COALESCE_SECONDS": "int",
+		"ALERT_MAX_RETRIES": "int",
+		"SMTP_IDLE_TIMEOUT_SECONDS": "int",
+		"STATE_FLUSH_INTERVAL_SECONDS": "int",
+		"HISTORY_ENABLED": "bool",
+		"HISTORY_RETENTION_DAYS": "int",
+		"HISTORY_RAW_DAYS": "int",
+		"DNS_CACHE_ENABLED": "bool",
+		"DNS_CACHE_TTL_SECONDS": "int",
+		"DNS_NEGATIVE_TTL_SECONDS": "int",
+		"DNS_STALE_SECONDS": "int",
+		"DNS_CACHE_MAX_ENTRIES": "int",
+		"METRICS_PORT": "int",
+		"LOG_JSON": "bool",
+		"LOG_SAMPLE_SUCCESS_EVERY": "int",
+		"LOG_MAX_TOTAL_MB": "int",
+		"LOG_COMPRESS": "bool",
+		"LOG_CLEANUP_INTERVAL_SECONDS": "int",
+		"ADAPTIVE_INTERVAL": "bool",
+		"ADAPTIVE_MIN_INTERVAL_SECONDS": "int",
+		"ADAPTIVE_MAX_INTERVAL_SECONDS": "int",
+		"ADAPTIVE_STABLE_CHECKS": "int",
+		"ALERT_CONFIRM_FAILURES": "int",
+		"ALERT_CONFIRM_WINDOW": "int",
+		"ALERT_RECOVER_SUCCESSES": "int",
+		"CONFIRM_RETRIES": "int",
+		"CONFIRM_TIMEOUT_SECONDS": "int",
+		"FLAP_WINDOW_SECONDS": "int",
+		"FLAP_THRESHOLD": "int",
+		"SHARD_WORKERS": "int",
+		"CLUSTER_REPLICAS": "int",
+		"CLUSTER_QUORUM": "int",
+		"CLUSTER_NODE_TTL_SECONDS": "int",
+		"CLUSTER_RESULT_MAX_AGE_SECONDS": "int",
+		"CLUSTER_SYNC_SECONDS": "int",
+		"CONFIG_RELOAD_SECONDS": "int",
+		"CONTENT_SCAN_BYTES": "int",
+		"HOST_RATE_PER_SECOND": "float",
+		"HOST_BURST": "int",
+		"HOST_MAX_CONNECTIONS": "int",
+		"PROBE_HTTP2": "bool",
+	}
+	return required_keys, optional_keys, type_conversions
+
+
+def prepare_config(app, cfg):
+	"""对加载后的配置做特殊处理与校验，配置无效时抛出 ValueError。
+	
+	返回: 多目标模式的目标字典 {url: 选项}，单目标模式为空字典
+	"""
+	# 特殊处理：如果MAIL_FROM为空，使用SMTP_USERNAME
+	if not cfg.get("MAIL_FROM") and cfg.get("SMTP_USERNAME"):
+		cfg["MAIL_FROM"] = cfg["SMTP_USERNAME"]
+	
+	cfg["PROBE_METHOD"] = cfg["PROBE_METHOD"].lower()
+	if cfg["PROBE_METHOD"] not in PROBE_METHODS:
+		raise ValueError("PROBE_METHOD 无效: {}，可选: {}".format(cfg["PROBE_METHOD"], ", ".join(PROBE_METHODS)))
+	
+	cfg["DEGRADED_THRESHOLDS"] = parse_thresholds(cfg["DEGRADED_THRESHOLDS_MS"])
+	if cfg["TLS_CA_FILE"]:
+		# 相对路径基于项目根目录
+		ca_path = Path(cfg["TLS_CA_FILE"])
+		ca_path = ca_path if ca_path.is_absolute() else app.root / ca_path
+		if not ca_path.is_file():
+			raise ValueError("TLS_CA_FILE 不存在: {}".format(ca_path))
+		cfg["TLS_CA_FILE"] = str(ca_path)
+	cfg["CERT_WARN_DAYS"] = parse_warn_days(cfg["CERT_EXPIRY_WARN_DAYS"])
+	if not 1 <= cfg["ALERT_CONFIRM_FAILURES"] <= cfg["ALERT_CONFIRM_WINDOW"]:
+		raise ValueError("ALERT_CONFIRM_FAILURES 需在 1 到 ALERT_CONFIRM_WINDOW 之间")
+	
+	targets = load_targets(app, cfg)
+	if not targets and not cfg.get("TARGET_URL"):
+		raise ValueError("未配置监控目标，请设置 TARGET_URL、TARGET_URLS 或 TARGETS_FILE")
+	if not targets:
+		parse_target_line(cfg["TARGET_URL"])
+	if cfg["CLUSTER_DIR"]:
+		from src.cluster import validate as validate_cluster
+
+		cfg["CLUSTER_NODE_ID"] = cfg["CLUSTER_NODE_ID"] or socket.gethostname()
+		validate_cluster(cfg["CLUSTER_NODE_ID"], cfg["CLUSTER_REPLICAS"], cfg["CLUSTER_QUORUM"])
+	return targets
+
 ## ========end 业务代码 =============
 
 
-def main() -> None:
+def parse_args(argv=None):
+	"""解析命令行参数。"""
+	parser = argparse.ArgumentParser(description="网站可达性监控")
+	parser.add_argument("--once", action="store_true",
+		help="所有目标并发检查一次（含确认复查）、更新状态并发出告警后退出，供 cron 等定时调度使用")
+	return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+	"""程序入口，返回退出码：0 正常；1 配置错误或已有实例在运行；--once 时有目标确认不可达返回 2。"""
+	args = parse_args(argv)
+	exit_code = 0
 	# 创建基础应用实例
 	app = BaseApp("check-web-alive")
 	
@@ -118,169 +1525,62 @@ def main() -> None:
 	
 	try:
 		# 设置日志系统（在配置加载之前，用于记录配置错误）
-		logger = app.setup_logging()
+		# 保留天数在加载配置后由 start_log_retention 生效，这里不做启动清理
+		logger = app.setup_logging(retention_days=None)
 		
 		# 加载配置
 		try:
-			## ========按具体业务代码需求定义配置项=============
-			# 定义网站监控程序必需的配置项
-			required_keys = [
-				"TARGET_URL",
-				"CHECK_INTERVAL_SECONDS", 
-				"SMTP_HOST",
-				"SMTP_PORT",
-				"SMTP_USERNAME",
-				"SMTP_PASSWORD",
-				"MAIL_FROM",
-				"MAIL_TO",
-				"REQUEST_TIMEOUT_SECONDS",
-				"LOG_RETENTION_DAYS",
-				"SMTP_USE_TLS",  # 是否启用TLS，避免后续发送邮件时报 KeyError
-			]
-			
-			## ========按具体业务代码需求定义类型转换规则=============
-			# 定义类型转换规则
-			type_conversions = {
-				"CHECK_INTERVAL_SECONDS": "int",
-				"SMTP_PORT": "int", 
-				"REQUEST_TIMEOUT_SECONDS": "int",
-				"LOG_RETENTION_DAYS": "int",
-				"SMTP_USE_TLS": "bool"
-			}
-			
-			cfg = app.load_config(required_keys=required_keys, type_conversions=type_conversions)
-			
-			# 特殊处理：如果MAIL_FROM为空，使用SMTP_USERNAME
-			if not cfg.get("MAIL_FROM") and cfg.get("SMTP_USERNAME"):
-				cfg["MAIL_FROM"] = cfg["SMTP_USERNAME"]
+			required_keys, optional_keys, type_conversions = config_keys()
+			cfg = app.load_config(required_keys=required_keys, type_conversions=type_conversions, optional_keys=optional_keys)
+			targets = prepare_config(app, cfg)
+			if cfg["LOG_JSON"]:
+				app.set_log_json(True)
+			if cfg["CLUSTER_DIR"] and not targets:
+				logger.warning("多节点协同仅在多目标模式（TARGET_URLS/TARGETS_FILE）下生效，单目标模式忽略 CLUSTER_DIR")
 				
 		except (FileNotFoundError, ValueError) as config_error:
 			logger.error("配置加载失败: {}".format(config_error))
 			print("配置加载失败: {}".format(config_error))
 			sys.exit(1)
 		
-		## ========begin 业务代码 =============
-		# 创建 rundata 目录（如果不存在）
-		rundata_dir = app.root / "rundata"
-		rundata_dir.mkdir(exist_ok=True)
-		
-		# 读取上次状态
-		state_file = rundata_dir / "state.json"
-		last_ok, first_ng_ts, first_ok_ts, last_update_ts, last_alert_ts = read_state(state_file)
-
-		url = cfg["TARGET_URL"]
-		interval = cfg["CHECK_INTERVAL_SECONDS"]
-		request_timeout = cfg["REQUEST_TIMEOUT_SECONDS"]
-		# 异常持续超过20分钟（1200秒）后再次发送邮件
-		ALERT_INTERVAL_SECONDS = 20 * 60
+		# 按配置的保留天数与总大小在后台定期清理日志
+		app.start_log_retention(
+			cfg["LOG_RETENTION_DAYS"],
+			max_total_bytes=cfg["LOG_MAX_TOTAL_MB"] * 1024 * 1024,
+			compress=cfg["LOG_COMPRESS"],
+			interval=cfg["LOG_CLEANUP_INTERVAL_SECONDS"],
+		)
 		
-		logger.info("监控启动: {}，检查间隔: {}s，日志保留: {}天".format(url, interval, cfg['LOG_RETENTION_DAYS']))
-		logger.info("进程ID: {}".format(os.getpid()))
-
-		while True:
-			ok, status_code, error_msg = check_url(url, request_timeout)
-			status_text = "{}".format(status_code) if status_code is not None else "EXCEPTION"
-			current_time = int(time.time())
-			
-			# 记录检查结果到日志
-			logger.info("检查结果 - URL: {}, 状态: {}, 可达: {}".format(url, status_text, ok))
-			if error_msg:
-				logger.warning("请求异常: {}".format(error_msg))
-
-			# 1. 如果状态从异常恢复为正常，发送恢复通知
-			if ok is True and last_ok is False:
-				try:
-					# 计算异常持续时间
-					duration_minutes = 0
-					if first_ng_ts:
-						duration_seconds = current_time - first_ng_ts
-						duration_minutes = duration_seconds // 60
-					
-					subject = "axure网站已恢复正常"
-					content = (
-						"axure网站已恢复正常\n\n"
-						"URL: {}\n"
-						"状态: {}\n"
-						"异常持续时间: {} 分钟\n"
-						"恢复时间: {}\n"
-					).format(
-						url, 
-						status_text, 
-						duration_minutes,
-						time.strftime('%Y-%m-%d %H:%M:%S')
-					)
-					mail_sent = app.send_mail(cfg, subject, content)
-					if mail_sent:
-						logger.info("已发送恢复通知邮件")
-						last_alert_ts = current_time  # 记录发送恢复通知的时间
-				except Exception as mail_exc:
-					logger.error("发送邮件失败: {}".format(mail_exc))
-			
-			# 2. 如果状态从正常变为异常，发送首次告警
-			elif ok is False and (last_ok is True or last_ok is None):
-				try:
-					subject = "axure网站挂了"
-					content = (
-						"axure网站挂了\n\n"
-						"URL: {}\n"
-						"状态: {}\n"
-						"错误: {}\n"
-						"时间: {}\n"
-					).format(url, status_text, error_msg or '', time.strftime('%Y-%m-%d %H:%M:%S'))
-					mail_sent = app.send_mail(cfg, subject, content)
-					if mail_sent:
-						logger.info("已发送告警邮件")
-						last_alert_ts = current_time  # 记录发送首次告警的时间
-				except Exception as mail_exc:
-					logger.error("发送邮件失败: {}".format(mail_exc))
-			
-			# 3. 如果持续异常，且距离上次发送告警时间超过20分钟，再次发送统计邮件
-			elif ok is False and last_ok is False:
-				# 计算距离最早异常时间
-				if first_ng_ts:
-					elapsed_seconds = current_time - first_ng_ts
-					# 如果异常持续时间超过20分钟，且距离上次发送告警超过20分钟
-					if elapsed_seconds >= ALERT_INTERVAL_SECONDS:
-						# 检查距离上次发送告警的时间
-						time_since_last_alert = current_time - last_alert_ts if last_alert_ts else elapsed_seconds
-						if time_since_last_alert >= ALERT_INTERVAL_SECONDS:
-							try:
-								duration_minutes = elapsed_seconds // 60
-								subject = "axure网站持续异常"
-								content = (
-									"axure网站持续异常\n\n"
-									"URL: {}\n"
-									"状态: {}\n"
-									"错误: {}\n"
-									"异常持续时间: {} 分钟\n"
-									"统计时间: {}\n"
-								).format(
-									url, 
-									status_text, 
-									error_msg or '',
-									duration_minutes,
-									time.strftime('%Y-%m-%d %H:%M:%S')
-								)
-								mail_sent = app.send_mail(cfg, subject, content)
-								if mail_sent:
-									logger.info("已发送持续异常统计邮件（异常持续 {} 分钟）".format(duration_minutes))
-									last_alert_ts = current_time  # 记录发送统计邮件的时间
-							except Exception as mail_exc:
-								logger.error("发送邮件失败: {}".format(mail_exc))
-
-			# 记录最新状态（无论是否变化都更新 last_update_ts）
-			state_changed = (last_ok is None or last_ok != ok)
-			if state_changed:
-				write_state(state_file, ok, first_ng_ts, first_ok_ts, last_alert_ts)
-				logger.info("状态变更: {} -> {}".format(last_ok, ok))
-				# 重新读取状态以获取更新后的时间戳
-				last_ok, first_ng_ts, first_ok_ts, last_update_ts, last_alert_ts = read_state(state_file)
+		## ========begin 业务代码 =============
+		# 告警邮件由后台线程发送，检查节奏不受邮件服务器影响
+		mailer = MailDispatcher(
+			app, cfg,
+			queue_size=cfg["ALERT_QUEUE_SIZE"],
+			coalesce_seconds=cfg["ALERT_COALESCE_SECONDS"],
+			max_retries=cfg["ALERT_MAX_RETRIES"],
+			idle_timeout=cfg["SMTP_IDLE_TIMEOUT_SECONDS"],
+		).start()
+		# 单次运行不启动指标端点，也不使用分片：一个事件循环即可并发检查全部目标
+		if cfg["METRICS_PORT"] is not None and not args.once:
+			register_mail_metrics(app.start_metrics_server(cfg["METRICS_PORT"], cfg["METRICS_HOST"]), mailer)
+		if args.once and targets and cfg["SHARD_WORKERS"] > 1:
+			logger.info("单次运行忽略 SHARD_WORKERS，在本进程内并发检查全部目标")
+		try:
+			if args.once:
+				if targets:
+					down = run_multi_target(app, cfg, logger, mailer, targets, once=True)
+				else:
+					down = run_single_target(app, cfg, logger, mailer, once=True)
+				exit_code = 2 if down else 0
+			elif targets and cfg["SHARD_WORKERS"] > 1:
+				run_sharded(app, cfg, logger, mailer, targets)
+			elif targets:
+				run_multi_target(app, cfg, logger, mailer, targets)
 			else:
-				# 即使状态未变化，也更新 last_update_ts 和 last_alert_ts
-				write_state(state_file, ok, first_ng_ts, first_ok_ts, last_alert_ts)
-				last_update_ts = current_time
-
-			time.sleep(interval)
+				run_single_target(app, cfg, logger, mailer)
+		finally:
+			mailer.close()
+			app.stop_metrics_server()
 		## ========end 业务代码 =============
 	
 	except KeyboardInterrupt:
@@ -292,9 +1592,12 @@ def main() -> None:
 		# 清理锁文件
 		app.release_single_instance_lock()
 		logger.info("程序已退出，锁文件已清理")
+		app.stop_logging()
+	return exit_code
 
 
 if __name__ == "__main__":
-	main()
-
-
+	# 分片工作进程以 spawn 方式启动，打包为可执行文件时需要
+	import multiprocessing
+	multiprocessing.freeze_support()
+	sys.exit(main())
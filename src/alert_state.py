@@ -0,0 +1,131 @@
+"""
+告警状态机模块
+每个目标的确认状态（可达/不可达）由最近若干次探测结果共同决定，过滤偶发失败，并识别频繁抖动
+"""
+from collections import deque
+
+
+class Verdict:
+    """一次探测结果经状态机判断后的结论。"""
+
+    __slots__ = ("ok", "changed", "pending", "count", "needed", "since", "retry", "flapping", "flap")
+
+    def __init__(self, ok, changed=False, pending=False, count=0, needed=0, since=None, retry=False,
+                 flapping=False, flap=None):
+        self.ok = ok  # 确认后的状态：True 可达，False 不可达，None 尚未确认
+        self.changed = changed  # 确认状态是否在本次发生变化
+        self.pending = pending  # 本次结果与确认状态不一致，尚待确认
+        self.count = count  # 待确认方向已累计的次数
+        self.needed = needed  # 确认所需的次数
+        self.since = since  # 待确认（或刚确认）的变化最早出现的时间
+        self.retry = retry  # 是否应立即复查以尽快确认
+        self.flapping = flapping  # 是否处于频繁抖动中
+        self.flap = flap  # 抖动事件："start" 开始，"end" 结束，None 无
+
+
+class _Target:
+    """一个目标的状态机状态。目标数可达十万级，不为每个目标创建 deque 等容器：
+    最近的探测结果按位保存在整数中，抖动窗口的变化时间在首次确认变化时才创建。"""
+
+    __slots__ = ("confirmed", "failures", "successes", "since", "retries", "transitions", "flapping")
+
+    def __init__(self, confirmed):
+        self.confirmed = confirmed
+        self.failures = 0  # 最近 confirm_window 次探测结果，最低位为最近一次，失败为1
+        self.successes = 0  # 连续可达次数
+        self.since = None
+        self.retries = 0  # 本轮待确认已立即复查的次数
+        self.transitions = None  # 抖动窗口内确认状态变化的时间（deque），尚无变化时为 None
+        self.flapping = False
+
+
+class AlertStateMachine:
+    """按目标维护确认状态。
+
+    - 可达 -> 不可达：最近 confirm_window 次中至少 confirm_failures 次失败
+    - 不可达 -> 可达：连续 recover_successes 次可达（与上面的阈值不同，形成回差，避免在临界状态来回切换）
+    - 待确认期间建议立即复查（每轮最多 confirm_retries 次），不必等下一个检查周期
+    - flap_window 秒内确认状态变化达到 flap_threshold 次视为抖动（flap_threshold 为0时不检测），
+      抖动期间由调用方暂停单次告警；flap_window 秒内不再变化时抖动结束
+    """
+
+    def __init__(self, confirm_failures=2, confirm_window=3, recover_successes=2, confirm_retries=2,
+                 flap_window=3600, flap_threshold=4):
+        if confirm_failures < 1 or confirm_window < confirm_failures:
+            raise ValueError("告警确认次数无效: 需要 1 <= {} <= {}".format(confirm_failures, confirm_window))
+        self.confirm_failures = confirm_failures
+        self.confirm_window = confirm_window
+        self.recover_successes = max(1, recover_successes)
+        self.confirm_retries = confirm_retries
+        self.flap_window = flap_window
+        self.flap_threshold = flap_threshold
+        self._window_mask = (1 << confirm_window) - 1
+        self._targets = {}
+
+    def observe(self, key, ok, now, confirmed=None):
+        """记录一次探测结果，返回 Verdict。
+
+        confirmed 为该目标已保存的确认状态（如从状态文件读取），仅在首次见到该目标时使用。
+        """
+        target = self._targets.get(key)
+        if target is None:
+            target = self._targets[key] = _Target(confirmed)
+        target.failures = ((target.failures << 1) | (0 if ok else 1)) & self._window_mask
+        target.successes = target.successes + 1 if ok else 0
+
+        flap = self._expire_flapping(target, now)
+        previous = target.confirmed
+        if ok:
+            count, needed = target.successes, (1 if previous is None else self.recover_successes)
+        else:
+            count, needed = bin(target.failures).count("1"), self.confirm_failures
+
+        if ok == previous:
+            target.since = None
+            target.retries = 0
+            return Verdict(previous, flapping=target.flapping, flap=flap)
+        if target.since is None:
+            target.since = now
+        if count < needed:
+            retry = target.retries < self.confirm_retries
+            if retry:
+                target.retries += 1
+            return Verdict(previous, pending=True, count=count, needed=needed, since=target.since, retry=retry,
+                           flapping=target.flapping, flap=flap)
+
+        # 确认状态变化
+        since = target.since
+        target.confirmed = ok
+        target.since = None
+        target.retries = 0
+        target.failures = 0 if ok else 1
+        if previous is not None and self.flap_threshold:
+            if target.transitions is None:
+                target.transitions = deque()
+            target.transitions.append(now)
+            while target.transitions and now - target.transitions[0] > self.flap_window:
+                target.transitions.popleft()
+            if not target.flapping and len(target.transitions) >= self.flap_threshold:
+                target.flapping = True
+                flap = "start"
+        return Verdict(ok, changed=True, count=count, needed=needed, since=since,
+                       flapping=target.flapping, flap=flap)
+
+    def transitions(self, key):
+        """抖动窗口内确认状态变化的次数。"""
+        target = self._targets.get(key)
+        return len(target.transitions) if target and target.transitions else 0
+
+    def is_flapping(self, key):
+        target = self._targets.get(key)
+        return bool(target and target.flapping)
+
+    def forget(self, key):
+        self._targets.pop(key, None)
+
+    def _expire_flapping(self, target, now):
+        if target.flapping and target.transitions and now - target.transitions[-1] >= self.flap_window:
+            target.flapping = False
+            target.transitions = None
+            return "end"
+        return None
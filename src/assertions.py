@@ -0,0 +1,181 @@
+"""
+内容断言模块
+按目标检查响应内容：响应体中的文本/正则、JSON 字段值、响应头与响应体大小上限，
+避免把返回 200 的错误页、CDN 占位页当作可达。响应体边读边匹配，断言有结论即停止读取，不缓存完整响应体
+"""
+import json
+import re
+
+
+# 目标选项中的断言项（见 check-web-alive.py 的 TARGET_OPTIONS）
+ASSERTION_OPTIONS = ("contains", "regex", "json", "header", "max_bytes")
+
+# 文本、正则与 JSON 断言最多检查的响应体字节数
+DEFAULT_SCAN_BYTES = 1024 * 1024
+
+# 正则每次只从新读到的一块前这么多字节处开始查找，跨块且长于该值的匹配可能检查不到
+REGEX_OVERLAP = 4096
+
+
+class ContentAssertions:
+    """一个目标的内容断言，创建时编译正则，之后每次探测复用。
+
+    - contains: 响应体包含该文本（UTF-8）
+    - regex: 响应体匹配该正则（按字节匹配）
+    - json: "a.b.0.c=值" 字段等于该值（字符串直接比较，其他类型按 JSON 文本比较）；不带 "=值" 时只要求字段存在且不为 null
+    - header: "名称:值" 响应头包含该值（不区分大小写）；不带 ":值" 时只要求响应头存在
+    - max_bytes: 响应体不超过该字节数
+    文本、正则与 JSON 只检查前 scan_bytes 字节，JSON 响应体超过该大小时视为不通过。
+    正则边读边查找，跨越读取块边界的匹配长度不超过 REGEX_OVERLAP 字节时才能保证匹配到。
+    """
+
+    __slots__ = ("contains", "regex", "json_path", "json_value", "header_name", "header_value", "max_bytes",
+                 "scan_bytes")
+
+    def __init__(self, contains=None, regex=None, json_expr=None, header=None, max_bytes=None,
+                 scan_bytes=DEFAULT_SCAN_BYTES):
+        self.contains = contains.encode("utf-8") if contains else None
+        try:
+            self.regex = re.compile(regex.encode("utf-8")) if regex else None
+        except re.error as exc:
+            raise ValueError("正则表达式无效: {}（{}）".format(regex, exc))
+        self.json_path, self.json_value = _parse_json_expr(json_expr) if json_expr else (None, None)
+        self.header_name, self.header_value = None, None
+        if header:
+            name, sep, value = header.partition(":")
+            if not name.strip():
+                raise ValueError("响应头断言无效: {}".format(header))
+            self.header_name = name.strip().lower()
+            self.header_value = value.strip().lower() if sep else None
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("响应体大小上限无效: {}".format(max_bytes))
+        self.max_bytes = max_bytes
+        self.scan_bytes = max(1, scan_bytes)
+
+    @classmethod
+    def from_options(cls, options, scan_bytes=DEFAULT_SCAN_BYTES):
+        """按目标选项创建，没有断言项时返回 None；断言无效时抛出 ValueError。"""
+        if not any(key in options for key in ASSERTION_OPTIONS):
+            return None
+        return cls(options.get("contains"), options.get("regex"), options.get("json"), options.get("header"),
+                   options.get("max_bytes"), scan_bytes)
+
+    @property
+    def needs_body(self):
+        """是否需要读取响应体（只检查响应头时 HEAD 等探测方式仍然可用）。"""
+        return bool(self.contains or self.regex or self.json_path is not None or self.max_bytes is not None)
+
+    def check_headers(self, headers):
+        """检查响应头（headers.get 按小写名称取值），返回失败原因，通过时返回 None。"""
+        if self.header_name is not None:
+            value = headers.get(self.header_name)
+            if value is None:
+                return "缺少响应头 {}".format(self.header_name)
+            if self.header_value is not None and self.header_value not in value.lower():
+                return "响应头 {} 不包含 {}: {}".format(self.header_name, self.header_value, value)
+        if self.max_bytes is not None:
+            # 响应头已声明长度时不必读取响应体即可判断
+            try:
+                length = int(headers.get("content-length", ""))
+            except ValueError:
+                length = None
+            if length is not None and length > self.max_bytes:
+                return "响应体 {} 字节，超过上限 {} 字节".format(length, self.max_bytes)
+        return None
+
+    def matcher(self):
+        return BodyMatcher(self)
+
+
+class BodyMatcher:
+    """一次探测的流式匹配：feed() 逐块输入响应体，返回 True 表示已有结论、无需继续读取；读完后 finish() 给出结果。"""
+
+    __slots__ = ("assertions", "size", "limit", "error", "_found", "_matched", "_tail", "_buffer")
+
+    def __init__(self, assertions):
+        self.assertions = assertions
+        self.size = 0
+        # 最多读取的字节数：检查大小上限时多读1字节以判断是否超过
+        self.limit = assertions.scan_bytes
+        if assertions.max_bytes is not None:
+            self.limit = max(self.limit, assertions.max_bytes + 1)
+        if assertions.json_path is not None:
+            # JSON 同样多读1字节，以区分恰好 scan_bytes 字节的响应体与被截断的响应体
+            self.limit = max(self.limit, assertions.scan_bytes + 1)
+        self.error = None
+        self._found = assertions.contains is None
+        self._matched = assertions.regex is None
+        self._tail = b""  # 上一块末尾可能与下一块拼成 contains 的部分
+        need_buffer = assertions.regex is not None or assertions.json_path is not None
+        self._buffer = bytearray() if need_buffer else None
+
+    def feed(self, chunk):
+        assertions = self.assertions
+        start = self.size
+        self.size += len(chunk)
+        if assertions.max_bytes is not None and self.size > assertions.max_bytes:
+            self.error = "响应体超过上限 {} 字节".format(assertions.max_bytes)
+            return True
+        if start < assertions.scan_bytes:
+            chunk = chunk[:assertions.scan_bytes - start]
+            if not self._found:
+                window = self._tail + chunk
+                if assertions.contains in window:
+                    self._found = True
+                    self._tail = b""
+                else:
+                    self._tail = window[max(0, len(window) - len(assertions.contains) + 1):]
+            if self._buffer is not None:
+                self._buffer += chunk
+                # 只查找新的一块及其前 REGEX_OVERLAP 字节，避免每块都重新查找整个缓冲区
+                if not self._matched and assertions.regex.search(self._buffer, max(0, start - REGEX_OVERLAP)):
+                    self._matched = True
+        # 大小上限与 JSON 需要读完整个响应体
+        return (self._found and self._matched and assertions.max_bytes is None
+                and assertions.json_path is None) or self.size >= self.limit
+
+    def finish(self):
+        """返回失败原因，全部通过时返回 None。"""
+        if self.error:
+            return self.error
+        assertions = self.assertions
+        scanned = min(self.size, assertions.scan_bytes)
+        if not self._found:
+            return "响应内容不包含 {}（已检查 {} 字节）".format(
+                assertions.contains.decode("utf-8"), scanned)
+        if not self._matched:
+            return "响应内容不匹配正则 {}（已检查 {} 字节）".format(
+                assertions.regex.pattern.decode("utf-8"), scanned)
+        if assertions.json_path is not None:
+            if self.size > assertions.scan_bytes:
+                return "响应体达到 {} 字节，未检查 JSON".format(assertions.scan_bytes)
+            return _check_json(self._buffer, assertions.json_path, assertions.json_value)
+        return None
+
+
+def _parse_json_expr(expr):
+    """解析 "a.b.0.c=值"，返回 (字段路径列表, 期望值或None)。"""
+    path, sep, expected = expr.partition("=")
+    keys = path.strip().split(".")
+    if not all(keys):
+        raise ValueError("JSON 断言无效: {}".format(expr))
+    return keys, (expected if sep else None)
+
+
+def _check_json(body, path, expected):
+    try:
+        value = json.loads(bytes(body).decode("utf-8"))
+    except ValueError:
+        return "响应内容不是有效的 JSON"
+    name = ".".join(path)
+    for key in path:
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            return "JSON 中没有字段 {}".format(name)
+    if expected is None:
+        return None if value is not None else "JSON 字段 {} 为 null".format(name)
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    if text != expected:
+        return "JSON 字段 {} 为 {}，期望 {}".format(name, text, expected)
+    return None
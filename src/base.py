@@ -5,12 +5,9 @@
 import os
 import sys
 import json
+import atexit
 import time
-import ssl
-import smtplib
 import logging
-from datetime import datetime, timedelta
-from email.message import EmailMessage
 from pathlib import Path
 try:
     from typing import Optional, Tuple, Dict, Any
@@ -29,9 +26,10 @@ else:
     import fcntl
 
 try:
-    from dotenv import load_dotenv
+    from dotenv import load_dotenv, dotenv_values
 except ImportError:
     load_dotenv = None  # 允许在未安装dotenv时继续运行（使用系统环境变量）
+    dotenv_values = None
 
 
 # 全局锁句柄（Windows: mutex 句柄；Unix: 文件句柄）
@@ -53,6 +51,18 @@ class BaseApp:
         """
         self.app_name = app_name
         self.logger = None  # logger 实例，在 setup_logging 时设置
+        self.metrics = None  # 指标注册表，在 start_metrics_server 时创建
+        self._log_pipeline = None
+        self._log_file_handler = None
+        self._log_dir = None
+        self._log_retention = None
+        self._metrics_server = None
+        self.config_file = None  # 最近一次 load_config 使用的配置文件
+        self._config_args = None  # 最近一次 load_config 的配置项定义，reload_config 沿用
+        self._preset_env = None  # 首次加载配置前已存在的环境变量（优先于配置文件，重新加载时不覆盖）
+        self._file_keys = set()  # 由配置文件设置的环境变量
+        self._config_seen = None  # 上次轮询时各文件的 (mtime_ns, 大小)
+        self._config_applied = None  # 最近一次生效的配置对应的各文件 (mtime_ns, 大小)
         
         # 兼容 PyInstaller 打包后的路径问题
         if root_path is None:
@@ -150,13 +160,14 @@ class BaseApp:
         except Exception:
             pass
 
-    def load_config(self, config_file=None, required_keys=None, type_conversions=None):
+    def load_config(self, config_file=None, required_keys=None, type_conversions=None, optional_keys=None):
         """加载配置，优先读取 .my-env 文件，其次读取 .env 文件，最后读取系统环境变量。
         
         Args:
             config_file: 配置文件路径，如果为None则自动选择 .my-env 或 .env
             required_keys: 必需的配置项列表，如果为None则不检查
-            type_conversions: 类型转换字典，格式为 {"key": "int|bool|str"}
+            type_conversions: 类型转换字典，格式为 {"key": "int|float|bool|str"}
+            optional_keys: 可选配置项字典，格式为 {"key": 默认值}，未配置时使用默认值
         """
         
         # 如果未指定配置文件，则优先查找 .my-env，其次查找 .env
@@ -202,33 +213,40 @@ class BaseApp:
             raise FileNotFoundError(error_msg)
             
         # 加载配置文件
+        if self._preset_env is None:
+            self._preset_env = set(os.environ)
+        self.config_file = config_file
+        self._config_args = (required_keys, type_conversions, optional_keys)
         if load_dotenv and config_file.exists():
             load_dotenv(config_file)
+            self._file_keys = {key for key in dotenv_values(config_file) if key not in self._preset_env}
         
         config = {}
         missing_keys = []
         
-        # 如果指定了必需配置项，则进行检查
-        if required_keys:
-            for key in required_keys:
+        # 如果指定了必需/可选配置项，则进行检查
+        if required_keys or optional_keys:
+            for key in required_keys or []:
                 env_value = os.getenv(key)
                 if env_value is None or env_value.strip() == "":
                     missing_keys.append(key)
                 else:
                     # 根据类型转换字典进行转换
-                    if type_conversions and key in type_conversions:
-                        target_type = type_conversions[key]
-                        try:
-                            if target_type == "int":
-                                config[key] = int(env_value)
-                            elif target_type == "bool":
-                                config[key] = env_value.lower() in {"1", "true", "yes", "y"}
-                            else:
-                                config[key] = env_value
-                        except ValueError:
-                            missing_keys.append("{}(无效的{}值)".format(key, target_type))
-                    else:
-                        config[key] = env_value
+                    try:
+                        config[key] = self._convert_value(env_value, key, type_conversions)
+                    except ValueError:
+                        missing_keys.append("{}(无效的{}值)".format(key, type_conversions[key]))
+            
+            # 可选配置项：未配置时使用默认值，配置了则同样做类型转换
+            for key, default in (optional_keys or {}).items():
+                env_value = os.getenv(key)
+                if env_value is None or env_value.strip() == "":
+                    config[key] = default
+                    continue
+                try:
+                    config[key] = self._convert_value(env_value, key, type_conversions)
+                except ValueError:
+                    missing_keys.append("{}(无效的{}值)".format(key, type_conversions[key]))
             
             # 如果有缺失的配置项，抛出异常
             if missing_keys:
@@ -243,8 +261,68 @@ class BaseApp:
                 
         return config
 
-    def setup_logging(self, log_dir=None, retention_days=30):
-        """设置日志记录，按天分割日志文件，自动清理过期日志。"""
+    def reload_config(self):
+        """重新读取最近一次加载的配置文件，按相同的配置项定义返回新配置（配置无效时抛出 ValueError）。
+
+        系统环境变量仍优先于配置文件：只更新由配置文件设置的环境变量，文件中删除的配置项恢复为未配置。
+        """
+        if self.config_file is None:
+            raise ValueError("尚未加载配置")
+        if dotenv_values is not None and self.config_file.exists():
+            values = dotenv_values(self.config_file)
+            for key in self._file_keys - set(values):
+                os.environ.pop(key, None)
+            for key, value in values.items():
+                if key not in self._preset_env:
+                    os.environ[key] = value or ""
+        required_keys, type_conversions, optional_keys = self._config_args
+        return self.load_config(self.config_file, required_keys, type_conversions, optional_keys)
+
+    def config_changed(self, *extra_paths):
+        """按修改时间与大小轮询配置文件（及 extra_paths，如目标列表文件）自上次生效以来是否有变化。
+
+        文件变化后需在下一次轮询时保持不变才返回 True，避免读到编辑器尚未写完的文件；首次调用只记录当前状态。
+        """
+        stamps = {}
+        for path in [Path(path) for path in (self.config_file,) + extra_paths if path]:
+            try:
+                stat = path.stat()
+                stamps[str(path)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamps[str(path)] = None
+        previous, self._config_seen = self._config_seen, stamps
+        if self._config_applied is None:
+            self._config_applied = stamps
+            return False
+        if stamps == self._config_applied or stamps != previous:
+            return False
+        self._config_applied = stamps
+        return True
+
+    @staticmethod
+    def _convert_value(env_value, key, type_conversions):
+        """按类型转换字典转换单个配置值，无效值抛出 ValueError。"""
+        if not type_conversions or key not in type_conversions:
+            return env_value
+        target_type = type_conversions[key]
+        if target_type == "int":
+            return int(env_value)
+        if target_type == "float":
+            return float(env_value)
+        if target_type == "bool":
+            return env_value.lower() in {"1", "true", "yes", "y"}
+        return env_value
+
+    def setup_logging(self, log_dir=None, retention_days=30, json_lines=False, async_queue=True):
+        """设置日志记录，按天分割日志文件，自动清理过期日志。
+        
+        Args:
+            retention_days: 启动时清理超过该天数的日志，为 None 时不清理（由 start_log_retention 按配置清理）
+            json_lines: 为 True 时日志文件每行一条 JSON（控制台仍为文本）
+            async_queue: 为 True 时调用方只把日志放入队列，由后台线程写文件与控制台
+        """
+        from .log_handlers import DailyFileHandler, JsonFormatter, LogPipeline, LOG_FORMAT
+
         if log_dir is None:
             log_dir = self.root / "logs"
             
@@ -252,68 +330,109 @@ class BaseApp:
         log_dir.mkdir(exist_ok=True)
         
         # 清理过期日志文件
-        self.cleanup_old_logs(log_dir, retention_days)
+        if retention_days is not None:
+            self.cleanup_old_logs(log_dir, retention_days)
         
-        # 创建按天分割的日志文件名
-        today = datetime.now().strftime("%Y-%m-%d")
-        log_file = log_dir / "{}-{}.log".format(self.app_name, today)
+        # 按天分割的日志文件，跨过零点后自动写入新一天的文件
+        self._log_dir = log_dir
+        file_handler = DailyFileHandler(log_dir, self.app_name, on_rollover=self._on_log_rollover)
+        file_handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+        console_handler = logging.StreamHandler()  # 同时输出到控制台
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = [file_handler, console_handler]
+        if async_queue:
+            self._log_pipeline = LogPipeline(handlers).start()
+            atexit.register(self.stop_logging)
+            handlers = [self._log_pipeline.handler]
+        self._log_file_handler = file_handler
         
         # 配置日志格式
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()  # 同时输出到控制台
-            ]
-        )
+        logging.basicConfig(level=logging.INFO, handlers=handlers)
         
         logger = logging.getLogger(self.app_name)
-        logger.info("日志系统已启动，日志文件: {}".format(log_file))
+        logger.info("日志系统已启动，日志文件: {}".format(file_handler.baseFilename))
         self.logger = logger  # 保存 logger 实例
         return logger
 
+    def set_log_json(self, enabled):
+        """切换日志文件的格式（JSON 行或文本），用于在加载配置后按配置调整。"""
+        from .log_handlers import JsonFormatter, LOG_FORMAT
+
+        if self._log_file_handler is not None:
+            self._log_file_handler.setFormatter(JsonFormatter() if enabled else logging.Formatter(LOG_FORMAT))
+
+    def start_log_retention(self, retention_days, max_total_bytes=0, compress=False, interval=3600):
+        """启动后台日志保留任务：立即清理一次，之后每 interval 秒及每次日志换天时清理。
+        
+        Args:
+            retention_days: 保留天数
+            max_total_bytes: 日志总大小上限（字节），超过时从最旧的文件开始删除，0 表示不限制
+            compress: 是否把已结束的日期文件压缩为 .log.gz
+        """
+        from .log_handlers import LogRetention
+
+        log_dir = self._log_dir or self.root / "logs"
+        self._log_retention = LogRetention(log_dir, self.app_name, retention_days, max_total_bytes, compress)
+        self._log_retention.start(interval)
+        return self._log_retention
+
+    def _on_log_rollover(self, closed_path):
+        if self._log_retention is not None:
+            self._log_retention.wake()
+
+    def stop_logging(self):
+        """停止日志保留任务，写完队列中剩余的日志并停止后台日志线程（未启用时忽略）。"""
+        if self._log_retention is not None:
+            self._log_retention.stop()
+            self._log_retention = None
+        if self._log_pipeline is not None:
+            self._log_pipeline.stop()
+
     def cleanup_old_logs(self, log_dir, retention_days):
-        """清理超过保留天数的日志文件。"""
+        """清理超过保留天数的日志文件（含压缩后的 .log.gz）。"""
+        from .log_handlers import LogRetention
+
         if not log_dir.exists():
             return
         
-        cutoff_date = datetime.now() - timedelta(days=retention_days)
-        deleted_count = 0
-        
-        for log_file in log_dir.glob("{}-*.log".format(self.app_name)):
-            try:
-                # 从文件名提取日期
-                date_str = log_file.stem.split('-')[-1]  # 获取日期部分
-                file_date = datetime.strptime(date_str, "%Y-%m-%d")
-                
-                if file_date < cutoff_date:
-                    log_file.unlink()
-                    deleted_count += 1
-            except (ValueError, IndexError):
-                # 文件名格式不正确，跳过
-                continue
+        deleted_count = LogRetention(log_dir, self.app_name, retention_days).run()
         
         if deleted_count > 0:
             print("[日志清理] 已删除 {} 个过期日志文件".format(deleted_count))
 
-    def send_mail(self, config, subject, content):
-        """发送邮件通知。
-        
-        返回:
-            bool: 如果成功发送邮件返回 True，如果因为未配置而跳过发送返回 False
-        异常:
-            如果发送过程中出现错误，抛出异常
-        """
-        smtp_host = config["SMTP_HOST"]
-        
+    def is_mail_configured(self, config):
+        """SMTP 是否已配置（非示例配置），未配置时记录警告并返回 False。"""
         # 检查是否为示例配置
-        if smtp_host == "smtp.example.com":
+        if config["SMTP_HOST"] == "smtp.example.com":
             error_msg = "SMTP邮件服务器未配置，请到\".env\"文件进行配置。"
-            self.logger.warning("警告: {}".format(error_msg))
-           
-            return False  # 返回 False 表示未发送邮件
-        
+            if self.logger:
+                self.logger.warning("警告: {}".format(error_msg))
+            return False
+        return True
+
+    def build_mail(self, config, subject, content):
+        """按配置构造邮件。"""
+        mail_from = config["MAIL_FROM"]
+        mail_to = config["MAIL_TO"]
+        if not (mail_from and mail_to):
+            raise RuntimeError("SMTP配置不完整，请在 .env 中设置 SMTP_* 与邮件地址")
+
+        # 邮件相关模块只在真正发送时加载，不发送告警的运行（如 --once）不必承担其导入开销
+        from email.message import EmailMessage
+
+        msg = EmailMessage()
+        msg["From"] = mail_from
+        msg["To"] = mail_to
+        msg["Subject"] = subject
+        msg.set_content(content)
+        return msg
+
+    def open_smtp(self, config):
+        """建立已完成 TLS 与登录的 SMTP 连接，调用方负责 quit()。"""
+        import smtplib
+        import ssl
+
+        smtp_host = config["SMTP_HOST"]
         smtp_port = config["SMTP_PORT"]
         username = config["SMTP_USERNAME"]
         password = config["SMTP_PASSWORD"]
@@ -324,34 +443,65 @@ class BaseApp:
             # 常见端口 465/587 默认使用 TLS，其它端口默认不启用
             use_tls = smtp_port in (465, 587)
 
-        mail_from = config["MAIL_FROM"]
-        mail_to = config["MAIL_TO"]
-
-        if not (smtp_host and smtp_port and username and password and mail_from and mail_to):
+        if not (smtp_host and smtp_port and username and password):
             raise RuntimeError("SMTP配置不完整，请在 .env 中设置 SMTP_* 与邮件地址")
 
-        msg = EmailMessage()
-        msg["From"] = mail_from
-        msg["To"] = mail_to
-        msg["Subject"] = subject
-        msg.set_content(content)
-
         if use_tls and smtp_port == 465:
             context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, context=context) as server:
-                server.login(username, password)
-                server.send_message(msg)
+            server = smtplib.SMTP_SSL(smtp_host, smtp_port, context=context)
         else:
-            with smtplib.SMTP(smtp_host, smtp_port) as server:
+            server = smtplib.SMTP(smtp_host, smtp_port)
+        try:
+            if not isinstance(server, smtplib.SMTP_SSL):
                 server.ehlo()
                 if use_tls:
                     server.starttls(context=ssl.create_default_context())
                     server.ehlo()
-                server.login(username, password)
-                server.send_message(msg)
+            server.login(username, password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def send_mail(self, config, subject, content):
+        """发送邮件通知。
+        
+        返回:
+            bool: 如果成功发送邮件返回 True，如果因为未配置而跳过发送返回 False
+        异常:
+            如果发送过程中出现错误，抛出异常
+        """
+        if not self.is_mail_configured(config):
+            return False  # 返回 False 表示未发送邮件
+
+        msg = self.build_mail(config, subject, content)
+        with self.open_smtp(config) as server:
+            server.send_message(msg)
         
         return True  # 成功发送邮件，返回 True
 
+    def start_metrics_server(self, port, host="127.0.0.1"):
+        """启动内置的指标 HTTP 端点（Prometheus 文本格式，路径 /metrics），默认包含进程资源指标。
+        
+        返回:
+            MetricsRegistry: 指标注册表，业务代码在其上登记采集函数与直方图
+        """
+        from .metrics import MetricsRegistry, MetricsServer, process_collector
+
+        if self.metrics is None:
+            self.metrics = MetricsRegistry(prefix=self.app_name.replace("-", "_") + "_")
+            self.metrics.register(process_collector)
+        self._metrics_server = MetricsServer(self.metrics, host, port).start()
+        if self.logger:
+            self.logger.info("指标端点已启动: http://{}:{}/metrics".format(host, self._metrics_server.port))
+        return self.metrics
+
+    def stop_metrics_server(self):
+        """停止指标 HTTP 端点（未启动时忽略）。"""
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+
 
 
 # 为了向后兼容，提供独立的函数接口
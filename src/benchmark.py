@@ -0,0 +1,693 @@
+"""
+基准测试模块
+在本机启动模拟网站（HTTP/HTTPS，可配置延迟、错误率、响应体大小、断开连接）与模拟 SMTP 服务器，
+测量探测引擎与 check_url() 的吞吐、探测耗时 p50/p99、调度延迟、每个目标的内存占用，以及检查循环从网站故障到收到告警邮件的延迟；
+另外不发起网络请求，按检查循环保存的内容为十万个目标建立状态，按部分统计每个目标的内存占用
+
+用法:
+    python -m src.benchmark [--targets 1000] [--duration 10] [--interval 5] [--https] [--save result.json]
+    python -m src.benchmark --baseline result.json [--tolerance 0.2]   # 与基线比较，退化超过容差时退出码为 1
+"""
+import argparse
+import asyncio
+import email
+import email.policy
+import importlib.util
+import json
+import logging
+import random
+import runpy
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from .metrics import _resident_memory
+from .probe import ProbeEngine
+from .probe_options import DEFAULT_PROBE_METHOD, PROBE_METHODS
+from .scheduler import Scheduler
+
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+class Behavior:
+    """模拟网站的响应行为，运行中修改立即生效。"""
+
+    __slots__ = ("latency", "jitter", "error_rate", "body_size", "drop_rate")
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, body_size=0, drop_rate=0.0):
+        self.latency = latency  # 响应前等待的秒数
+        self.jitter = jitter  # 额外的随机等待（0 ~ jitter 秒）
+        self.error_rate = error_rate  # 返回 500 的比例
+        self.body_size = body_size  # 响应体字节数
+        self.drop_rate = drop_rate  # 读完请求后不响应直接断开连接的比例
+
+
+class FakeSite:
+    """模拟网站：监听一个端口，支持 keep-alive、HEAD 与 Range 请求。"""
+
+    def __init__(self, behavior=None, ssl_context=None):
+        self.behavior = behavior or Behavior()
+        self.ssl_context = ssl_context
+        self.port = None
+        self.requests = 0
+        self.connections = 0
+        self.writers = set()  # 当前打开的连接
+        self._server = None
+        self._bodies = {}
+
+    @property
+    def scheme(self):
+        return "https" if self.ssl_context else "http"
+
+    def url(self, path="/"):
+        host = "localhost" if self.ssl_context else "127.0.0.1"
+        return "{}://{}:{}{}".format(self.scheme, host, self.port, path)
+
+    async def start(self, host="127.0.0.1"):
+        self._server = await asyncio.start_server(self._handle, host, 0, ssl=self.ssl_context, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def _body(self, size):
+        body = self._bodies.get(size)
+        if body is None:
+            body = self._bodies[size] = b"x" * size
+        return body
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                self.requests += 1
+                behavior = self.behavior
+                if behavior.latency or behavior.jitter:
+                    await asyncio.sleep(behavior.latency + random.uniform(0, behavior.jitter))
+                if behavior.drop_rate and random.random() < behavior.drop_rate:
+                    break
+                writer.write(self._response(request, headers, behavior))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def _response(self, request, headers, behavior):
+        status, reason = (500, "Internal Server Error") if (
+            behavior.error_rate and random.random() < behavior.error_rate) else (200, "OK")
+        size = behavior.body_size
+        extra = ""
+        byte_range = headers.get("range", "")
+        if status == 200 and size and byte_range.startswith("bytes=0-"):
+            end = min(int(byte_range[8:] or size - 1), size - 1)
+            status, reason = 206, "Partial Content"
+            extra = "Content-Range: bytes 0-{}/{}\r\n".format(end, size)
+            size = end + 1
+        head = "HTTP/1.1 {} {}\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n{}\r\n".format(
+            status, reason, size, extra).encode("latin-1")
+        if request.startswith(b"HEAD "):
+            return head
+        return head + self._body(size)
+
+
+class SmtpSink:
+    """模拟 SMTP 服务器：接受任意登录（AUTH PLAIN/LOGIN），记录收到的邮件。"""
+
+    def __init__(self):
+        self.port = None
+        self.messages = []  # [(接收时间, 主题, 正文)]
+        self.writers = set()  # 当前打开的连接
+        self._server = None
+
+    async def start(self, host="127.0.0.1"):
+        self._server = await asyncio.start_server(self._handle, host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def first_mention(self, text, since=0.0):
+        """正文或主题中第一次出现 text 的邮件的接收时间，没有时返回 None。"""
+        for received, subject, body in list(self.messages):
+            if received >= since and (text in body or text in subject):
+                return received
+        return None
+
+    async def _handle(self, reader, writer):
+        self.writers.add(writer)
+        writer.write(b"220 sink ESMTP\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("latin-1").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    writer.write(b"250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif verb == "AUTH":
+                    await self._auth(command.split(), reader, writer)
+                elif verb == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    self._record(await self._read_data(reader))
+                    writer.write(b"250 OK\r\n")
+                elif verb == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _auth(fields, reader, writer):
+        mechanism = fields[1].upper() if len(fields) > 1 else ""
+        # 客户端未随命令附带初始应答时，按机制逐步索取用户名、密码
+        prompts = {"LOGIN": [b"334 VXNlcm5hbWU6\r\n", b"334 UGFzc3dvcmQ6\r\n"], "PLAIN": [b"334 \r\n"]}.get(mechanism, [])
+        if len(fields) > 2:
+            prompts = prompts[1:]
+        for prompt in prompts:
+            writer.write(prompt)
+            await writer.drain()
+            await reader.readline()
+        writer.write(b"235 Authentication successful\r\n")
+
+    @staticmethod
+    async def _read_data(reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b".\r\n", b".\n", b""):
+                break
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        return b"".join(lines)
+
+    def _record(self, data):
+        message = email.message_from_bytes(data, policy=email.policy.default)
+        part = message.get_body(("plain",)) or message
+        try:
+            body = part.get_content()
+        except (KeyError, LookupError):
+            body = ""
+        self.messages.append((time.time(), str(message.get("Subject", "")), body))
+
+
+class Services:
+    """在后台线程的事件循环中运行模拟网站与 SMTP 服务器，不占用被测代码的事件循环。"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.sites = []
+        self._thread = threading.Thread(target=self.loop.run_forever, name="bench-services", daemon=True)
+        self._thread.start()
+
+    def call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def add_site(self, behavior=None, ssl_context=None):
+        site = self.call(FakeSite(behavior, ssl_context).start())
+        self.sites.append(site)
+        return site
+
+    def add_smtp(self):
+        sink = self.call(SmtpSink().start())
+        self.sites.append(sink)
+        return sink
+
+    def close(self):
+        self.call(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+
+    async def _shutdown(self):
+        for server in self.sites:
+            await server.close()
+        # 等待各连接的处理协程在对端断开后结束，避免退出时留下未完成的任务
+        for _ in range(50):
+            if all(not server.writers for server in self.sites):
+                break
+            await asyncio.sleep(0.01)
+
+
+def make_certificate(directory):
+    """用 openssl 命令生成 localhost 的自签名证书，返回 (证书, 私钥) 路径；openssl 不可用时返回 None。"""
+    certfile, keyfile = Path(directory) / "cert.pem", Path(directory) / "key.pem"
+    command = ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+               "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+               "-keyout", str(keyfile), "-out", str(certfile)]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return str(certfile), str(keyfile)
+
+
+def percentile(values, q):
+    """最近秩法分位数，values 需已排序。"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+
+def _latency_summary(prefix, latencies, elapsed):
+    latencies.sort()
+    return {
+        prefix + "probes": len(latencies),
+        prefix + "probes_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        prefix + "p50_ms": (percentile(latencies, 0.5) or 0) * 1000,
+        prefix + "p99_ms": (percentile(latencies, 0.99) or 0) * 1000,
+    }
+
+
+def bench_engine(urls, duration, interval, concurrency=200, method=DEFAULT_PROBE_METHOD, timeout=5, ssl_context=None):
+    """探测引擎：先连续整批探测测峰值吞吐，再按调度间隔运行测调度延迟与每目标内存。
+
+    同时统计复用已有连接的探测比例（engine_reuse_rate），探测方式导致每次都断开连接时该比例接近0。
+    """
+    rss_before = _resident_memory()
+    engine = ProbeEngine(concurrency=concurrency, timeout_seconds=timeout, method=method, ssl_context=ssl_context)
+    results = {}
+    try:
+        # 峰值吞吐：整批探测所有目标，直到用完一半时间
+        latencies, failures, reused = [], 0, 0
+        start = time.monotonic()
+        while time.monotonic() - start < duration / 2:
+            for result in engine.run_batch(urls):
+                latencies.append(result.elapsed)
+                failures += 0 if result.ok else 1
+                reused += 1 if result.reused else 0
+        results.update(_latency_summary("engine_burst_", latencies, time.monotonic() - start))
+        results["engine_burst_failures"] = failures
+        results["engine_reuse_rate"] = reused / len(latencies) if latencies else 0.0
+
+        # 按调度：每个目标每 interval 秒一次，首轮打散到整个间隔
+        scheduler = Scheduler()
+        for url in urls:
+            scheduler.add(url, interval, jitter=interval)
+        latencies = []
+        start = time.monotonic()
+        try:
+            engine.loop.run_until_complete(asyncio.wait_for(
+                engine.run_scheduled(scheduler, lambda result: latencies.append(result.elapsed)), duration / 2))
+        except asyncio.TimeoutError:
+            pass
+        results.update(_latency_summary("engine_scheduled_", latencies, time.monotonic() - start))
+        lag = scheduler.stats()
+        results["engine_drift_avg_ms"] = lag["avg_lag"] * 1000
+        results["engine_drift_max_ms"] = lag["max_lag"] * 1000
+        results["engine_skipped_rounds"] = lag["skipped"]
+        rss_after = _resident_memory()
+        if rss_before is not None and rss_after is not None:
+            results["engine_bytes_per_target"] = max(0, rss_after - rss_before) / len(urls)
+    finally:
+        engine.close()
+    return results
+
+
+def bench_check_url(script, url, duration, timeout=5, method=DEFAULT_PROBE_METHOD, ca_file=None):
+    """单目标模式的 check_url()：复用同一个会话依次探测。"""
+    session = script["make_session"](4, ca_file)
+    latencies, failures = [], 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        begin = time.monotonic()
+        ok, _, _ = script["check_url"](url, timeout, session, method)
+        latencies.append(time.monotonic() - begin)
+        failures += 0 if ok else 1
+    results = _latency_summary("check_url_", latencies, time.monotonic() - start)
+    results["check_url_failures"] = failures
+    session.close()
+    return results
+
+
+def has_requests():
+    """是否已安装 requests。check-web-alive.py 在单目标模式用到时才导入 requests，加载脚本时缺少它不会报错，需事先检查。"""
+    return importlib.util.find_spec("requests") is not None
+
+
+def load_script():
+    """加载 check-web-alive.py（不执行 main），返回其全局变量；缺少依赖时返回 None。"""
+    try:
+        return runpy.run_path(str(_ROOT / "check-web-alive.py"), run_name="check_web_alive_benchmark")
+    except ImportError as exc:
+        print("跳过 check_url() 与检查循环的测试: {}".format(exc))
+        return None
+
+
+def make_config(script, app, smtp_port, interval, timeout, **overrides):
+    """按程序的默认配置生成检查循环使用的配置（不读取 .env）。"""
+    _, optional_keys, _ = script["config_keys"]()
+    cfg = dict(optional_keys)
+    cfg.update({
+        "CHECK_INTERVAL_SECONDS": interval,
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": smtp_port,
+        "SMTP_USERNAME": "bench",
+        "SMTP_PASSWORD": "bench",
+        "MAIL_FROM": "bench@localhost",
+        "MAIL_TO": "bench@localhost",
+        "REQUEST_TIMEOUT_SECONDS": timeout,
+        "LOG_RETENTION_DAYS": 1,
+        "SMTP_USE_TLS": False,
+    })
+    cfg.update(overrides)
+    return cfg, script["prepare_config"](app, cfg)
+
+
+def bench_loop(script, services, sink, urls, down_sites, interval, timeout, single=False, ca_file=None):
+    """检查循环：在后台线程运行程序的 run_multi_target / run_single_target，让 down_sites 开始返回 500，
+    测量从故障开始到告警邮件送达模拟 SMTP 服务器的延迟。
+
+    测量完成后设置传给检查循环的 stop 事件，检查循环与按 Ctrl+C 退出时一样保存状态后返回。
+    ca_file 为模拟网站自签名证书的 CA 文件，经 TLS_CA_FILE 配置传给检查循环。
+    """
+    from .base import BaseApp
+    from .mail_queue import MailDispatcher
+
+    prefix = "single_loop_" if single else "loop_"
+    root = Path(tempfile.mkdtemp(prefix="check-web-alive-bench-"))
+    app = BaseApp("check-web-alive-bench", root_path=root)
+    logger = logging.getLogger("check-web-alive-bench." + prefix)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    if single:
+        cfg, targets = make_config(script, app, sink.port, interval, timeout, TARGET_URL=urls[0], TLS_CA_FILE=ca_file)
+    else:
+        cfg, targets = make_config(script, app, sink.port, interval, timeout, TARGET_URLS=",".join(urls),
+                                   TLS_CA_FILE=ca_file)
+    mailer = MailDispatcher(
+        app, cfg,
+        queue_size=cfg["ALERT_QUEUE_SIZE"],
+        coalesce_seconds=cfg["ALERT_COALESCE_SECONDS"],
+        max_retries=cfg["ALERT_MAX_RETRIES"],
+        idle_timeout=cfg["SMTP_IDLE_TIMEOUT_SECONDS"],
+    ).start()
+
+    rss_before = _resident_memory()
+    stop = threading.Event()
+    if single:
+        run, args = script["run_single_target"], (app, cfg, logger, mailer)
+    else:
+        run, args = script["run_multi_target"], (app, cfg, logger, mailer, targets)
+    runner = threading.Thread(target=run, args=args, kwargs={"stop": stop}, name="bench-loop", daemon=True)
+    runner.start()
+    # 预热：所有目标都完成首轮检查
+    time.sleep(max(3, interval * 2))
+    results = {}
+    rss_after = _resident_memory()
+    if not single and rss_before is not None and rss_after is not None:
+        results[prefix + "bytes_per_target"] = max(0, rss_after - rss_before) / len(urls)
+
+    down_urls = [url for url in urls if any(url.startswith(site.url("/")) for site in down_sites)]
+    started = time.time()
+    for site in down_sites:
+        site.behavior.error_rate = 1.0
+    deadline = time.monotonic() + interval * (cfg["ALERT_CONFIRM_WINDOW"] + 2) + cfg["ALERT_COALESCE_SECONDS"] + 30
+    pending = set(down_urls)
+    delays = []
+    while pending and time.monotonic() < deadline:
+        time.sleep(0.2)
+        for url in list(pending):
+            received = sink.first_mention(url, since=started)
+            if received is not None:
+                delays.append(received - started)
+                pending.discard(url)
+    for site in down_sites:
+        site.behavior.error_rate = 0.0
+    stop.set()
+    runner.join(interval + timeout + 5)
+    mailer.close()
+    delays.sort()
+    results[prefix + "alerts"] = len(delays)
+    results[prefix + "alerts_missing"] = len(pending)
+    if delays:
+        results[prefix + "alert_p50_s"] = percentile(delays, 0.5)
+        results[prefix + "alert_max_s"] = delays[-1]
+    shutil.rmtree(str(root), ignore_errors=True)
+    return results
+
+
+def bench_memory(script, count, interval=60, timeout=5):
+    """大量目标的内存占用：按多目标检查循环保存的内容，为每个目标建立目标列表、调度、告警状态、日志抽样、
+    状态记录与检查历史各一份（处理一轮检查结果），不发起网络请求。
+
+    先不跟踪内存分配，测加载目标列表与处理一轮结果的耗时及常驻内存增量；再用 tracemalloc 重做一遍，按部分统计每个目标的字节数。
+    """
+    from .base import BaseApp
+    from .history import HistoryStore
+    from .log_handlers import RepeatSampler
+    from .state_store import StateStore, TargetState
+
+    root = Path(tempfile.mkdtemp(prefix="check-web-alive-bench-"))
+    app = BaseApp("check-web-alive-bench", root_path=root)
+    logger = logging.getLogger("check-web-alive-bench.memory")
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    targets_file = root / "targets.txt"
+    targets_file.write_text("\n".join(
+        "https://t{}.site{}.example.com/health".format(i, i % 1000) for i in range(count)), encoding="utf-8")
+
+    def build(directory, checkpoint):
+        """建立各部分，每部分完成后调用 checkpoint(名称)；返回各部分对象，测量结束前保持引用。"""
+        directory.mkdir()
+        cfg, targets = make_config(script, app, 0, interval, timeout, TARGETS_FILE=str(targets_file))
+        checkpoint("targets")
+        scheduler = Scheduler()
+        for url in targets:
+            scheduler.add(url, interval, jitter=interval)
+        checkpoint("scheduler")
+        # 一轮检查结果：每100个目标中1个不可达；状态文本与耗时按检查循环中的方式逐次生成
+        now = int(time.time())
+        alerts = script["make_alert_machine"](cfg)
+        for index, url in enumerate(targets):
+            alerts.observe(url, index % 100 != 0, now)
+        checkpoint("alerts")
+        sampler = RepeatSampler(cfg["LOG_SAMPLE_SUCCESS_EVERY"])
+        for index, url in enumerate(targets):
+            ok = index % 100 != 0
+            script["log_check_result"](logger, sampler, url, "{}".format(200 if ok else 503), ok, "", ok)
+        checkpoint("sampler")
+        store = StateStore(directory / "targets-state.json", cfg["STATE_FLUSH_INTERVAL_SECONDS"], record=TargetState)
+        store.load()
+        for index, url in enumerate(targets):
+            store.set(url, script["merge_state"](store.get(url, {}), index % 100 != 0, current_time=now,
+                                                 latency_ms=100 + index % 900), changed=False)
+        checkpoint("state")
+        history = HistoryStore(directory / "history")
+        for index, url in enumerate(targets):
+            ok = index % 100 != 0
+            history.append(url, now, 200 if ok else 503, 100 + index % 900, None if ok else "http", ok)
+        checkpoint("history")
+        return targets, scheduler, alerts, sampler, store, history
+
+    results = {"memory_targets": count}
+    try:
+        # 第一遍：耗时与常驻内存
+        marks = []
+        rss_before = _resident_memory()
+        started = time.monotonic()
+        kept = build(root / "timed", lambda name: marks.append((name, time.monotonic())))
+        rss_after = _resident_memory()
+        results["memory_load_s"] = marks[0][1] - started
+        results["memory_round_s"] = marks[-1][1] - marks[1][1]
+        if rss_before is not None and rss_after is not None:
+            results["memory_rss_per_target"] = max(0, rss_after - rss_before) / count
+        kept[-2].close()
+        kept[-1].close()
+        del kept
+
+        # 第二遍：按部分统计分配的字节数
+        sizes = []
+        tracemalloc.start()
+        try:
+            kept = build(root / "traced", lambda name: sizes.append((name, tracemalloc.get_traced_memory()[0])))
+        finally:
+            tracemalloc.stop()
+        previous = 0
+        for name, size in sizes:
+            results["memory_{}_bytes_per_target".format(name)] = (size - previous) / count
+            previous = size
+        results["memory_bytes_per_target"] = previous / count
+        kept[-2].close()
+        kept[-1].close()
+    finally:
+        shutil.rmtree(str(root), ignore_errors=True)
+    return results
+
+
+# 越大越好的指标（其余数值指标越小越好；计数类不参与比较）
+_HIGHER_IS_BETTER = ("_per_sec", "_reuse_rate")
+_COMPARED = ("_per_sec", "_ms", "_s", "_per_target", "_reuse_rate")
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回退化的指标列表 [(名称, 基线值, 本次值)]。"""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        if not name.endswith(_COMPARED):
+            continue
+        if name.endswith(_HIGHER_IS_BETTER):
+            worse = value < old * (1 - tolerance)
+        else:
+            worse = value > old * (1 + tolerance)
+        if worse:
+            regressions.append((name, old, value))
+    return regressions
+
+
+def _served(sites):
+    """各模拟网站累计的 (连接数, 请求数)。"""
+    return sum(site.connections for site in sites), sum(site.requests for site in sites)
+
+
+def _reuse_rate(before, after):
+    """两次 _served() 之间在已有连接上处理的请求比例。"""
+    connections, requests = after[0] - before[0], after[1] - before[1]
+    return max(0.0, 1 - connections / requests) if requests else 0.0
+
+
+def _print_results(results):
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        text = "{:.3f}".format(value) if isinstance(value, float) else str(value)
+        print("  {}  {}".format(name.ljust(width), text))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="check-web-alive 基准测试")
+    parser.add_argument("--targets", type=int, default=1000, help="目标数（默认1000）")
+    parser.add_argument("--sites", type=int, default=10, help="模拟网站（端口）数，目标平均分到各网站（默认10）")
+    parser.add_argument("--duration", type=float, default=10, help="每项测试的时长（秒，默认10）")
+    parser.add_argument("--interval", type=int, default=5, help="检查间隔（秒，默认5）")
+    parser.add_argument("--concurrency", type=int, default=200, help="探测并发上限（默认200）")
+    parser.add_argument("--method", default=DEFAULT_PROBE_METHOD, choices=PROBE_METHODS,
+                        help="探测方式（默认与程序默认配置相同: {}）".format(DEFAULT_PROBE_METHOD))
+    parser.add_argument("--timeout", type=int, default=5, help="请求超时（秒，默认5）")
+    parser.add_argument("--https", action="store_true", help="模拟网站使用 HTTPS（需要 openssl 命令生成证书）")
+    parser.add_argument("--latency", type=float, default=0, help="模拟网站的响应延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="额外的随机延迟上限（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回 500 的比例（0~1）")
+    parser.add_argument("--body-size", type=int, default=0, help="响应体字节数")
+    parser.add_argument("--drop-rate", type=float, default=0, help="不响应直接断开连接的比例（0~1）")
+    parser.add_argument("--down-sites", type=int, default=1, help="测量告警延迟时变为故障的网站数（默认1）")
+    parser.add_argument("--skip-loop", action="store_true", help="不测检查循环的告警延迟")
+    parser.add_argument("--skip-check-url", action="store_true", help="不测 check_url()")
+    parser.add_argument("--memory-targets", type=int, default=100000,
+                        help="测量内存占用的目标数（默认100000，不发起网络请求；0 表示不测）")
+    parser.add_argument("--save", help="把结果保存为 JSON 文件，作为以后比较的基线")
+    parser.add_argument("--baseline", help="与之前保存的基线比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例（默认0.2，即20%%）")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="check-web-alive-bench-")
+    ssl_context = None
+    client_context = None
+    ca_file = None
+    if args.https:
+        cert = make_certificate(workdir)
+        if cert is None:
+            parser.error("生成证书失败：需要 openssl 命令")
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(*cert)
+        # 探测引擎、check_url() 与检查循环都信任这张自签名证书，证书校验保持开启
+        ca_file = cert[0]
+        client_context = ssl.create_default_context(cafile=ca_file)
+
+    behavior = Behavior(args.latency / 1000.0, args.jitter / 1000.0, args.error_rate, args.body_size, args.drop_rate)
+    services = Services()
+    results = {"targets": args.targets, "sites": args.sites, "https": args.https}
+    try:
+        script = None
+        if args.memory_targets > 0 or not (args.skip_check_url and args.skip_loop):
+            script = load_script()
+        single_ok = script is not None and has_requests()
+        if script is not None and not single_ok and not (args.skip_check_url and args.skip_loop):
+            print("未安装 requests，跳过 check_url() 与单目标检查循环的测试")
+        if script is not None and args.memory_targets > 0:
+            # 最先测量，常驻内存的增量不受其他测试留下的内存影响
+            print("内存占用（{} 个目标）...".format(args.memory_targets))
+            results.update(bench_memory(script, args.memory_targets, args.interval, args.timeout))
+        sites = [services.add_site(Behavior(behavior.latency, behavior.jitter, behavior.error_rate,
+                                            behavior.body_size, behavior.drop_rate), ssl_context)
+                 for _ in range(max(1, args.sites))]
+        urls = [sites[i % len(sites)].url("/t/{}".format(i)) for i in range(args.targets)]
+        print("模拟网站 {} 个，目标 {} 个（{}）".format(len(sites), len(urls), "HTTPS" if args.https else "HTTP"))
+
+        print("探测引擎（{}）...".format(args.method))
+        results.update(bench_engine(urls, args.duration, args.interval, args.concurrency, args.method, args.timeout,
+                                    client_context))
+        if single_ok and not args.skip_check_url:
+            print("check_url()（{}）...".format(args.method))
+            served = _served(sites)
+            results.update(bench_check_url(script, urls[0], args.duration, args.timeout, args.method, ca_file))
+            results["check_url_reuse_rate"] = _reuse_rate(served, _served(sites))
+        if script is not None and not args.skip_loop:
+            sink = services.add_smtp()
+            print("检查循环（多目标）...")
+            results.update(bench_loop(script, services, sink, urls, sites[:args.down_sites], args.interval,
+                                      args.timeout, ca_file=ca_file))
+            if single_ok:
+                print("检查循环（单目标）...")
+                single_site = services.add_site(Behavior(), ssl_context)
+                results.update(bench_loop(script, services, sink, [single_site.url("/")], [single_site],
+                                          args.interval, args.timeout, single=True, ca_file=ca_file))
+    finally:
+        services.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("结果:")
+    _print_results(results)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print("已保存: {}".format(args.save))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print("退化: {} {:.3f} -> {:.3f}".format(name, old, new))
+        if regressions:
+            return 1
+        print("与基线相比没有超过 {:.0%} 的退化".format(args.tolerance))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
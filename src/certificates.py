@@ -0,0 +1,309 @@
+"""
+证书监控模块
+从探测自身的 TLS 握手中取得证书（不额外建立连接），按主机缓存到期时间、颁发者与 SAN 匹配情况，
+证书指纹不变时不重新解析；剩余天数到达提醒档位时给出提醒，每个档位每张证书只提醒一次
+"""
+import hashlib
+import ipaddress
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+# 默认的到期提醒档位（剩余天数）
+DEFAULT_WARN_DAYS = (30, 14, 7, 3, 1)
+
+# 已过期证书的提醒档位
+EXPIRED = -1
+
+# OpenSSL 证书校验错误码 X509_V_ERR_CERT_HAS_EXPIRED（证书已过期）
+CERT_HAS_EXPIRED = 10
+
+
+def parse_warn_days(text):
+    """解析提醒档位配置，如 "30,14,7"，返回从小到大排列的天数元组；为空时返回空元组（不监控证书）。"""
+    days = set()
+    for item in (text or "").replace(" ", "").split(","):
+        if not item:
+            continue
+        if not item.isdigit():
+            raise ValueError("无效的证书提醒天数: {}".format(item))
+        days.add(int(item))
+    return tuple(sorted(days))
+
+
+class CertInfo:
+    """一张证书的摘要。时间均为 Unix 时间戳（秒）。"""
+
+    __slots__ = ("fingerprint", "subject", "issuer", "not_after", "chain_not_after", "sans", "hostname_ok",
+                 "tls_version", "inspected", "url", "alerted", "verify_code")
+
+    def __init__(self, fingerprint, subject=None, issuer=None, not_after=None, chain_not_after=None, sans=(),
+                 hostname_ok=True, tls_version=None, inspected=None, url=None, alerted=None, verify_code=None):
+        self.fingerprint = fingerprint  # 证书 DER 的 SHA-256
+        self.subject = subject  # 主题 CN
+        self.issuer = _intern(issuer)  # 颁发者 O（没有时取 CN），大量证书来自少数几个颁发者
+        self.not_after = not_after  # 证书到期时间
+        self.chain_not_after = chain_not_after  # 中间证书中最早的到期时间（Python 3.13 起可取得完整证书链）
+        self.sans = tuple(sans)  # 证书中的 DNS / IP 名称
+        self.hostname_ok = hostname_ok  # 主机名是否与 SAN 匹配
+        self.tls_version = _intern(tls_version)  # 握手协商的 TLS 版本
+        self.inspected = inspected  # 解析证书的时间
+        self.url = url  # 最近一次取得该证书的目标
+        self.alerted = alerted  # 已提醒过的档位（剩余天数，EXPIRED 为已过期）
+        self.verify_code = verify_code  # 握手时证书校验失败的错误码（此时取不到证书，其余字段为空）
+
+    @classmethod
+    def inspect(cls, fingerprint, cert, host, chain=(), tls_version=None):
+        """从 getpeercert() 的结果解析证书；chain 为证书链中其余证书的同格式信息。"""
+        # 取得证书时 ssl 已由探测加载，模块本身不导入 ssl，读取配置与状态时不必加载
+        import ssl
+        sans = tuple(value for kind, value in cert.get("subjectAltName", ()) if kind in ("DNS", "IP Address"))
+        chain_expiry = [ssl.cert_time_to_seconds(item["notAfter"]) for item in chain if item.get("notAfter")]
+        return cls(
+            fingerprint,
+            subject=_name_field(cert.get("subject"), "commonName"),
+            issuer=_name_field(cert.get("issuer"), "organizationName") or _name_field(cert.get("issuer"), "commonName"),
+            not_after=int(ssl.cert_time_to_seconds(cert["notAfter"])) if cert.get("notAfter") else None,
+            chain_not_after=int(min(chain_expiry)) if chain_expiry else None,
+            sans=sans,
+            hostname_ok=match_hostname(host, sans),
+            tls_version=tls_version,
+            inspected=int(time.time()),
+        )
+
+    @property
+    def expires(self):
+        """证书链中最早的到期时间。"""
+        if self.chain_not_after is not None and (self.not_after is None or self.chain_not_after < self.not_after):
+            return self.chain_not_after
+        return self.not_after
+
+    def days_left(self, now=None):
+        """距到期的整天数，已过期时为负数；无法取得到期时间时返回 None（校验失败得知已过期时返回 -1）。"""
+        expires = self.expires
+        if expires is None:
+            return -1 if self.verify_code == CERT_HAS_EXPIRED else None
+        now = time.time() if now is None else now
+        return int((expires - now) // 86400)
+
+    def summary(self):
+        """如 "颁发者 Let's Encrypt，到期 2025-03-01 08:00（证书链中的中间证书），TLSv1.3"。"""
+        parts = []
+        if self.verify_code == CERT_HAS_EXPIRED:
+            parts.append("握手时证书校验失败：证书已过期")
+        elif self.verify_code is not None:
+            parts.append("握手时证书校验失败（错误码 {}）".format(self.verify_code))
+        if self.issuer:
+            parts.append("颁发者 {}".format(self.issuer))
+        if self.expires is not None:
+            text = "到期 {}".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(self.expires)))
+            if self.expires != self.not_after:
+                text += "（证书链中的中间证书）"
+            parts.append(text)
+        if not self.hostname_ok:
+            parts.append("主机名与证书不匹配")
+        if self.tls_version:
+            parts.append(self.tls_version)
+        return "，".join(parts)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["sans"] = tuple(data.get("sans") or ())
+        return cls(**{name: data.get(name) for name in cls.__slots__ if name in data})
+
+
+class CertCache:
+    """按 "主机:端口" 缓存证书摘要。
+
+    - observe() 在每次新建 TLS 连接后调用：先取证书 DER 算指纹，与缓存相同时直接返回缓存，指纹变化（证书更换）才重新解析，
+      新解析的证书由 pop_changed() 取出（用于记录日志并立即检查到期时间）
+    - observe_failure() 在握手因证书校验失败时调用：证书已过期时同样记下并由 pop_changed() 取出，照常提醒 EXPIRED 档位
+    - expiry_alert() 判断剩余天数是否到达新的提醒档位；证书更换后重新从最高档位开始
+    - store 为保存证书摘要的状态存储（src.state_store.StateStore），重启后沿用已解析的证书与已提醒的档位
+    """
+
+    def __init__(self, warn_days=DEFAULT_WARN_DAYS, store=None):
+        self.warn_days = tuple(sorted(warn_days))
+        self.store = store
+        self._certs = {}  # "主机:端口" -> CertInfo
+        self.inspected = 0  # 解析证书的次数
+        self.hits = 0  # 指纹未变化、直接复用缓存的次数
+        self._changed = []  # 新解析、尚未取出的证书键
+
+    def __len__(self):
+        return len(self._certs)
+
+    def restore(self, data):
+        """从状态存储的数据恢复缓存，无法识别的条目忽略。"""
+        for key, value in (data or {}).items():
+            try:
+                self._certs[key] = CertInfo.from_dict(value)
+            except (TypeError, ValueError):
+                continue
+
+    def get(self, key):
+        return self._certs.get(key)
+
+    def items(self):
+        return list(self._certs.items())
+
+    def observe(self, host, port, ssl_object, url=None):
+        """记录一次 TLS 握手得到的证书，返回 ("主机:端口", CertInfo)；取不到证书时返回 (键, None)。"""
+        key = "{}:{}".format(host, port)
+        der = ssl_object.getpeercert(True)
+        if not der:
+            return key, None
+        fingerprint = hashlib.sha256(der).hexdigest()
+        info = self._certs.get(key)
+        if info is not None and info.fingerprint == fingerprint:
+            self.hits += 1
+            info.url = url or info.url
+            return key, info
+        self.inspected += 1
+        info = CertInfo.inspect(fingerprint, ssl_object.getpeercert(), host, _verified_chain(ssl_object),
+                                ssl_object.version())
+        info.url = url
+        self._certs[key] = info
+        self._changed.append(key)
+        self._save(key, info)
+        return key, info
+
+    def observe_failure(self, host, port, exc, url=None, now=None):
+        """记录一次因证书校验失败而中断的握手，返回 ("主机:端口", CertInfo)；不是证书过期导致的失败时返回 (键, None)。
+
+        校验失败时取不到证书：缓存中的证书已过期时沿用（提醒过 EXPIRED 档位后不再取出），
+        否则记为一张到期时间未知、已过期的证书（days_left() 为 -1）。
+        """
+        key = "{}:{}".format(host, port)
+        error = cert_verify_error(exc)
+        if error is None or error.verify_code != CERT_HAS_EXPIRED:
+            return key, None
+        now = time.time() if now is None else now
+        info = self._certs.get(key)
+        days = info.days_left(now) if info is not None else None
+        if days is not None and days < 0:
+            self.hits += 1
+            info.url = url or info.url
+            if self.warn_days and info.alerted != EXPIRED and key not in self._changed:
+                self._changed.append(key)
+            return key, info
+        self.inspected += 1
+        info = CertInfo(None, inspected=int(now), url=url, verify_code=error.verify_code)
+        self._certs[key] = info
+        self._changed.append(key)
+        self._save(key, info)
+        return key, info
+
+    def pop_changed(self):
+        """取出上次调用以来新解析（首次见到或已更换）的证书键。"""
+        changed, self._changed = self._changed, []
+        return changed
+
+    def expiry_alert(self, key, now=None):
+        """剩余天数到达新的提醒档位时记下该档位并返回剩余天数，否则返回 None。"""
+        info = self._certs.get(key)
+        if info is None or not self.warn_days:
+            return None
+        days = info.days_left(now)
+        if days is None:
+            return None
+        if days < 0:
+            level = EXPIRED
+        else:
+            level = next((limit for limit in self.warn_days if days <= limit), None)
+        if level is None or (info.alerted is not None and info.alerted <= level):
+            return None
+        info.alerted = level
+        self._save(key, info)
+        return days
+
+    def prune(self, keys):
+        """丢弃不在 keys 中的证书（对应的目标已移除）。"""
+        keys = set(keys)
+        for key in [key for key in self._certs if key not in keys]:
+            del self._certs[key]
+        if self.store is not None:
+            self.store.prune(keys)
+
+    def _save(self, key, info):
+        if self.store is not None:
+            self.store.set(key, info.as_dict())
+
+
+def cert_key(url):
+    """https 目标的证书缓存键 "主机:端口"，其他目标返回 None。"""
+    parts = urlsplit(url)
+    if parts.scheme.lower() != "https" or not parts.hostname:
+        return None
+    return "{}:{}".format(parts.hostname, parts.port or 443)
+
+
+def cert_verify_error(exc):
+    """从探测异常（及其 __cause__ / __context__、requests 与 urllib3 包装的原始异常）中找出证书校验失败的异常。
+
+    即 ssl.SSLCertVerificationError（Python 3.7 起），带 verify_code 与 verify_message；找不到时返回 None。
+    """
+    pending, seen = [exc], set()
+    while pending:
+        current = pending.pop()
+        if not isinstance(current, BaseException) or id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(getattr(current, "verify_code", None), int):
+            return current
+        pending.extend((current.__cause__, current.__context__))
+        pending.extend(arg for arg in current.args + (getattr(current, "reason", None),)
+                       if isinstance(arg, BaseException))
+    return None
+
+
+def match_hostname(host, names):
+    """主机名是否与证书中的名称匹配（支持最左一级的通配符，IP 地址须完全相同）。"""
+    host = host.lower().rstrip(".")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        address = None
+    for name in names:
+        name = name.lower().rstrip(".")
+        if address is not None:
+            try:
+                if ipaddress.ip_address(name) == address:
+                    return True
+            except ValueError:
+                pass
+            continue
+        if name == host:
+            return True
+        if name.startswith("*.") and "." in host and host.split(".", 1)[1] == name[2:]:
+            return True
+    return False
+
+
+def _intern(text):
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+def _name_field(name, field):
+    for rdn in name or ():
+        for key, value in rdn:
+            if key == field:
+                return value
+    return None
+
+
+def _verified_chain(ssl_object):
+    """证书链中除叶子证书外的证书信息（Python 3.13 起提供 get_verified_chain，更早的版本返回空元组）。"""
+    import ssl
+    get_chain = getattr(ssl_object, "get_verified_chain", None)
+    if get_chain is None:
+        return ()
+    try:
+        return tuple(cert.get_info() for cert in get_chain()[1:])
+    except (AttributeError, ValueError, ssl.SSLError):
+        return ()
@@ -0,0 +1,193 @@
+"""
+多节点协同模块
+多个监控实例通过共享目录交换探测结果：目标按一致性哈希分给若干个节点共同探测，
+多数节点（达到法定数）都探测失败才判定目标不可达，区分"网站挂了"与"本节点网络故障"
+
+共享目录中每个节点（分片模式下每个分片）一个结果文件 <节点ID>.json / <节点ID>@<分片>.json：
+    {"node": 节点ID, "ts": 写入时间, "results": {url: [是否可达, 探测时间]}}
+文件先写临时文件再原子替换，读取方不会读到半截内容；各节点的系统时间需保持同步（如 NTP）。
+"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from .shard import HashRing
+
+
+_NODE_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def validate(node_id, replicas, quorum):
+    """检查节点ID与法定数配置，无效时抛出 ValueError。"""
+    if not _NODE_ID.match(node_id or ""):
+        raise ValueError("节点ID只能包含字母、数字、下划线、点和减号: {}".format(node_id))
+    if quorum < 1 or replicas < quorum:
+        raise ValueError("多节点法定数无效: 需要 1 <= {} <= {}".format(quorum, replicas))
+
+
+class ClusterView:
+    """本节点看到的集群：存活节点、目标归属与各节点最近的探测结果。
+
+    - 节点的结果文件在 node_ttl 秒内更新过视为存活；存活节点变化时重新计算目标归属
+    - 每个目标归属 replicas 个节点（第一个为主节点，负责发送告警），其余节点不探测该目标
+    - 判定时只采用 result_max_age 秒内的结果；失败的节点数达到 quorum（存活的归属节点不足时取其数量）才判定不可达，
+      存活的归属节点结果缺失或过期、凭现有结果无法确定是否达到 quorum 时不作判定
+    """
+
+    def __init__(self, directory, node_id, part=None, replicas=3, quorum=2, node_ttl=30,
+                 result_max_age=180, sync_interval=5):
+        validate(node_id, replicas, quorum)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.node_id = node_id
+        self.replicas = replicas
+        self.quorum = quorum
+        self.node_ttl = node_ttl
+        self.result_max_age = result_max_age
+        self.sync_interval = sync_interval
+        name = node_id if part is None else "{}@{}".format(node_id, part)
+        self.path = self.directory / "{}.json".format(name)
+        self._results = {}  # 本节点的结果 url -> [是否可达, 探测时间]
+        self._urgent = False  # 有结果翻转，下次 sync 立即写出
+        self._last_write = 0.0
+        self._files = {}  # 文件名 -> (mtime_ns, size, 节点ID, 写入时间, 结果)
+        self._peers = {}  # 其他存活节点 -> {url: (是否可达, 探测时间)}
+        self._nodes = (node_id,)
+        self._ring = HashRing(self._nodes)
+        self._owners = {}  # url -> 归属节点列表（存活节点变化时清空）
+
+    @property
+    def nodes(self):
+        """当前存活的节点ID（含本节点），已排序。"""
+        return self._nodes
+
+    def owners(self, url):
+        owners = self._owners.get(url)
+        if owners is None:
+            owners = self._owners[url] = self._ring.nodes_for(url, self.replicas)
+        return owners
+
+    def owns(self, url):
+        return self.node_id in self.owners(url)
+
+    def is_primary(self, url):
+        return self.owners(url)[0] == self.node_id
+
+    def record(self, url, ok, ts):
+        """记录本节点的一次探测结果；可达性与上次不同时尽快写出，缩短其他节点达成判定的时间。"""
+        previous = self._results.get(url)
+        if previous is None or bool(previous[0]) != bool(ok):
+            self._urgent = True
+        self._results[url] = [1 if ok else 0, int(ts)]
+
+    def forget(self, url):
+        """不再探测的目标（归属已转给其他节点）不再发布结果。"""
+        if self._results.pop(url, None) is not None:
+            self._urgent = True
+
+    def decide(self, url, ok, now):
+        """结合各归属节点的最近结果判定目标是否可达。
+
+        其他归属节点仍存活但没有新近结果时（如本节点到它们的共享目录不通、或它们还没探测过该目标），
+        不能只凭本节点的结果下结论，否则本节点自身的网络故障会被当作网站不可达。
+
+        返回: (是否可达（无法判定时为 None）, 失败节点数, 参与判定的节点数)
+        """
+        owners = self.owners(url)
+        needed = min(self.quorum, len(owners))
+        failing = 0 if ok else 1
+        voters = 1
+        for node in owners:
+            if node == self.node_id:
+                continue
+            result = self._peers.get(node, {}).get(url)
+            if result is None or now - result[1] > self.result_max_age:
+                continue
+            voters += 1
+            if not result[0]:
+                failing += 1
+        if failing >= needed:
+            return False, failing, voters
+        # 缺失的结果即使都是失败也达不到法定数
+        if failing + len(owners) - voters < needed:
+            return True, failing, voters
+        return None, failing, voters
+
+    def sync(self, now=None):
+        """写出本节点的结果（到达间隔或有结果翻转时），读取其他节点更新过的文件。
+
+        返回: 存活节点是否有变化（有变化时调用方应按 owns() 重新分配探测目标）
+        """
+        now = time.time() if now is None else now
+        if self._urgent or now - self._last_write >= self.sync_interval:
+            self._write(now)
+        return self._read(now)
+
+    def close(self):
+        """退出时删除本节点的结果文件，其他节点立即重新分配目标。"""
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+    def _write(self, now):
+        data = {"node": self.node_id, "ts": int(now), "results": self._results}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            tmp_path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+            os.replace(str(tmp_path), str(self.path))
+        except OSError:
+            return
+        self._urgent = False
+        self._last_write = now
+
+    def _read(self, now):
+        changed = False
+        seen = set()
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            seen.add(path.name)
+            cached = self._files.get(path.name)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                entry = (stat.st_mtime_ns, stat.st_size, str(data["node"]), data["ts"], data.get("results") or {})
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            self._files[path.name] = entry
+            changed = changed or entry[2] != self.node_id
+        for name in list(self._files):
+            if name not in seen:
+                del self._files[name]
+                changed = True
+
+        live = {entry[2] for entry in self._files.values() if now - entry[3] <= self.node_ttl}
+        live.add(self.node_id)
+        nodes = tuple(sorted(live))
+        if changed or nodes != self._nodes:
+            # 只在有文件更新或存活节点变化时重建，同一节点多个分片的结果合并；
+            # 重新分片后同一目标可能同时出现在两个分片的文件中，取探测时间较新的结果
+            peers = {}
+            for _, _, node, ts, results in self._files.values():
+                if node == self.node_id or node not in live:
+                    continue
+                merged = peers.setdefault(node, {})
+                for url, result in results.items():
+                    if not isinstance(result, list) or len(result) != 2:
+                        continue
+                    current = merged.get(url)
+                    if current is None or result[1] > current[1]:
+                        merged[url] = result
+            self._peers = peers
+        if nodes == self._nodes:
+            return False
+        self._nodes = nodes
+        self._ring = HashRing(nodes)
+        self._owners = {}
+        return True
@@ -0,0 +1,284 @@
+"""
+DNS 缓存模块
+探测路径共享的进程内 DNS 缓存：按 TTL 缓存解析结果、缓存解析失败（负缓存）、条目数按 LRU 封顶，
+同一主机的并发解析合并为一次，解析失败时短时间内沿用过期的旧结果，避免 DNS 抖动被误报为网站不可达
+"""
+import asyncio
+import ipaddress
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict
+
+
+# DNS 报文：ID 标志 问题数 回答数 授权数 附加数
+_HEADER = struct.Struct("!HHHHHH")
+_RR = struct.Struct("!HHIH")  # 类型 类别 TTL 数据长度
+_TYPE_A = 1
+_TYPE_AAAA = 28
+_RCODE_NXDOMAIN = 3
+_FLAG_TC = 0x0200
+
+
+class _Entry:
+    __slots__ = ("addresses", "error", "expires", "stale_until")
+
+    def __init__(self, addresses, error, expires, stale_until):
+        self.addresses = addresses  # [(family, sockaddr)]，失败条目为 None
+        self.error = error  # 负缓存的错误信息
+        self.expires = expires
+        self.stale_until = stale_until  # 解析失败时可沿用旧结果的截止时间
+
+
+class DnsCache:
+    """进程内 DNS 缓存。
+
+    - 默认用系统解析器（getaddrinfo，遵循 hosts 文件），系统接口拿不到 TTL，结果缓存 ttl 秒
+    - 配置 nameservers 时直接向这些 DNS 服务器发 UDP 查询，按记录的 TTL 缓存（不超过 ttl 秒），不读 hosts 文件
+    - 解析失败缓存 negative_ttl 秒，期间同一主机直接返回失败；若有过期不超过 stale_ttl 秒的旧结果则沿用旧结果
+    - 条目超过 max_entries 时淘汰最久未使用的
+    - resolver 可替换为 async resolver(host) -> (addresses, ttl)，便于接入其他解析方式
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30, max_entries=10000, stale_ttl=300,
+                 nameservers=None, timeout=2, resolver=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.nameservers = [_parse_nameserver(item) for item in nameservers or []]
+        self.timeout = timeout
+        if resolver is None:
+            resolver = self._query_nameservers if self.nameservers else self._query_system
+        self._resolver = resolver
+        self._entries = OrderedDict()  # host -> _Entry，末尾为最近使用
+        self._pending = {}  # host -> 进行中的解析 Future
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def resolve(self, host, port, refresh=False):
+        """解析主机，返回 getaddrinfo 格式的地址列表；失败抛出 socket.gaierror。
+
+        refresh 为 True 时忽略未过期的缓存重新解析（用于冷连接探测），结果同样写回缓存。
+        """
+        literal = _literal_address(host)
+        if literal is not None:
+            return _addrinfo([literal], port)
+        entry = self._entries.get(host)
+        if entry is not None and not refresh and time.monotonic() < entry.expires:
+            self._entries.move_to_end(host)
+            if entry.error is not None:
+                self.negative_hits += 1
+                raise socket.gaierror(socket.EAI_NONAME, entry.error)
+            self.hits += 1
+            return _addrinfo(entry.addresses, port)
+
+        future = self._pending.get(host)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._lookup(host))
+            self._pending[host] = future
+            future.add_done_callback(lambda done: self._finish(host, done))
+        else:
+            self.coalesced += 1
+        # shield：某个探测超时取消时不影响其他等待同一解析的探测
+        addresses = await asyncio.shield(future)
+        return _addrinfo(addresses, port)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "evictions": self.evictions,
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.negative_hits = self.stale_hits = 0
+        self.coalesced = self.failures = self.evictions = 0
+
+    def clear(self):
+        self._entries.clear()
+
+    def _finish(self, host, future):
+        self._pending.pop(host, None)
+        # 取出异常，避免等待方都已取消时事件循环报告 "exception was never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    async def _lookup(self, host):
+        try:
+            addresses, ttl = await self._resolver(host)
+        except (OSError, asyncio.TimeoutError) as exc:
+            self.failures += 1
+            now = time.monotonic()
+            old = self._entries.get(host)
+            if old is not None and old.addresses and now < old.stale_until:
+                # 沿用旧结果，negative_ttl 秒后再尝试解析
+                self.stale_hits += 1
+                old.expires = now + self.negative_ttl
+                self._entries.move_to_end(host)
+                return old.addresses
+            reason = getattr(exc, "strerror", None) or str(exc) or exc.__class__.__name__
+            message = "DNS解析失败: {} - {}".format(host, reason)
+            self._store(host, _Entry(None, message, now + self.negative_ttl, 0))
+            raise socket.gaierror(getattr(exc, "errno", None) or socket.EAI_NONAME, message)
+        expires = time.monotonic() + max(1, min(ttl, self.ttl))
+        self._store(host, _Entry(addresses, None, expires, expires + self.stale_ttl))
+        return addresses
+
+    def _store(self, host, entry):
+        self._entries[host] = entry
+        self._entries.move_to_end(host)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _query_system(self, host):
+        loop = asyncio.get_event_loop()
+        infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addresses = []
+        for family, _, _, _, sockaddr in infos:
+            if (family, sockaddr) not in addresses:
+                addresses.append((family, sockaddr))
+        return addresses, self.ttl
+
+    async def _query_nameservers(self, host):
+        """向配置的 DNS 服务器查询 A 记录（没有时查询 AAAA），返回 (地址列表, 最小TTL)。"""
+        addresses, ttl = await self._query(host, _TYPE_A)
+        if not addresses:
+            addresses, ttl = await self._query(host, _TYPE_AAAA)
+        if not addresses:
+            raise socket.gaierror(socket.EAI_NONAME, "没有 A/AAAA 记录")
+        return addresses, ttl
+
+    async def _query(self, host, qtype):
+        try:
+            labels = host.rstrip(".").encode("idna").split(b".")
+        except UnicodeError:
+            raise socket.gaierror(socket.EAI_NONAME, "无效的主机名")
+        qname = b"".join(bytes([len(label)]) + label for label in labels) + b"\0"
+        last_exc = None
+        for nameserver in self.nameservers:
+            query_id = random.getrandbits(16)
+            packet = _HEADER.pack(query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack("!HH", qtype, 1)
+            try:
+                response = await asyncio.wait_for(_udp_exchange(nameserver, packet), self.timeout)
+            except (OSError, asyncio.TimeoutError) as exc:
+                last_exc = exc
+                continue
+            try:
+                return _parse_response(response, query_id, qtype)
+            except _Truncated:
+                # 应答被截断（需要 TCP），改用系统解析器
+                return await self._query_system(host)
+            except _Mismatch as exc:
+                # 伪造或迟到的报文：不中断整个查询，改问下一个 DNS 服务器
+                last_exc = exc
+            except (struct.error, IndexError) as exc:
+                last_exc = "应答格式错误: {}".format(exc)
+        raise socket.gaierror(socket.EAI_AGAIN, "DNS服务器无响应: {}".format(last_exc or ""))
+
+
+class _Truncated(Exception):
+    pass
+
+
+class _Mismatch(socket.gaierror):
+    """应答 ID 与查询不符或不是应答报文。"""
+
+
+def _literal_address(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    if address.version == 6:
+        return socket.AF_INET6, (host, 0, 0, 0)
+    return socket.AF_INET, (host, 0)
+
+
+def _addrinfo(addresses, port):
+    """把缓存的 (family, sockaddr) 转为带端口的 getaddrinfo 结果。"""
+    return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (sockaddr[0], port) + tuple(sockaddr[2:]))
+            for family, sockaddr in addresses]
+
+
+def _parse_nameserver(text):
+    """解析 DNS 服务器地址：8.8.8.8、127.0.0.1:5353、2001:db8::1、[2001:db8::1]:5353，返回 (地址, 端口)。"""
+    if text.startswith("["):
+        host, _, port = text[1:].partition("]")
+        return host, int(port.lstrip(":") or 53)
+    if text.count(":") == 1:
+        host, _, port = text.partition(":")
+        return host, int(port)
+    return text, 53
+
+
+async def _udp_exchange(nameserver, packet):
+    loop = asyncio.get_event_loop()
+    family = socket.AF_INET6 if ":" in nameserver[0] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(False)
+        await loop.sock_connect(sock, nameserver)
+        await loop.sock_sendall(sock, packet)
+        return await loop.sock_recv(sock, 4096)
+    finally:
+        sock.close()
+
+
+def _skip_name(data, pos):
+    while True:
+        length = data[pos]
+        if length == 0:
+            return pos + 1
+        if length & 0xC0 == 0xC0:
+            return pos + 2
+        pos += 1 + length
+
+
+def _parse_response(data, query_id, qtype):
+    """解析 DNS 应答，返回 (地址列表, 回答中最小的TTL)。"""
+    response_id, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(data)
+    if response_id != query_id or not flags & 0x8000:
+        raise _Mismatch(socket.EAI_AGAIN, "DNS应答不匹配")
+    if flags & _FLAG_TC:
+        raise _Truncated()
+    rcode = flags & 0x000F
+    if rcode == _RCODE_NXDOMAIN:
+        raise socket.gaierror(socket.EAI_NONAME, "域名不存在")
+    if rcode:
+        raise socket.gaierror(socket.EAI_AGAIN, "DNS服务器返回错误码 {}".format(rcode))
+    pos = _HEADER.size
+    for _ in range(qdcount):
+        pos = _skip_name(data, pos) + 4
+    addresses = []
+    min_ttl = None
+    for _ in range(ancount):
+        pos = _skip_name(data, pos)
+        rtype, _, ttl, rdlength = _RR.unpack_from(data, pos)
+        pos += _RR.size
+        rdata = data[pos:pos + rdlength]
+        pos += rdlength
+        # CNAME 链上各记录的 TTL 都计入
+        min_ttl = ttl if min_ttl is None else min(min_ttl, ttl)
+        if rtype == qtype == _TYPE_A and rdlength == 4:
+            addresses.append((socket.AF_INET, (socket.inet_ntop(socket.AF_INET, rdata), 0)))
+        elif rtype == qtype == _TYPE_AAAA and rdlength == 16:
+            addresses.append((socket.AF_INET6, (socket.inet_ntop(socket.AF_INET6, rdata), 0, 0, 0)))
+    return addresses, min_ttl or 0
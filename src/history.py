@@ -0,0 +1,501 @@
+"""
+检查历史模块
+以定长二进制记录追加保存每次检查结果，按天分文件，并按小时聚合建立索引用于区间可用率查询
+
+目录结构:
+    targets.json        目标ID表（URL 列表，下标即目标ID）
+    YYYY-MM-DD.bin      当天（UTC）的检查记录，每条 14 字节
+    YYYY-MM-DD.idx      当天按 (目标, 小时) 聚合的索引，每条 13 字节，按目标ID排序，
+                        末尾一条结尾记录保存索引覆盖到的 .bin 长度，缺失或过期时从 .bin 重建
+
+一条记录 14 字节：1000 个目标每分钟检查一次，一年约 7.4GB；因此原始记录默认只保留 30 天（约 600MB），
+更早的日期删除 .bin 只保留小时索引（每个目标每天最多 24 条，1000 个目标一年约 114MB），可用率统计不受影响。
+"""
+import argparse
+import bisect
+import calendar
+import itertools
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+
+
+# 时间戳(u32) 目标ID(u32) 状态码(u16, 0表示无) 耗时毫秒(u16, 封顶65535) 错误类别(u8) 标志位(u8)
+RECORD = struct.Struct("<IIHHBB")
+# 目标ID(u32) 小时(u8) 检查次数(u16) 可达次数(u16) 耗时毫秒合计(u32)
+INDEX_RECORD = struct.Struct("<IBHHI")
+# 索引结尾记录：目标ID(0xFFFFFFFF) 小时(0xFF) 索引覆盖的 .bin 长度(u64)，与索引记录等长且排在最后
+INDEX_TRAILER = struct.Struct("<IBQ")
+_TRAILER_ID = 0xFFFFFFFF
+
+FLAG_OK = 0x01
+FLAG_REUSED = 0x02
+FLAG_DEGRADED = 0x04
+
+# 错误类别编码，与 src.probe.ERROR_CLASSES 对应
+ERROR_CODES = {None: 0, "timeout": 1, "connect": 2, "dns": 3, "tls": 4, "http": 5, "protocol": 6, "content": 7, "other": 9}
+ERROR_NAMES = {code: name for name, code in ERROR_CODES.items()}
+
+_DAY_SECONDS = 86400
+_READ_BLOCK = RECORD.size * 4096
+
+
+def _day_name(day):
+    return time.strftime("%Y-%m-%d", time.gmtime(day * _DAY_SECONDS))
+
+
+def _day_from_name(name):
+    return calendar.timegm(time.strptime(name, "%Y-%m-%d")) // _DAY_SECONDS
+
+
+class HistoryRecord:
+    """一条检查历史"""
+
+    __slots__ = ("ts", "status_code", "latency_ms", "error_class", "ok", "reused", "degraded")
+
+    def __init__(self, ts, status_code, latency_ms, error_class, ok, reused, degraded=False):
+        self.ts = ts
+        self.status_code = status_code
+        self.latency_ms = latency_ms
+        self.error_class = error_class
+        self.ok = ok
+        self.reused = reused
+        self.degraded = degraded
+
+
+class HourBuckets:
+    """一天内按 (目标ID, 小时) 聚合的检查次数、可达次数与耗时合计。
+
+    以目标ID * 24 + 小时为下标存入定长整数数组，每个目标固定占用 24 * 16 字节，
+    十万个目标每分钟检查一次时一天的聚合约 38MB，不随检查次数增长，也不为每个小时创建 Python 对象。
+    """
+
+    __slots__ = ("totals", "oks", "latencies")
+
+    # 按目标数扩容的步长，避免逐个目标扩容数组
+    _GROW = 1024
+
+    def __init__(self):
+        self.totals = array("I")
+        self.oks = array("I")
+        self.latencies = array("Q")
+
+    def add(self, target_id, hour, total, ok, latency_ms):
+        """累加一个 (目标, 小时) 的聚合值，一次检查为 total=1、ok=1 或 0。"""
+        index = target_id * 24 + hour
+        if index >= len(self.totals):
+            self._grow(target_id)
+        self.totals[index] += total
+        self.oks[index] += ok
+        self.latencies[index] += latency_ms
+
+    def get(self, target_id, hour):
+        """返回 (检查次数, 可达次数, 耗时合计)，没有记录时返回 None。"""
+        index = target_id * 24 + hour
+        if index >= len(self.totals) or not self.totals[index]:
+            return None
+        return self.totals[index], self.oks[index], self.latencies[index]
+
+    def rows(self, target_id):
+        """返回某目标有记录的 [(小时, 检查次数, 可达次数, 耗时合计)]，与从索引文件读取的格式相同。"""
+        return [(hour,) + bucket for hour, bucket in
+                ((hour, self.get(target_id, hour)) for hour in range(24)) if bucket]
+
+    def items(self):
+        """按 (目标ID, 小时) 顺序逐个返回有记录的 (目标ID, 小时, 检查次数, 可达次数, 耗时合计)。"""
+        for index, total in enumerate(self.totals):
+            if total:
+                yield index // 24, index % 24, total, self.oks[index], self.latencies[index]
+
+    def _grow(self, target_id):
+        size = (target_id // self._GROW + 1) * self._GROW * 24 - len(self.totals)
+        for values in (self.totals, self.oks, self.latencies):
+            values.frombytes(bytes(size * values.itemsize))
+
+
+class _IndexRows:
+    """按目标ID二分查找 .idx 文件，只读取单个目标的（最多 24 条）小时索引。"""
+
+    def __init__(self, f, count):
+        self._f = f
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        self._f.seek(position * INDEX_RECORD.size)
+        return struct.unpack("<I", self._f.read(4))[0]
+
+    def read(self, target_id):
+        """返回某目标的 [(小时, 检查次数, 可达次数, 耗时合计)]。"""
+        start = bisect.bisect_left(self, target_id)
+        self._f.seek(start * INDEX_RECORD.size)
+        count = min(24, self._count - start)
+        data = self._f.read(count * INDEX_RECORD.size)
+        data = data[:len(data) - len(data) % INDEX_RECORD.size]
+        rows = []
+        for tid, hour, total, ok, latency in INDEX_RECORD.iter_unpack(data):
+            if tid != target_id:
+                break
+            rows.append((hour, total, ok, latency))
+        return rows
+
+
+class HistoryStore:
+    """追加写入的检查历史。
+
+    写入先进入内存缓冲，距上次写入超过 flush_interval 秒时追加到当天文件；
+    当天的小时聚合保存在内存中（HourBuckets），换天或关闭时写出索引文件，
+    运行中每隔 index_interval 秒在写入记录后也写出一次当天的索引，重启时只需从索引覆盖到的位置之后重建。
+    新目标的ID随下一次写入记录一并保存到 targets.json（先于记录写入），首轮检查大量新目标时不必逐个重写该文件。
+    早于当天的记录（跨零点完成的探测、时钟回拨）写入所属日期的文件，该天的索引在下次查询时重建；
+    所属日期已超过保留天数或已压缩时丢弃，计入 dropped。
+    超过 raw_days 天的日期只保留小时索引（为0时不压缩），超过 retention_days 天的全部删除（为0时不删除）。
+    """
+
+    def __init__(self, directory, retention_days=365, flush_interval=5, index_interval=300, raw_days=30):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self.raw_days = raw_days
+        self.flush_interval = flush_interval
+        self.index_interval = index_interval
+        self._targets_file = self.directory / "targets.json"
+        self._ids = {}
+        self._urls = []
+        self._load_targets()
+        self._targets_dirty = False  # 有尚未写入 targets.json 的新目标
+        self._buffer = bytearray()
+        self._late = {}  # 日期 -> 早于当天的记录
+        self.dropped = 0
+        self._last_flush = time.monotonic()
+        self._last_index = self._last_flush
+        self._day = None  # 当前写入的日期（UTC天数）
+        self._buckets = HourBuckets()
+
+    def target_id(self, url, create=True):
+        """URL 对应的目标ID，新目标分配新ID（在下一次 flush() 时写入 targets.json）。"""
+        target_id = self._ids.get(url)
+        if target_id is None and create:
+            target_id = len(self._urls)
+            self._urls.append(url)
+            self._ids[url] = target_id
+            self._targets_dirty = True
+        return target_id
+
+    def append(self, url, ts, status_code, latency_ms, error_class, ok, reused=False, degraded=False):
+        """追加一条检查记录（写入缓冲）。"""
+        ts = int(ts)
+        day = ts // _DAY_SECONDS
+        if self._day is None or day > self._day:
+            self._rollover(day)
+        elif day < self._day and not self._writable(day):
+            self.dropped += 1
+            return
+        target_id = self.target_id(url)
+        latency_ms = min(int(latency_ms or 0), 0xFFFF)
+        flags = (FLAG_OK if ok else 0) | (FLAG_REUSED if reused else 0) | (FLAG_DEGRADED if degraded else 0)
+        record = RECORD.pack(ts, target_id, status_code or 0, latency_ms,
+                             ERROR_CODES.get(error_class, ERROR_CODES["other"]), flags)
+        if day < self._day:
+            # 不计入当天的聚合；该天的索引因覆盖长度与记录文件不符，查询时重建
+            self._late.setdefault(day, bytearray()).extend(record)
+            return
+        self._buffer += record
+        self._add_bucket(self._buckets, target_id, ts, ok, latency_ms)
+
+    def maybe_flush(self):
+        if (self._buffer or self._late) and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把缓冲中的记录追加到当天文件。"""
+        if self._targets_dirty:
+            # 先保存目标ID表，记录文件中不会出现 targets.json 里没有的目标ID
+            tmp_path = self._targets_file.with_name(self._targets_file.name + ".tmp")
+            tmp_path.write_text(json.dumps(self._urls, ensure_ascii=False), encoding="utf-8")
+            os.replace(str(tmp_path), str(self._targets_file))
+            self._targets_dirty = False
+        for day, records in self._late.items():
+            self._append_records(day, records)
+        self._late = {}
+        now = time.monotonic()
+        if self._buffer:
+            with open(str(self._bin_path(self._day)), "ab") as f:
+                f.write(self._buffer)
+                size = f.tell()
+            self._buffer = bytearray()
+            # 缓冲已全部写入，内存中的聚合与文件内容一致，可以写出覆盖到 size 的索引
+            if now - self._last_index >= self.index_interval:
+                self._write_index(self._day, self._buckets, size)
+                self._last_index = now
+        self._last_flush = now
+
+    def close(self):
+        self.flush()
+        if self._day is not None:
+            self._write_index(self._day, self._buckets)
+
+    def query(self, url, start_ts, end_ts):
+        """按时间区间 [start_ts, end_ts) 逐条返回某目标的检查记录。"""
+        target_id = self.target_id(url, create=False)
+        if target_id is None:
+            return
+        self.flush()
+        for day in range(int(start_ts) // _DAY_SECONDS, int(end_ts - 1) // _DAY_SECONDS + 1):
+            for ts, tid, status, latency, error, flags in self._iter_day(day):
+                if tid == target_id and start_ts <= ts < end_ts:
+                    yield HistoryRecord(ts, status or None, latency, ERROR_NAMES.get(error, "other"),
+                                        bool(flags & FLAG_OK), bool(flags & FLAG_REUSED), bool(flags & FLAG_DEGRADED))
+
+    def uptime(self, url, start_ts, end_ts):
+        """统计区间内的检查次数、可达次数、可用率与平均耗时，按小时粒度（含区间两端所在的整小时）。"""
+        target_id = self.target_id(url, create=False)
+        total = ok = latency_sum = 0
+        if self._late:
+            self.flush()
+        if target_id is not None:
+            first_hour = int(start_ts) // 3600
+            last_hour = int(end_ts - 1) // 3600
+            for day in range(first_hour // 24, last_hour // 24 + 1):
+                rows = self._buckets.rows(target_id) if day == self._day else self._index_rows(day, target_id)
+                for hour, hour_total, hour_ok, hour_latency in rows:
+                    if first_hour <= day * 24 + hour <= last_hour:
+                        total += hour_total
+                        ok += hour_ok
+                        latency_sum += hour_latency
+        return {
+            "total": total,
+            "ok": ok,
+            "uptime": ok / total if total else None,
+            "avg_latency_ms": latency_sum / total if total else None,
+        }
+
+    def _load_targets(self):
+        try:
+            self._urls = json.loads(self._targets_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._urls = []
+        self._urls = [sys.intern(url) for url in self._urls]
+        self._ids = {url: i for i, url in enumerate(self._urls)}
+
+    def _bin_path(self, day):
+        return self.directory / "{}.bin".format(_day_name(day))
+
+    def _idx_path(self, day):
+        return self.directory / "{}.idx".format(_day_name(day))
+
+    def _writable(self, day):
+        """早于当天的日期是否仍保留原始记录（未超过保留天数、未压缩）。"""
+        for days in (self.retention_days, self.raw_days):
+            if days and day < self._day - days:
+                return False
+        return True
+
+    def _append_records(self, day, records):
+        """把早于当天的记录追加到所属日期的文件，先截掉异常退出时写了一半的尾部记录。"""
+        path = self._bin_path(day)
+        with open(str(path), "ab") as f:
+            size = f.tell()
+            if size % RECORD.size:
+                f.truncate(size - size % RECORD.size)
+            f.write(records)
+
+    def _rollover(self, day):
+        """切换到新的一天：写出前一天的索引，载入新一天已有的记录，清理过期文件。"""
+        if self._day is not None:
+            self.flush()
+            self._write_index(self._day, self._buckets)
+        self._day = day
+        path = self._bin_path(day)
+        size = 0
+        if path.exists():
+            # 截掉异常退出时写了一半的尾部记录，保证后续追加的记录对齐
+            size = path.stat().st_size
+            if size % RECORD.size:
+                size -= size % RECORD.size
+                os.truncate(str(path), size)
+        # 从上次写出的索引继续，只重建索引之后追加的记录
+        buckets, covered = self._read_index(day, size)
+        if buckets is None:
+            buckets, covered = HourBuckets(), 0
+        for ts, target_id, _, latency, _, flags in self._iter_day(day, covered):
+            self._add_bucket(buckets, target_id, ts, flags & FLAG_OK, latency)
+        self._buckets = buckets
+        self._last_index = time.monotonic()
+        self._cleanup(day)
+
+    def _iter_day(self, day, offset=0):
+        path = self._bin_path(day)
+        if not path.exists():
+            return
+        with open(str(path), "rb") as f:
+            f.seek(offset)
+            while True:
+                block = f.read(_READ_BLOCK)
+                if not block:
+                    break
+                # 忽略异常退出时写了一半的尾部记录
+                usable = len(block) - len(block) % RECORD.size
+                for record in RECORD.iter_unpack(block[:usable]):
+                    yield record
+
+    @staticmethod
+    def _add_bucket(buckets, target_id, ts, ok, latency_ms):
+        buckets.add(target_id, (ts // 3600) % 24, 1, 1 if ok else 0, latency_ms)
+
+    def _build_buckets(self, day, size=None):
+        """从记录重建某天的聚合，size 为只读取的 .bin 长度（其他进程可能正在追加），默认读到文件末尾。"""
+        buckets = HourBuckets()
+        records = self._iter_day(day)
+        if size is not None:
+            records = itertools.islice(records, size // RECORD.size)
+        for ts, target_id, _, latency, _, flags in records:
+            self._add_bucket(buckets, target_id, ts, flags & FLAG_OK, latency)
+        return buckets
+
+    def _write_index(self, day, buckets, covered=None):
+        """写出某天的索引（按目标ID、小时排序），covered 为索引覆盖到的 .bin 长度，默认为当前文件长度。"""
+        data = b"".join(
+            INDEX_RECORD.pack(target_id, hour, min(total, 0xFFFF), min(ok, 0xFFFF), min(latency, 0xFFFFFFFF))
+            for target_id, hour, total, ok, latency in buckets.items()
+        )
+        if not data:
+            return
+        if covered is None:
+            try:
+                covered = self._bin_path(day).stat().st_size
+            except OSError:
+                covered = 0
+        path = self._idx_path(day)
+        # 按进程区分临时文件：命令行查询可能与运行中的监控同时重建同一天的索引
+        tmp_path = path.with_name("{}.{}.tmp".format(path.name, os.getpid()))
+        tmp_path.write_bytes(data + INDEX_TRAILER.pack(_TRAILER_ID, 0xFF, covered))
+        os.replace(str(tmp_path), str(path))
+
+    @staticmethod
+    def _index_state(f, bin_path, bin_size):
+        """返回索引文件 f 的 (索引记录数, 覆盖到的 .bin 长度)；
+        没有结尾记录的旧索引不比记录文件旧时视为覆盖整个文件，否则覆盖长度为 None；
+        bin_size 为 None 表示记录文件已压缩删除，索引即该天的全部数据。"""
+        stat = os.fstat(f.fileno())
+        count = stat.st_size // INDEX_RECORD.size
+        if count:
+            f.seek((count - 1) * INDEX_RECORD.size)
+            target_id, hour, covered = INDEX_TRAILER.unpack(f.read(INDEX_TRAILER.size))
+            if target_id == _TRAILER_ID and hour == 0xFF:
+                return count - 1, covered
+        if bin_size is None:
+            return count, None
+        if stat.st_mtime >= bin_path.stat().st_mtime:
+            return count, bin_size
+        return count, None
+
+    def _read_index(self, day, bin_size):
+        """读入某天的全部索引，返回 (HourBuckets, 覆盖到的 .bin 长度)；索引缺失或与记录文件不符时返回 (None, 0)。"""
+        bin_path = self._bin_path(day)
+        try:
+            with open(str(self._idx_path(day)), "rb") as f:
+                count, covered = self._index_state(f, bin_path, bin_size)
+                if covered is None or covered > bin_size or covered % RECORD.size:
+                    return None, 0
+                f.seek(0)
+                data = f.read(count * INDEX_RECORD.size)
+        except OSError:
+            return None, 0
+        buckets = HourBuckets()
+        for target_id, hour, total, ok, latency in INDEX_RECORD.iter_unpack(data):
+            buckets.add(target_id, hour, total, ok, latency)
+        return buckets, covered
+
+    def _index_rows(self, day, target_id):
+        """读取某天某目标的小时索引 [(小时, 检查次数, 可达次数, 耗时合计)]，
+        在按目标ID排序的索引中二分查找，只读取该目标的记录；索引缺失或过期时从记录重建。"""
+        bin_path = self._bin_path(day)
+        bin_size = self._bin_size(day)
+        try:
+            with open(str(self._idx_path(day)), "rb") as f:
+                count, covered = self._index_state(f, bin_path, bin_size)
+                if bin_size is None or covered == bin_size:
+                    return _IndexRows(f, count).read(target_id)
+        except OSError:
+            pass
+        if bin_size is None:
+            return []
+        buckets = self._build_buckets(day, bin_size)
+        self._write_index(day, buckets, bin_size)
+        return buckets.rows(target_id)
+
+    def _bin_size(self, day):
+        """某天记录文件中完整记录的长度，文件不存在时返回 None。"""
+        try:
+            size = self._bin_path(day).stat().st_size
+        except OSError:
+            return None
+        return size - size % RECORD.size
+
+    def _compact(self, day):
+        """删除某天的原始记录，只保留小时索引；索引缺失或过期时先重建。"""
+        bin_path = self._bin_path(day)
+        bin_size = self._bin_size(day)
+        if bin_size is None:
+            return
+        try:
+            with open(str(self._idx_path(day)), "rb") as f:
+                _, covered = self._index_state(f, bin_path, bin_size)
+        except OSError:
+            covered = None
+        if covered != bin_size:
+            self._write_index(day, self._build_buckets(day, bin_size), bin_size)
+        bin_path.unlink()
+
+    def _cleanup(self, today):
+        """删除超过保留天数的历史文件，原始记录超过 raw_days 天的日期只保留小时索引。"""
+        for path in self.directory.glob("*-*-*.*"):
+            try:
+                day = _day_from_name(path.name.split(".", 1)[0])
+            except ValueError:
+                continue
+            try:
+                if self.retention_days and day < today - self.retention_days:
+                    path.unlink()
+                elif self.raw_days and path.suffix == ".bin" and day < today - self.raw_days:
+                    self._compact(day)
+            except OSError:
+                continue
+
+
+def main(argv=None):
+    """命令行查询：python -m src.history <历史目录> <URL> [--days N] [--records]"""
+    parser = argparse.ArgumentParser(description="查询检查历史")
+    parser.add_argument("directory", help="历史目录，如 rundata/history")
+    parser.add_argument("url", help="目标URL")
+    parser.add_argument("--days", type=float, default=30, help="统计最近多少天（默认30）")
+    parser.add_argument("--records", action="store_true", help="逐条输出检查记录")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.directory, retention_days=0)
+    end_ts = int(time.time()) + 1
+    start_ts = end_ts - int(args.days * _DAY_SECONDS)
+    if args.records:
+        for record in store.query(args.url, start_ts, end_ts):
+            print("{}  {}  {}ms  {}  {}".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.ts)),
+                record.status_code or "-", record.latency_ms,
+                ("SLOW" if record.degraded else "OK") if record.ok else "NG",
+                record.error_class or ""))
+    stats = store.uptime(args.url, start_ts, end_ts)
+    if stats["total"]:
+        print("最近 {} 天: 检查 {} 次，可达 {} 次，可用率 {:.3f}%，平均耗时 {:.0f}ms".format(
+            args.days, stats["total"], stats["ok"], stats["uptime"] * 100, stats["avg_latency_ms"]))
+    else:
+        print("最近 {} 天没有 {} 的检查记录".format(args.days, args.url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+主机限流模块
+按主机限制探测速率（令牌桶）与同时进行的探测数，同一主机下的多个目标（API 端点、各地区页面）不会在同一时刻一起打到源站；
+被限流的探测排队等待而不是丢弃，排队时间单独统计，不计入探测耗时
+"""
+import asyncio
+import math
+import time
+from collections import deque
+
+
+class _Host:
+    __slots__ = ("tokens", "updated", "active", "waiters", "timer")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens  # 令牌桶中剩余的令牌数
+        self.updated = now  # 上次补充令牌的时间
+        self.active = 0  # 已放行、尚未结束的探测数
+        self.waiters = deque()  # 排队中的 Future，按到达顺序放行
+        self.timer = None  # 等待补充令牌的定时器（空闲时为令牌补满后清理状态的定时器）
+
+
+class HostLimiter:
+    """按主机的令牌桶与并发上限。
+
+    - rate: 每个主机每秒最多发起的探测数，0 表示不限速；burst 为令牌桶容量（允许的瞬时突发数），默认与 rate 相同
+    - max_active: 每个主机同时进行的探测数上限，0 表示不限
+    - 同一主机的探测按到达顺序放行；空闲且令牌已满的主机不保留状态，主机数量不影响内存占用
+    - waited / wait_total / wait_max 为需要排队的探测数、累计与最长排队时间（秒），由调用方定期 reset_stats()
+    """
+
+    def __init__(self, rate=0.0, burst=0, max_active=0, clock=time.monotonic):
+        self.rate = max(0.0, rate)
+        self.burst = max(1, burst or int(math.ceil(self.rate)))
+        self.max_active = max(0, max_active)
+        self._clock = clock
+        self._hosts = {}  # host -> _Host
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def enabled(self):
+        return self.rate > 0 or self.max_active > 0
+
+    def queued(self):
+        """正在排队等待放行的探测数。"""
+        # 可能在指标服务线程中调用，先复制再遍历
+        states = list(self._hosts.values())
+        return sum(1 for state in states for future in list(state.waiters) if not future.done())
+
+    async def acquire(self, host):
+        """等待该主机放行，返回排队等待的秒数；放行后无论探测成败都需调用 release(host)。"""
+        state = self._hosts.get(host)
+        now = self._clock()
+        if state is None:
+            state = self._hosts[host] = _Host(self.burst, now)
+        elif state.timer is not None and not state.waiters:
+            # 没有排队时的定时器只用于空闲后的清理，取消后由 _dispatch 按需重新设置
+            state.timer.cancel()
+            state.timer = None
+        if not state.waiters and self._take(state, now):
+            return 0.0
+        future = asyncio.get_event_loop().create_future()
+        state.waiters.append(future)
+        self._dispatch(host)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 放行与取消同时发生时归还名额，否则该 Future 已取消，放行时跳过
+            if future.done() and not future.cancelled():
+                self.release(host)
+            raise
+        wait = self._clock() - now
+        self.waited += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        return wait
+
+    def release(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            return
+        state.active -= 1
+        if state.waiters:
+            self._dispatch(host)
+        self._cleanup(host, state)
+
+    def stats(self):
+        """排队统计（秒）。"""
+        return {
+            "queued": self.queued(),
+            "waited": self.waited,
+            "avg_wait": self.wait_total / self.waited if self.waited else 0.0,
+            "max_wait": self.wait_max,
+        }
+
+    def reset_stats(self):
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _refill(self, state, now):
+        if self.rate:
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+
+    def _take(self, state, now):
+        """有空闲名额与令牌时占用并返回 True。"""
+        if self.max_active and state.active >= self.max_active:
+            return False
+        self._refill(state, now)
+        if self.rate:
+            if state.tokens < 1:
+                return False
+            state.tokens -= 1
+        state.active += 1
+        return True
+
+    def _dispatch(self, host):
+        """按到达顺序放行排队的探测；缺令牌时在令牌补足时再放行，缺名额时等 release()。"""
+        state = self._hosts.get(host)
+        if state is None:
+            return
+        while state.waiters:
+            future = state.waiters[0]
+            if future.done():
+                state.waiters.popleft()
+                continue
+            if not self._take(state, self._clock()):
+                if state.timer is None and not (self.max_active and state.active >= self.max_active):
+                    delay = (1 - state.tokens) / self.rate
+                    state.timer = asyncio.get_event_loop().call_later(delay, self._on_timer, host)
+                return
+            state.waiters.popleft()
+            future.set_result(None)
+
+    def _on_timer(self, host):
+        state = self._hosts.get(host)
+        if state is not None:
+            state.timer = None
+            self._dispatch(host)
+            # 排队的探测可能都已取消
+            self._cleanup(host, state)
+
+    def _cleanup(self, host, state):
+        """主机没有排队与进行中的探测时删除其状态；令牌未满时在补满后再删除，避免删除后多放行一轮突发。"""
+        if state.waiters or state.active > 0 or state.timer is not None:
+            return
+        self._refill(state, self._clock())
+        if state.tokens >= self.burst:
+            del self._hosts[host]
+        else:
+            delay = (self.burst - state.tokens) / self.rate
+            state.timer = asyncio.get_event_loop().call_later(delay, self._on_timer, host)
@@ -0,0 +1,314 @@
+"""
+HTTP/2 探测模块
+同一源站（scheme, host, port）的多个目标复用一条 HTTP/2 连接，各探测作为不同的流并发进行；
+TLS 握手时通过 ALPN 协商，服务器不支持 h2 时该源站改用 HTTP/1.1。依赖 h2 库（pip install h2），未安装时不可用
+"""
+import asyncio
+import time
+from collections import deque
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+    import h2.errors
+except ImportError:
+    h2 = None  # 未安装 h2 时只能使用 HTTP/1.1 探测
+
+
+# TLS 握手时按顺序提供的 ALPN 协议
+ALPN_PROTOCOLS = ["h2", "http/1.1"]
+
+_READ_CHUNK = 64 * 1024
+
+
+def available():
+    """是否已安装 h2 库。"""
+    return h2 is not None
+
+
+class _Stream:
+    """一个请求流的响应：响应头、已收到未读取的数据块与结束状态。"""
+
+    __slots__ = ("stream_id", "headers", "chunks", "ended", "error", "waiter")
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.headers = None  # 小写键名的响应头字典，含 ":status"
+        self.chunks = deque()  # [(数据, 计入流量控制的字节数)]
+        self.ended = False
+        self.error = None
+        self.waiter = None
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def wait(self):
+        self.waiter = asyncio.get_event_loop().create_future()
+        await self.waiter
+
+
+class Http2Connection:
+    """一条 HTTP/2 连接，后台任务读取并分发服务器发来的帧，多个探测作为不同的流并发复用。"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        self._conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=True, header_encoding=None))
+        self._conn.initiate_connection()
+        self._streams = {}  # stream_id -> _Stream
+        self._error = None  # 连接失效的原因
+        self._flush()
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    def is_usable(self, idle_timeout):
+        """连接未失效、未收到 GOAWAY，且有流在进行或空闲未超过 idle_timeout 时可继续复用。"""
+        if self._error is not None or self.writer.transport.is_closing():
+            return False
+        return bool(self._streams) or time.monotonic() - self.last_used < idle_timeout
+
+    def has_capacity(self):
+        """并发流数未达到服务器的上限。"""
+        return self._conn.open_outbound_streams < self._conn.remote_settings.max_concurrent_streams
+
+    @property
+    def active_streams(self):
+        return len(self._streams)
+
+    def request(self, method, authority, path, user_agent, extra_headers=()):
+        """发出一个请求（无请求体），返回 _Stream；随后用 response() / read_body() / end() 读取响应。"""
+        if self._error is not None:
+            raise self._error
+        stream_id = self._conn.get_next_available_stream_id()
+        headers = [
+            (":method", method),
+            (":scheme", "https"),
+            (":authority", authority),
+            (":path", path),
+            ("user-agent", user_agent),
+            ("accept", "*/*"),
+        ]
+        headers.extend(extra_headers)
+        stream = self._streams[stream_id] = _Stream(stream_id)
+        self._conn.send_headers(stream_id, headers, end_stream=True)
+        self._flush()
+        return stream
+
+    async def response(self, stream):
+        """等待响应头，返回 (状态码, 小写键名的响应头字典)。"""
+        while stream.headers is None:
+            self._check(stream)
+            await stream.wait()
+        return int(stream.headers[":status"]), stream.headers
+
+    async def read_body(self, stream, limit=None, feed=None):
+        """读取并丢弃响应体，最多读取 limit 字节（None 表示不限）；feed 返回 True 时提前停止。
+
+        返回: (响应体是否已完整读完, 读取的字节数)
+        """
+        total = 0
+        while True:
+            while stream.chunks:
+                data, flow = stream.chunks.popleft()
+                self._acknowledge(stream.stream_id, flow)
+                if limit is not None and total + len(data) > limit:
+                    data = data[:limit - total]
+                total += len(data)
+                if (feed is not None and data and feed(data)) or (limit is not None and total >= limit):
+                    return stream.ended and not stream.chunks, total
+            if stream.ended:
+                return True, total
+            self._check(stream)
+            await stream.wait()
+
+    def end(self, stream):
+        """结束对流的读取；响应未读完时重置该流，不影响同一连接上的其他流。"""
+        self._streams.pop(stream.stream_id, None)
+        self.last_used = time.monotonic()
+        for _, flow in stream.chunks:
+            self._acknowledge(stream.stream_id, flow)
+        stream.chunks.clear()
+        if not stream.ended and self._error is None:
+            try:
+                self._conn.reset_stream(stream.stream_id, h2.errors.ErrorCodes.CANCEL)
+            except h2.exceptions.H2Error:
+                pass
+        self._flush()
+        if self._error is not None and not self._streams:
+            # 已失效（如收到 GOAWAY）的连接在最后一个流结束后关闭
+            self.writer.close()
+
+    def close(self):
+        if self._error is None:
+            try:
+                self._conn.close_connection()
+                self._flush()
+            except h2.exceptions.H2Error:
+                pass
+            self._fail(ConnectionError("HTTP/2 连接已关闭"))
+        self._reader_task.cancel()
+        self.writer.close()
+
+    def _check(self, stream):
+        if stream.error is not None:
+            raise stream.error
+        if self._error is not None:
+            raise self._error
+
+    def _acknowledge(self, stream_id, flow):
+        if flow and self._error is None:
+            try:
+                self._conn.acknowledge_received_data(flow, stream_id)
+            except h2.exceptions.H2Error:
+                pass
+
+    def _flush(self):
+        data = self._conn.data_to_send()
+        if data and not self.writer.transport.is_closing():
+            self.writer.write(data)
+
+    def _fail(self, exc):
+        if self._error is None:
+            self._error = exc
+        for stream in self._streams.values():
+            stream.wake()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                data = await self.reader.read(_READ_CHUNK)
+                if not data:
+                    raise ConnectionError("HTTP/2 连接被服务器关闭")
+                for event in self._conn.receive_data(data):
+                    self._handle(event)
+                self._flush()
+        except asyncio.CancelledError:
+            self._fail(ConnectionError("HTTP/2 连接已关闭"))
+        except h2.exceptions.ProtocolError as exc:
+            self._fail(ValueError("HTTP/2 协议错误: {}".format(exc)))
+        except Exception as exc:
+            self._fail(exc)
+
+    def _handle(self, event):
+        stream = self._streams.get(getattr(event, "stream_id", None))
+        if isinstance(event, h2.events.ResponseReceived):
+            if stream is not None:
+                stream.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                                  for name, value in event.headers}
+                stream.wake()
+        elif isinstance(event, h2.events.DataReceived):
+            if stream is None:
+                # 已结束读取的流上仍在传输的数据，直接归还流量控制窗口
+                self._acknowledge(event.stream_id, event.flow_controlled_length)
+            else:
+                stream.chunks.append((event.data, event.flow_controlled_length))
+                stream.wake()
+        elif isinstance(event, h2.events.StreamEnded):
+            if stream is not None:
+                stream.ended = True
+                stream.wake()
+        elif isinstance(event, h2.events.StreamReset):
+            if stream is not None:
+                stream.error = ConnectionError("HTTP/2 流被服务器重置（错误码 {}）".format(event.error_code))
+                stream.wake()
+        elif isinstance(event, h2.events.ConnectionTerminated):
+            # GOAWAY：不再复用该连接。h2 收到 GOAWAY 后不再接受任何帧，进行中的流都会失败，
+            # 复用该连接的探测由调用方换一条新连接重试
+            self._error = ConnectionError("HTTP/2 连接被服务器关闭（GOAWAY，错误码 {}）".format(event.error_code))
+            for stream_id, pending in self._streams.items():
+                if event.last_stream_id is None or stream_id > event.last_stream_id:
+                    pending.error = self._error
+                pending.wake()
+
+
+class Http2Pool:
+    """按源站 (scheme, host, port) 保存共享的 HTTP/2 连接。
+
+    同一源站同时发起的多个探测只建一条连接（其余探测等待握手完成后复用）；
+    ALPN 未协商出 h2 的源站记入 h1_origins，h1_retry 秒内直接走 HTTP/1.1 连接池，之后重新协商（源站可能已升级）。
+    """
+
+    def __init__(self, idle_timeout=120, h1_retry=600):
+        if h2 is None:
+            raise RuntimeError("HTTP/2 探测需要安装 h2: pip install h2")
+        self.idle_timeout = idle_timeout
+        self.h1_retry = h1_retry
+        self.h1_origins = {}  # key -> 重新协商的时间（monotonic）
+        self._sessions = {}  # key -> Http2Connection
+        self._pending = {}  # key -> 正在建立连接的 Future
+
+    async def get(self, key, connect, negotiated):
+        """取得该源站的 HTTP/2 连接。
+
+        connect 为建立新连接的协程函数，返回 probe.Connection；negotiated(conn) 返回 ALPN 协商出的协议。
+        返回: (Http2Connection 或 None, 未协商出 h2 时刚建好的 HTTP/1.1 连接或 None, 是否复用了已有连接)
+        两者都为 None 时调用方改用 HTTP/1.1 连接池（源站不支持 h2，或共享连接的并发流已满）。
+        """
+        while True:
+            session = self._sessions.get(key)
+            if session is not None:
+                if session.is_usable(self.idle_timeout):
+                    return (session, None, True) if session.has_capacity() else (None, None, False)
+                del self._sessions[key]
+                if not session.active_streams:
+                    session.close()
+            if self.is_h1_origin(key):
+                return None, None, False
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            # 等待其他探测完成握手；握手失败或被取消时自己重新建立
+            await asyncio.shield(pending)
+
+        future = self._pending[key] = asyncio.get_event_loop().create_future()
+        try:
+            conn = await connect()
+            if negotiated(conn) != "h2":
+                self.h1_origins[key] = time.monotonic() + self.h1_retry
+                return None, conn, False
+            session = self._sessions[key] = self.open(conn)
+            return session, None, False
+        finally:
+            del self._pending[key]
+            future.set_result(None)
+
+    def is_h1_origin(self, key):
+        """该源站是否在回退期内（未协商出 h2），过期的记录在这里删除。"""
+        retry_at = self.h1_origins.get(key)
+        if retry_at is None:
+            return False
+        if time.monotonic() < retry_at:
+            return True
+        del self.h1_origins[key]
+        return False
+
+    def open(self, conn):
+        """在已协商出 h2 的连接（probe.Connection）上开始 HTTP/2 会话，不加入共享。"""
+        return Http2Connection(conn.reader, conn.writer)
+
+    def evict_idle(self):
+        """关闭失效或空闲超时的连接、删除过期的 HTTP/1.1 回退记录，返回关闭的连接数。"""
+        now = time.monotonic()
+        for key, retry_at in list(self.h1_origins.items()):
+            if now >= retry_at:
+                del self.h1_origins[key]
+        closed = 0
+        for key, session in list(self._sessions.items()):
+            if not session.is_usable(self.idle_timeout):
+                del self._sessions[key]
+                if not session.active_streams:
+                    session.close()
+                    closed += 1
+        return closed
+
+    def session_count(self):
+        return len(self._sessions)
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
@@ -0,0 +1,332 @@
+"""
+日志处理模块
+按天切分的日志文件、JSON 行格式、队列异步写入、重复日志抽样与后台日志保留
+"""
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import queue
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def _next_midnight(ts):
+    day = datetime.fromtimestamp(ts).date() + timedelta(days=1)
+    return datetime(day.year, day.month, day.day).timestamp()
+
+
+class DailyFileHandler(logging.FileHandler):
+    """按本地日期写入 <prefix>-YYYY-MM-DD.log，跨过零点后第一条日志写入新一天的文件。
+
+    on_rollover 为换天后的回调 on_rollover(已关闭的文件路径)，在写日志的线程中调用。
+    """
+
+    def __init__(self, log_dir, prefix, encoding="utf-8", on_rollover=None):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.on_rollover = on_rollover
+        now = datetime.now()
+        self._next_rollover = _next_midnight(now.timestamp())
+        super().__init__(str(self.path_for(now)), encoding=encoding)
+
+    def path_for(self, when):
+        return self.log_dir / "{}-{}.log".format(self.prefix, when.strftime("%Y-%m-%d"))
+
+    def emit(self, record):
+        if record.created >= self._next_rollover:
+            self._rollover(record.created)
+        super().emit(record)
+
+    def _rollover(self, ts):
+        closed = self.baseFilename
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = str(self.path_for(datetime.fromtimestamp(ts)))
+            self._next_rollover = _next_midnight(ts)
+        finally:
+            self.release()
+        if self.on_rollover is not None:
+            try:
+                self.on_rollover(closed)
+            except Exception:
+                pass
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON：{"time", "level", "logger", "message"[, "exc"]}。"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """只把日志记录放入队列，格式化与文件/控制台写入都在后台线程完成。
+
+    标准 QueueHandler 会在调用线程中格式化整条日志，这里只预先合成 message 与异常文本
+    （后台线程处理时参数或异常对象可能已变化），其余交给后台处理器。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """队列日志管线：调用方只入队，后台 QueueListener 线程写文件与控制台。"""
+
+    def __init__(self, handlers):
+        self.queue = queue.Queue()
+        self.handler = AsyncQueueHandler(self.queue)
+        self.handlers = handlers
+        self._listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        with self._lock:
+            if not self._running:
+                self._listener.start()
+                self._running = True
+        return self
+
+    def stop(self):
+        """写完队列中剩余的日志后停止后台线程（可重复调用）。"""
+        with self._lock:
+            if self._running:
+                self._listener.stop()
+                self._running = False
+        for handler in self.handlers:
+            handler.flush()
+
+
+class RepeatSampler:
+    """重复日志抽样：同一 key 的值不变时每 every 次只记录一次，值变化时总是记录。"""
+
+    def __init__(self, every=1):
+        self.every = max(1, every)
+        self._last = {}  # key -> [上次的值, 省略的次数]
+
+    def take(self, key, value=None):
+        """返回 None 表示本条应省略；否则返回自上次记录以来省略的条数。"""
+        entry = self._last.get(key)
+        if entry is None or entry[0] != value or entry[1] + 1 >= self.every:
+            skipped = entry[1] if entry is not None else 0
+            self._last[key] = [value, 0]
+            return skipped
+        entry[1] += 1
+        return None
+
+    def forget(self, key):
+        self._last.pop(key, None)
+
+
+class LogRetention:
+    """日志保留：按天数与总大小清理日志目录，可选把已结束的日期文件压缩为 .log.gz。
+
+    启动时扫描一次目录建立按日期排序的文件索引，之后只在换天时把前一天的文件加入索引，
+    每次清理从最旧的文件开始判断，不再重复扫描整个目录。当天正在写入的文件不会被删除或压缩。
+    索引每天一项：压缩先写入临时文件再改名，同一天同时有 .log.gz 与 .log 时（压缩后删除 .log 前进程退出）
+    以 .log.gz 为准，残留的 .log 计入该天的大小，下次压缩时删除，按天清理时一并删除。
+    """
+
+    def __init__(self, log_dir, prefix, retention_days=30, max_total_bytes=0, compress=False):
+        self.log_dir = Path(log_dir)
+        self.prefix = prefix
+        self.retention_days = retention_days
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self._files = None  # [[日期, 路径, 大小]]，按日期升序，每天一项
+        self._today = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        # 统计
+        self.deleted = 0
+        self.compressed = 0
+
+    def start(self, interval=3600):
+        """启动后台线程：立即执行一次，之后每 interval 秒或换天时执行。"""
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="log-retention", daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self, *_):
+        """提前执行一次（日志换天时调用）。"""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def oldest(self):
+        """当前保留的最旧日志文件路径，没有时返回 None。"""
+        return self._files[0][1] if self._files else None
+
+    def run(self, today=None):
+        """执行一次清理，返回删除的文件数。"""
+        with self._lock:
+            today = today or date.today()
+            if self._files is None:
+                self._files = self._scan()
+            elif today != self._today:
+                self._add_days(self._today, today)
+            self._today = today
+            # 需要压缩时先只按天数清理，压缩后再按大小上限清理
+            deleted = self._enforce(today, by_size=not self.compress)
+            if self.compress:
+                self._compress_closed(today)
+                deleted += self._enforce(today)
+            return deleted
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception:
+                pass
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def _day_of(self, name):
+        stem = name[len(self.prefix) + 1:]
+        if not name.startswith(self.prefix + "-") or stem[10:] not in (".log", ".log.gz"):
+            return None
+        try:
+            return datetime.strptime(stem[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+
+    def _path(self, day, suffix=".log"):
+        return self.log_dir / "{}-{}{}".format(self.prefix, day.strftime("%Y-%m-%d"), suffix)
+
+    def _entry(self, day):
+        """某天的索引项 [日期, 路径, 大小]：有 .log.gz 时以其为准，大小包括残留的 .log；都不存在时返回 None。"""
+        entry = None
+        for suffix in (".log.gz", ".log"):
+            path = self._path(day, suffix)
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            if entry is None:
+                entry = [day, path, size]
+            else:
+                entry[2] += size
+        return entry
+
+    def _scan(self):
+        days = set()
+        for path in self.log_dir.glob("{}-*.log*".format(self.prefix)):
+            day = self._day_of(path.name)
+            if day is not None:
+                days.add(day)
+        files = [self._entry(day) for day in sorted(days)]
+        return [entry for entry in files if entry is not None]
+
+    def _add_days(self, last_day, today):
+        """把上次执行以来新出现的日期文件加入索引（按日期逐个检查，不扫描目录）。"""
+        known = {item[0] for item in self._files[-2:]}
+        day = last_day
+        while day < today:
+            entry = self._entry(day) if day not in known else None
+            if entry is not None:
+                self._files.append(entry)
+            day += timedelta(days=1)
+
+    def _compress_closed(self, today):
+        compressed = 0
+        for item in self._files:
+            day, path = item[0], item[1]
+            if day >= today:
+                continue
+            if path.suffix == ".gz":
+                # 压缩完成后、删除 .log 之前进程退出时残留的 .log
+                try:
+                    self._path(day).unlink()
+                    item[2] = path.stat().st_size
+                except OSError:
+                    pass
+                continue
+            gz_path = path.with_name(path.name + ".gz")
+            tmp_path = path.with_name(path.name + ".gz.tmp")
+            try:
+                with open(str(path), "rb") as src, gzip.open(str(tmp_path), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                tmp_path.replace(gz_path)
+                path.unlink()
+            except OSError:
+                try:
+                    tmp_path.unlink()
+                except OSError:
+                    pass
+                continue
+            item[1] = gz_path
+            item[2] = gz_path.stat().st_size
+            compressed += 1
+        self.compressed += compressed
+        return compressed
+
+    def _enforce(self, today, by_size=True):
+        deleted = 0
+        cutoff = today - timedelta(days=self.retention_days) if self.retention_days else None
+        current_size = self._current_size(today)
+        total = sum(item[2] for item in self._files) + current_size
+        while self._files:
+            day, path, size = self._files[0]
+            if day >= today:
+                break
+            too_old = cutoff is not None and day <= cutoff
+            too_big = by_size and self.max_total_bytes and total > self.max_total_bytes
+            if not (too_old or too_big):
+                break
+            try:
+                for stale in {path, self._path(day)}:
+                    try:
+                        stale.unlink()
+                    except FileNotFoundError:
+                        pass
+            except OSError:
+                break
+            self._files.pop(0)
+            total -= size
+            deleted += 1
+        self.deleted += deleted
+        return deleted
+
+    def _current_size(self, today):
+        """当天文件的大小（不在索引中清理，但计入总大小）。"""
+        while self._files and self._files[-1][0] >= today:
+            self._files.pop()
+        try:
+            return (self.log_dir / "{}-{}.log".format(self.prefix, today.strftime("%Y-%m-%d"))).stat().st_size
+        except OSError:
+            return 0
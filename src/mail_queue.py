@@ -0,0 +1,185 @@
+"""
+邮件发送队列模块
+告警邮件先进入有界队列，由后台线程复用已登录的 SMTP 连接发送，检查循环不再等待邮件服务器
+"""
+import queue
+import threading
+import time
+
+
+class MailDispatcher:
+    """后台邮件发送队列。
+
+    - submit() 只入队不阻塞，队列满时丢弃新邮件并计数
+    - 后台线程在 coalesce_seconds 内收集同一批次的邮件，多于一封时合并为一封汇总邮件
+    - 发送失败按 retry_backoff * 2^n 秒退避重试，最多 max_retries 次
+    - SMTP 连接在空闲 idle_timeout 秒内复用，超时后关闭，下次发送重新登录
+    """
+
+    def __init__(self, app, config, queue_size=1000, coalesce_seconds=5, max_retries=3,
+                 retry_backoff=2, idle_timeout=60):
+        self.app = app
+        self.config = config
+        self.coalesce_seconds = coalesce_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._server = None
+        self._server_last_used = 0.0
+        self._reconnect = threading.Event()
+        self._thread = None
+        # 统计
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, subject, content):
+        """邮件入队，不等待发送。
+
+        返回:
+            bool: 已入队返回 True；SMTP 未配置或队列已满返回 False
+        """
+        if not self.app.is_mail_configured(self.config):
+            return False
+        try:
+            self._queue.put_nowait((subject, content, time.time()))
+        except queue.Full:
+            self.dropped += 1
+            self._log("warning", "邮件队列已满，丢弃邮件: {}".format(subject))
+            return False
+        return True
+
+    def depth(self):
+        """当前排队中的邮件数。"""
+        return self._queue.qsize()
+
+    def reconnect(self):
+        """SMTP 配置变化后调用：下次发送前关闭已登录的连接，按新配置重新连接。"""
+        self._reconnect.set()
+
+    def close(self, timeout=10):
+        """停止后台线程，尽量在 timeout 秒内发完队列中剩余的邮件。"""
+        self._stop.set()
+        try:
+            # 唤醒正在等待新邮件的后台线程，不必等到 get() 超时
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread is None:
+            self._close_server()
+            return
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # 后台线程仍在发送（如 SMTP 服务器无响应）：SMTP 连接只由后台线程使用和关闭，这里不去关闭，
+            # 以免与正在进行的 sendmail 同时操作同一连接；后台线程是守护线程，进程退出时随之结束
+            self._log("warning", "邮件发送线程未在 {}s 内结束，放弃等待，队列中还有 {} 封未发送".format(
+                timeout, self.depth()))
+
+    def _run(self):
+        try:
+            while not (self._stop.is_set() and self._queue.empty()):
+                try:
+                    batch = self._next_batch()
+                    if batch:
+                        self._deliver(batch)
+                except Exception as exc:
+                    # 任何意外错误都不能让发送线程退出，否则之后的邮件只入队、不发送也不计失败
+                    self._log("error", "邮件发送线程异常: {}".format(exc))
+        finally:
+            # 停止后由后台线程自己关闭 SMTP 连接，不与 close() 的调用线程竞争
+            self._close_server()
+
+    def _next_batch(self):
+        """取出下一批邮件；没有新邮件时关闭空闲超时的连接并返回 None。"""
+        try:
+            first = self._queue.get(timeout=1)
+        except queue.Empty:
+            if self._server is not None and time.monotonic() - self._server_last_used >= self.idle_timeout:
+                self._close_server()
+            return None
+        if first is None:
+            return None
+        batch = [first]
+        # 收集同一批次的突发告警（停止时不再等待）
+        deadline = time.monotonic() + (0 if self._stop.is_set() else self.coalesce_seconds)
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # close() 唤醒：停止收集，立即发送
+                break
+            batch.append(item)
+        return batch
+
+    def _deliver(self, batch):
+        if len(batch) == 1:
+            subject, content, _ = batch[0]
+        else:
+            subject = "监控告警汇总（{} 条）".format(len(batch))
+            content = "\n".join(
+                "==== {} [{}] ====\n{}".format(item_subject, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(queued_at)), item_content)
+                for item_subject, item_content, queued_at in batch
+            )
+        try:
+            # 收件人/发件人为空（热加载后）或地址格式错误时无法构造邮件，重试也不会成功
+            msg = self.app.build_mail(self.config, subject, content)
+        except Exception as exc:
+            self.failed += len(batch)
+            self._log("error", "构造邮件失败，丢弃 {} 封: {}".format(len(batch), exc))
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._send(msg)
+                self.sent += len(batch)
+                self._log("info", "已发送邮件: {}".format(subject))
+                return
+            except Exception as exc:
+                self._close_server()
+                if attempt >= self.max_retries or self._stop.is_set():
+                    self.failed += len(batch)
+                    self._log("error", "发送邮件失败: {}".format(exc))
+                    return
+                delay = self.retry_backoff * (2 ** attempt)
+                self._log("warning", "发送邮件失败，{}s 后重试: {}".format(delay, exc))
+                self._stop.wait(delay)
+
+    def _send(self, msg):
+        if self._reconnect.is_set():
+            self._reconnect.clear()
+            self._close_server()
+        if self._server is not None:
+            try:
+                # 复用前确认连接仍然可用
+                self._server.noop()
+            except Exception:
+                self._close_server()
+        if self._server is None:
+            self._server = self.app.open_smtp(self.config)
+        self._server.send_message(msg)
+        self._server_last_used = time.monotonic()
+
+    def _close_server(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+    def _log(self, level, message):
+        if self.app.logger:
+            getattr(self.app.logger, level)(message)
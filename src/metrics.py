@@ -0,0 +1,263 @@
+"""
+指标导出模块
+以 Prometheus 文本格式（text/plain; version=0.0.4）在内置 HTTP 端点 /metrics 上导出运行指标
+
+指标在抓取时由各采集函数直接读取程序中已有的状态与计数生成，检查过程中除直方图外不做额外记录；
+标签文本按值缓存，抓取上万条序列时每条只做一次字符串格式化。
+"""
+import gzip
+import os
+import socketserver
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 探测耗时直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_PROCESS_START = time.time()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricWriter:
+    """一次抓取的输出缓冲，采集函数通过 family()/sample() 写入。"""
+
+    __slots__ = ("prefix", "lines")
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        """写入指标族的 HELP/TYPE 行，kind 为 counter/gauge/histogram。"""
+        self.lines.append("# HELP {0}{1} {2}\n# TYPE {0}{1} {3}\n".format(self.prefix, name, help_text, kind))
+
+    def sample(self, name, value, labels=""):
+        """写入一条样本，labels 为 MetricsRegistry.labels() 生成的标签文本。"""
+        if value is None:
+            return
+        if value is True or value is False:
+            value = int(value)
+        self.lines.append("%s%s%s %s\n" % (self.prefix, name, labels, value))
+
+    def render(self):
+        return "".join(self.lines).encode("utf-8")
+
+
+class MetricsRegistry:
+    """指标注册表：登记采集函数 collector(writer)，抓取时依次调用。"""
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._collectors = []
+        self._labels = {}  # (标签名, 值) -> 标签文本
+        self._lock = threading.Lock()
+
+    def register(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def unregister(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def labels(self, **labels):
+        """生成并缓存标签文本，如 labels(url="https://a") -> '{url="https://a"}'。"""
+        key = tuple(sorted(labels.items()))
+        text = self._labels.get(key)
+        if text is None:
+            text = "{" + ",".join("{}=\"{}\"".format(name, _escape(value)) for name, value in key) + "}"
+            self._labels[key] = text
+        return text
+
+    def forget_labels(self, **labels):
+        """丢弃不再使用的标签缓存（如目标被移除）；等待进行中的抓取结束，避免刚丢弃的标签又被采集函数加回。"""
+        with self._lock:
+            self._labels.pop(tuple(sorted(labels.items())), None)
+
+    def render(self, include_errors=True):
+        """生成完整的指标文本；采集函数出错时跳过该函数并输出一条错误计数（include_errors 为 False 时不输出）。"""
+        writer = MetricWriter(self.prefix)
+        errors = 0
+        with self._lock:
+            for collector in list(self._collectors):
+                try:
+                    collector(writer)
+                except Exception:
+                    errors += 1
+        if include_errors:
+            writer.family("metrics_collector_errors", "gauge", "本次抓取中出错的采集函数数量")
+            writer.sample("metrics_collector_errors", errors)
+        return writer.render()
+
+
+def merge_expositions(parts):
+    """合并多份指标文本（如各分片工作进程的输出）。
+
+    parts 为 [(附加标签, 指标文本)]，附加标签形如 'shard="0"'，加到每条样本上以区分来源；
+    同名指标族只保留第一份 HELP/TYPE，各来源的样本依次归入该族。
+    """
+    families = {}  # 指标族名 -> [HELP/TYPE 行, 样本行...]，保持首次出现的顺序
+    for extra, text in parts:
+        current = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                fields = line.split(" ", 3)
+                if len(fields) >= 3 and fields[1] == "HELP":
+                    current = families.get(fields[2])
+                    if current is None:
+                        current = families[fields[2]] = [line]
+                elif len(fields) >= 3 and fields[1] == "TYPE" and current is not None and len(current) == 1:
+                    current.append(line)
+                continue
+            if current is None:
+                continue
+            brace = line.find("{")
+            space = line.find(" ")
+            if 0 <= brace < space:
+                current.append("{}{}{}".format(line[:brace + 1], extra + ",", line[brace + 1:]))
+            else:
+                current.append("{}{{{}}}{}".format(line[:space], extra, line[space:]))
+    return "".join(line + "\n" for lines in families.values() for line in lines)
+
+
+class Histogram:
+    """按单个标签分组的直方图，observe() 只做一次二分查找与计数。"""
+
+    def __init__(self, registry, name, help_text, buckets=LATENCY_BUCKETS, label_name=None):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_name = label_name
+        self._le = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        self._series = {}  # 标签值 -> [各分桶计数..., 总和]
+        self._label_texts = {}  # 标签值 -> (各分桶的标签文本, 不含 le 的标签文本)
+        registry.register(self.collect)
+
+    def observe(self, value, label_value=""):
+        series = self._series.get(label_value)
+        if series is None:
+            self._series[label_value] = series = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def remove(self, label_value):
+        self._series.pop(label_value, None)
+        self._label_texts.pop(label_value, None)
+
+    def collect(self, writer):
+        writer.family(self.name, "histogram", self.help_text)
+        bucket_name = self.name + "_bucket"
+        for label_value, series in list(self._series.items()):
+            texts = self._label_texts.get(label_value)
+            if texts is None:
+                texts = self._label_texts[label_value] = self._make_labels(label_value)
+            bucket_labels, plain_labels = texts
+            cumulative = 0
+            for index, label_text in enumerate(bucket_labels):
+                cumulative += series[index]
+                writer.sample(bucket_name, cumulative, label_text)
+            writer.sample(self.name + "_sum", series[-1], plain_labels)
+            writer.sample(self.name + "_count", cumulative, plain_labels)
+
+    def _make_labels(self, label_value):
+        if not self.label_name:
+            return ["{{le=\"{}\"}}".format(le) for le in self._le], ""
+        base = "{}=\"{}\"".format(self.label_name, _escape(label_value))
+        return ["{{{},le=\"{}\"}}".format(base, le) for le in self._le], "{" + base + "}"
+
+
+def process_collector(writer):
+    """进程资源：CPU 时间、常驻内存、打开的文件数、线程数、启动时间。"""
+    times = os.times()
+    writer.family("process_cpu_seconds_total", "counter", "进程累计占用的CPU时间（秒）")
+    writer.sample("process_cpu_seconds_total", times[0] + times[1])
+    rss = _resident_memory()
+    if rss is not None:
+        writer.family("process_resident_memory_bytes", "gauge", "进程常驻内存（字节）")
+        writer.sample("process_resident_memory_bytes", rss)
+    if os.path.isdir("/proc/self/fd"):
+        writer.family("process_open_fds", "gauge", "进程打开的文件描述符数")
+        writer.sample("process_open_fds", len(os.listdir("/proc/self/fd")))
+    writer.family("process_threads", "gauge", "进程中的 Python 线程数")
+    writer.sample("process_threads", threading.active_count())
+    writer.family("process_start_time_seconds", "gauge", "进程启动时间（Unix 时间戳）")
+    writer.sample("process_start_time_seconds", int(_PROCESS_START))
+
+
+def _resident_memory():
+    """当前常驻内存；Linux 读 /proc，其他平台取 getrusage 的峰值，都不可用时返回 None。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """在后台线程中提供 /metrics 的 HTTP 服务，客户端支持时 gzip 压缩。"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render()
+                gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    body = gzip.compress(body, compresslevel=1)
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer((self.host, self.port), Handler)
+        # 端口配置为0时由系统分配，这里取实际端口
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
@@ -0,0 +1,779 @@
+"""
+异步探测模块
+基于 asyncio 的轻量 HTTP 探测客户端与并发探测引擎，单进程即可同时探测数千个目标
+"""
+import asyncio
+import random
+import socket
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+from .certificates import cert_verify_error
+# 探测方式与耗时阶段定义在不依赖 asyncio 的 probe_options 中，单目标模式与配置校验不必加载本模块
+from .probe_options import HEAD_REJECTED_STATUS, PHASE_NAMES, PHASES, PROBE_METHODS, drain_length
+
+
+USER_AGENT = "check-web-alive/1.0"
+
+# 丢弃响应体时每次读取的字节数
+_READ_CHUNK = 64 * 1024
+
+# range 探测时允许读完的响应体上限，超过则断开连接
+_RANGE_BODY_LIMIT = 1024
+
+# 有内容断言的目标跟随这些重定向，断言检查最终页面（与单目标模式 requests 的行为一致）
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+# 最多跟随的重定向次数，与 requests 的默认上限相同
+MAX_REDIRECTS = 30
+
+# 错误类别：超时、连接失败、DNS解析失败、TLS握手失败、HTTP状态码>=400、响应格式错误、内容断言不通过、其他
+ERROR_CLASSES = ("timeout", "connect", "dns", "tls", "http", "protocol", "content", "other")
+
+# 共享的 TLS 上下文，首次探测 HTTPS 目标时创建；_SSL_CONTEXT_ALPN 在握手时通过 ALPN 协商 HTTP/2
+_SSL_CONTEXT = None
+_SSL_CONTEXT_ALPN = None
+
+
+class ProbeResult:
+    """单次探测结果，耗时字段单位均为秒。
+
+    dns/connect/tls 仅在新建连接时有值（复用连接时为 None）；探测失败时保留已完成阶段的耗时。
+    """
+
+    __slots__ = ("url", "ok", "status_code", "error", "elapsed", "reused", "error_class",
+                 "dns", "connect", "tls", "ttfb", "size", "degraded", "mismatch", "queue_wait", "http2",
+                 "tls_object", "cert_error", "location")
+
+    def __init__(self, url, ok, status_code=None, error=None, elapsed=None, reused=False, error_class=None):
+        self.url = url
+        self.ok = ok
+        self.status_code = status_code
+        self.error = error
+        self.elapsed = elapsed  # 探测总耗时（秒）
+        self.reused = reused  # 是否复用了连接池中的空闲连接
+        self.error_class = error_class  # 失败类别，见 ERROR_CLASSES；可达时为 None
+        self.dns = None  # DNS 解析耗时
+        self.connect = None  # TCP 建连耗时
+        self.tls = None  # TLS 握手耗时
+        self.ttfb = None  # 发出请求到收到响应首行的耗时
+        self.size = None  # 读取的响应体字节数
+        self.degraded = False  # 可达但耗时超过阈值
+        self.mismatch = None  # 内容断言不通过的原因
+        self.queue_wait = 0.0  # 探测开始前因主机限流或并发上限排队的时间，不计入 elapsed
+        self.http2 = False  # 是否经 HTTP/2 探测
+        self.tls_object = None  # 本次新建连接的 TLS 对象，引擎取得证书后清空
+        self.cert_error = None  # 握手时证书校验失败的异常，引擎记入证书缓存后清空
+        self.location = None  # 待跟随的重定向地址（仅有内容断言的目标）
+
+    def as_tuple(self):
+        """返回与 check_url() 一致的 (是否可达, HTTP状态码或None, 错误消息或None)。"""
+        return self.ok, self.status_code, self.error
+
+    def phase(self, name):
+        """按阶段名（见 PHASES）取耗时，total 为总耗时。"""
+        return self.elapsed if name == "total" else getattr(self, name)
+
+    def timing_text(self):
+        """耗时摘要，如 "总 120ms（DNS 3ms / 连接 10ms / TLS 35ms / 首字节 70ms）"。"""
+        if self.elapsed is None:
+            return ""
+        parts = []
+        for name in PHASES[:-1]:
+            value = getattr(self, name)
+            if value is not None:
+                parts.append("{} {:.0f}ms".format(PHASE_NAMES[name], value * 1000))
+        if self.reused:
+            parts.insert(0, "复用连接")
+        if self.http2:
+            parts.insert(0, "HTTP/2")
+        text = "总 {:.0f}ms".format(self.elapsed * 1000)
+        if parts:
+            text += "（{}）".format(" / ".join(parts))
+        if self.size is not None:
+            text += "，响应体 {} 字节".format(self.size)
+        return text
+
+
+def check_degraded(result, thresholds):
+    """可达但某阶段耗时超过阈值时标记为 degraded，返回超过阈值的阶段列表。"""
+    exceeded = []
+    if result.ok:
+        for name, limit in thresholds.items():
+            value = result.phase(name)
+            if value is not None and value > limit:
+                exceeded.append(name)
+    result.degraded = bool(exceeded)
+    return exceeded
+
+
+def _get_ssl_context(alpn=False):
+    global _SSL_CONTEXT, _SSL_CONTEXT_ALPN
+    if alpn:
+        if _SSL_CONTEXT_ALPN is None:
+            from .http2 import ALPN_PROTOCOLS
+
+            _SSL_CONTEXT_ALPN = ssl.create_default_context()
+            _SSL_CONTEXT_ALPN.set_alpn_protocols(ALPN_PROTOCOLS)
+        return _SSL_CONTEXT_ALPN
+    if _SSL_CONTEXT is None:
+        _SSL_CONTEXT = ssl.create_default_context()
+    return _SSL_CONTEXT
+
+
+def split_url(url):
+    """拆分URL，返回 (scheme, host, port, 请求路径)。"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("无效的URL: {}".format(url))
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path = "{}?{}".format(path, parts.query)
+    return scheme, parts.hostname, port, path
+
+
+class Connection:
+    """一条到目标主机的 HTTP/1.1 连接"""
+
+    __slots__ = ("reader", "writer", "last_used")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def is_usable(self, idle_timeout):
+        """连接未被对端关闭且空闲时间未超过 idle_timeout 时可复用。"""
+        if self.reader.at_eof() or self.writer.transport.is_closing():
+            return False
+        return time.monotonic() - self.last_used < idle_timeout
+
+    def close(self):
+        self.writer.close()
+
+
+def negotiated_protocol(conn):
+    """TLS 握手时 ALPN 协商出的协议（如 "h2"），未协商时返回 None。"""
+    ssl_object = conn.writer.get_extra_info("ssl_object")
+    return ssl_object.selected_alpn_protocol() if ssl_object is not None else None
+
+
+async def _connect_any(loop, addresses):
+    """按顺序尝试解析到的地址，返回第一个连接成功的非阻塞 socket。"""
+    last_exc = None
+    for family, type_, proto, _, address in addresses:
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setblocking(False)
+            if family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            await loop.sock_connect(sock, address)
+            return sock
+        except OSError as exc:
+            sock.close()
+            last_exc = exc
+        except BaseException:
+            sock.close()
+            raise
+    raise last_exc or OSError("没有可连接的地址")
+
+
+async def open_connection(scheme, host, port, result=None, dns_cache=None, refresh_dns=False, alpn=False,
+                          ssl_context=None):
+    """建立新连接，https 时完成 TLS 握手；DNS、TCP 建连、TLS 握手的耗时分别记入 result。
+
+    dns_cache 为 src.dns_cache.DnsCache 时经缓存解析，refresh_dns 为 True 时忽略缓存重新解析。
+    alpn 为 True 时握手提供 h2 与 http/1.1，协商结果见 negotiated_protocol()。
+    ssl_context 为调用方提供的 TLS 上下文（如信任自建 CA），为None时使用系统默认证书的共享上下文。
+    """
+    loop = asyncio.get_event_loop()
+    start = time.monotonic()
+    if dns_cache is not None:
+        addresses = await dns_cache.resolve(host, port, refresh=refresh_dns)
+    else:
+        addresses = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    resolved = time.monotonic()
+    if result is not None:
+        result.dns = resolved - start
+    sock = await _connect_any(loop, addresses)
+    connected = time.monotonic()
+    if result is not None:
+        result.connect = connected - resolved
+    use_tls = scheme == "https"
+    try:
+        reader, writer = await asyncio.open_connection(
+            sock=sock,
+            ssl=(ssl_context or _get_ssl_context(alpn)) if use_tls else None,
+            server_hostname=host if use_tls else None,
+        )
+    except BaseException:
+        sock.close()
+        raise
+    if result is not None and use_tls:
+        result.tls = time.monotonic() - connected
+        result.tls_object = writer.get_extra_info("ssl_object")
+    return Connection(reader, writer)
+
+
+class ConnectionPool:
+    """按 (scheme, host, port) 分组的 keep-alive 连接池。
+
+    每个主机最多保留 pool_size 条空闲连接，空闲超过 idle_timeout 秒的连接会被淘汰。
+    """
+
+    def __init__(self, pool_size=4, idle_timeout=120):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._idle = {}  # key -> [Connection, ...]，末尾为最近归还的连接
+
+    def acquire(self, key):
+        """取出一条可复用的空闲连接，没有则返回 None。"""
+        conns = self._idle.get(key)
+        while conns:
+            conn = conns.pop()
+            if conn.is_usable(self.idle_timeout):
+                return conn
+            conn.close()
+        return None
+
+    def release(self, key, conn):
+        """归还连接；该主机空闲连接已满时直接关闭。"""
+        conns = self._idle.setdefault(key, [])
+        if len(conns) >= self.pool_size:
+            conn.close()
+            return
+        conn.last_used = time.monotonic()
+        conns.append(conn)
+
+    def evict_idle(self):
+        """关闭所有失效或空闲超时的连接，返回关闭的数量。"""
+        closed = 0
+        for key in list(self._idle):
+            alive = []
+            for conn in self._idle[key]:
+                if conn.is_usable(self.idle_timeout):
+                    alive.append(conn)
+                else:
+                    conn.close()
+                    closed += 1
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+        return closed
+
+    def idle_count(self):
+        # 可能在指标服务线程中调用，先复制再遍历
+        return sum(len(conns) for conns in list(self._idle.values()))
+
+    def close(self):
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+
+
+def _parse_status_line(line):
+    """解析 HTTP 状态行，返回 (HTTP版本, 状态码)。"""
+    fields = line.decode("latin-1").split(None, 2)
+    if len(fields) < 2 or not fields[0].startswith("HTTP/"):
+        raise ValueError("无效的HTTP响应: {!r}".format(line[:64]))
+    return fields[0], int(fields[1])
+
+
+async def _read_headers(reader):
+    """读取响应头，返回小写键名的字典。"""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("读取响应头时连接被关闭")
+        if line in (b"\r\n", b"\n"):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+async def _discard(reader, length, allow_eof=False, feed=None):
+    """读取并丢弃指定长度的数据，返回实际读取的字节数。
+
+    feed 为逐块接收数据的回调（如内容断言的匹配），返回 True 时提前停止读取。
+    """
+    remaining = length
+    while remaining > 0:
+        data = await reader.read(min(remaining, _READ_CHUNK))
+        if not data:
+            if allow_eof:
+                break
+            raise ConnectionError("读取响应体时连接被关闭")
+        remaining -= len(data)
+        if feed is not None and feed(data):
+            break
+    return length - remaining
+
+
+async def _read_body(reader, headers, limit=None, feed=None):
+    """读取并丢弃响应体，最多读取 limit 字节（None 表示不限）；feed 见 _discard。
+
+    返回: (响应体是否已完整读完（读完才可以复用连接）, 读取的字节数)
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        total = 0
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过 trailer 直到空行
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return True, total
+            read = await _discard(reader, size if limit is None else min(size, limit - total), feed=feed)
+            total += read
+            if read < size:
+                return False, total
+            await _discard(reader, 2)
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        read = await _discard(reader, length if limit is None else min(length, limit), feed=feed)
+        return read == length, read
+    # 无法确定响应体边界，只能读到连接关闭为止
+    if limit is not None:
+        return False, await _discard(reader, limit, allow_eof=True, feed=feed)
+    total = 0
+    while True:
+        data = await reader.read(_READ_CHUNK)
+        if not data:
+            return False, total
+        total += len(data)
+        if feed is not None and feed(data):
+            return False, total
+
+
+async def _exchange(conn, host_header, path, method, stream_bytes, result, assertions=None):
+    """在连接上发送一次探测请求并读取响应，返回 (状态码, 连接是否可复用)；首字节耗时与响应体大小记入 result。
+
+    assertions 为内容断言（src.assertions.ContentAssertions），状态码 <400 时检查，不通过的原因记入 result.mismatch；
+    重定向响应不检查，重定向地址记入 result.location。
+    """
+    extra = ""
+    if method == "range":
+        extra = "Range: bytes=0-0\r\n"
+    request = (
+        "{} {} HTTP/1.1\r\n"
+        "Host: {}\r\n"
+        "User-Agent: {}\r\n"
+        "Accept: */*\r\n"
+        "{}"
+        "Connection: keep-alive\r\n"
+        "\r\n"
+    ).format("HEAD" if method == "head" else "GET", path, host_header, USER_AGENT, extra)
+    sent = time.monotonic()
+    conn.writer.write(request.encode("latin-1"))
+    line = await conn.reader.readline()
+    if not line:
+        raise ConnectionError("服务器未返回响应即关闭连接")
+    result.ttfb = time.monotonic() - sent
+    version, status_code = _parse_status_line(line)
+    headers = await _read_headers(conn.reader)
+    connection = headers.get("connection", "").lower()
+    keep_alive = (version == "HTTP/1.1" and connection != "close") or connection == "keep-alive"
+    has_body, matcher, limit = _body_plan(method, status_code, headers, stream_bytes, result, assertions)
+    if not has_body:
+        result.size = 0
+        if matcher is not None:
+            result.mismatch = matcher.finish()
+        return status_code, keep_alive
+    complete, result.size = await _read_body(conn.reader, headers, limit, matcher.feed if matcher else None)
+    if matcher is not None:
+        result.mismatch = matcher.finish()
+    if not complete:
+        keep_alive = False
+    return status_code, keep_alive
+
+
+def _body_plan(method, status_code, headers, stream_bytes, result, assertions):
+    """按探测方式、状态码与内容断言决定如何读取响应体，响应头断言的结果记入 result.mismatch。
+
+    返回: (是否有响应体, 内容匹配器或None, 最多读取的字节数（None 表示不限）)
+    """
+    matcher = None
+    if assertions is not None and status_code in REDIRECT_STATUS and headers.get("location"):
+        # 断言检查的是重定向后的页面，由调用方跟随
+        result.location = headers["location"]
+    elif assertions is not None and status_code < 400:
+        result.mismatch = assertions.check_headers(headers)
+        if result.mismatch is None and assertions.needs_body:
+            matcher = assertions.matcher()
+    # HEAD、1xx、204、304 响应没有响应体
+    if method == "head" or status_code < 200 or status_code in (204, 304):
+        return False, matcher, 0
+    if matcher is not None:
+        # 边读边匹配，断言有结论或达到读取上限即停止
+        limit = matcher.limit
+    elif method == "get":
+        limit = None
+    else:
+        limit = max(stream_bytes, _RANGE_BODY_LIMIT) if method == "range" else stream_bytes
+        # 较小的响应体读完，连接可以复用（否则每次探测都要重新建连）
+        length = drain_length(headers)
+        if length is not None:
+            limit = max(limit, length)
+    return True, matcher, limit
+
+
+async def _exchange_h2(session, authority, path, method, stream_bytes, result, assertions=None):
+    """在 HTTP/2 连接上以一个新流发送探测请求并读取响应，返回状态码；其余同 _exchange()。"""
+    extra = [("range", "bytes=0-0")] if method == "range" else []
+    result.http2 = True
+    sent = time.monotonic()
+    stream = session.request("HEAD" if method == "head" else "GET", authority, path, USER_AGENT, extra)
+    try:
+        status_code, headers = await session.response(stream)
+        result.ttfb = time.monotonic() - sent
+        has_body, matcher, limit = _body_plan(method, status_code, headers, stream_bytes, result, assertions)
+        if not has_body:
+            result.size = 0
+        else:
+            _, result.size = await session.read_body(stream, limit, matcher.feed if matcher else None)
+        if matcher is not None:
+            result.mismatch = matcher.finish()
+    finally:
+        session.end(stream)
+    return status_code
+
+
+async def _fetch_h2(key, host_header, path, method, stream_bytes, result, dns_cache, assertions, h2_pool, cold,
+                    ssl_context=None):
+    """经 HTTP/2 探测 https 目标，返回 (状态码或None, 未协商出 h2 时已建好的 HTTP/1.1 连接或None)。
+
+    状态码为 None 时由调用方改用 HTTP/1.1。冷连接探测不共享连接，探测结束即关闭。
+    """
+    scheme, host, port = key
+
+    async def connect():
+        return await open_connection(scheme, host, port, result, dns_cache, cold, alpn=True, ssl_context=ssl_context)
+
+    if cold:
+        conn = await connect()
+        if negotiated_protocol(conn) != "h2":
+            return None, conn
+        session = h2_pool.open(conn)
+        try:
+            return await _exchange_h2(session, host_header, path, method, stream_bytes, result, assertions), None
+        finally:
+            session.close()
+    session, conn, reused = await h2_pool.get(key, connect, negotiated_protocol)
+    if session is None:
+        return None, conn
+    result.reused = reused
+    try:
+        return await _exchange_h2(session, host_header, path, method, stream_bytes, result, assertions), None
+    except ConnectionError:
+        if not reused or session.is_usable(h2_pool.idle_timeout):
+            raise
+    # 复用的连接收到 GOAWAY 或已被服务端关闭，换一条连接重试一次（同 HTTP/1.1 的空闲连接）
+    session, conn, reused = await h2_pool.get(key, connect, negotiated_protocol)
+    if session is None:
+        return None, conn
+    result.reused = reused
+    return await _exchange_h2(session, host_header, path, method, stream_bytes, result, assertions), None
+
+
+async def _fetch_status(url, pool, cold, method, stream_bytes, result, dns_cache, assertions=None, h2_pool=None,
+                        ssl_context=None):
+    scheme, host, port, path = split_url(url)
+    host_header = urlsplit(url).netloc.rpartition("@")[2]
+    key = (scheme, host, port)
+
+    conn = None
+    if h2_pool is not None and scheme == "https" and not h2_pool.is_h1_origin(key):
+        status_code, conn = await _fetch_h2(key, host_header, path, method, stream_bytes, result, dns_cache,
+                                            assertions, h2_pool, cold, ssl_context)
+        if status_code is not None:
+            return status_code
+    if conn is None:
+        conn = None if (pool is None or cold) else pool.acquire(key)
+        result.reused = conn is not None
+    if conn is None:
+        conn = await open_connection(scheme, host, port, result, dns_cache, cold, ssl_context=ssl_context)
+    keep_alive = False
+    try:
+        try:
+            status_code, keep_alive = await _exchange(conn, host_header, path, method, stream_bytes, result,
+                                                      assertions)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not result.reused:
+                raise
+            # 复用的空闲连接可能已被服务端关闭，换一条新连接重试一次
+            conn.close()
+            result.reused = False
+            conn = await open_connection(scheme, host, port, result, dns_cache, ssl_context=ssl_context)
+            status_code, keep_alive = await _exchange(conn, host_header, path, method, stream_bytes, result,
+                                                      assertions)
+    finally:
+        if keep_alive and pool is not None and not cold:
+            pool.release(key, conn)
+        else:
+            conn.close()
+    return status_code
+
+
+async def _fetch_following(url, pool, cold, method, stream_bytes, result, dns_cache, assertions, h2_pool,
+                           ssl_context=None):
+    """同 _fetch_status()，并跟随 result.location 记下的重定向，返回最终页面的状态码。"""
+    for _ in range(MAX_REDIRECTS + 1):
+        result.location = None
+        status_code = await _fetch_status(url, pool, cold, method, stream_bytes, result, dns_cache, assertions,
+                                          h2_pool, ssl_context)
+        if result.location is None:
+            return status_code
+        url = urljoin(url, result.location)
+    raise ValueError("重定向次数超过 {} 次".format(MAX_REDIRECTS))
+
+
+async def probe_url(url, timeout_seconds, pool=None, cold=False, method="get", stream_bytes=0, dns_cache=None,
+                    assertions=None, h2_pool=None, ssl_context=None):
+    """异步检查目标URL是否可达，<400 且内容断言通过视为可达。不抛出异常，错误记录在结果中。
+
+    Args:
+        pool: 连接池，为None时每次新建连接并在结束后关闭
+        cold: 为True时不使用连接池与DNS缓存，强制重新解析并新建连接（用于测量冷连接耗时）
+        method: 探测方式，见 PROBE_METHODS
+        stream_bytes: stream 方式下读取的响应体字节数，读完即断开
+        dns_cache: DNS 缓存（src.dns_cache.DnsCache），为None时每次新建连接都调用系统解析
+        assertions: 内容断言（src.assertions.ContentAssertions），需要检查响应体时 head/range 改为 stream 方式；
+            有断言时跟随重定向（最多 MAX_REDIRECTS 次），断言检查最终页面
+        h2_pool: HTTP/2 连接（src.http2.Http2Pool），不为None时 https 目标优先经 HTTP/2 探测，同一源站共用一条连接
+        ssl_context: https 目标使用的 TLS 上下文，为None时使用系统默认证书；配合 h2_pool 时需已设置 ALPN 协议，
+            否则协商不出 HTTP/2 而改用 HTTP/1.1
+    """
+    result = ProbeResult(url, False)
+    if assertions is not None and assertions.needs_body and method in ("head", "range"):
+        method = "stream"
+    start = time.monotonic()
+    try:
+        result.status_code = await asyncio.wait_for(
+            _fetch_following(url, pool, cold, method, stream_bytes, result, dns_cache, assertions, h2_pool,
+                             ssl_context),
+            timeout_seconds)
+    except asyncio.TimeoutError:
+        result.error = "请求超时（{}s）".format(timeout_seconds)
+        result.error_class = "timeout"
+    except Exception as exc:
+        result.error = str(exc) or exc.__class__.__name__
+        result.error_class = classify_error(exc)
+        if result.error_class == "tls":
+            result.cert_error = cert_verify_error(exc)
+    else:
+        result.ok = result.status_code < 400 and result.mismatch is None
+        if result.mismatch is not None:
+            result.error = "内容检查失败: {}".format(result.mismatch)
+            result.error_class = "content"
+        else:
+            result.error_class = None if result.ok else "http"
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+def classify_error(exc):
+    """把探测异常归入 ERROR_CLASSES 中的类别。"""
+    if isinstance(exc, socket.gaierror):
+        return "dns"
+    if isinstance(exc, (ssl.SSLError, ssl.CertificateError)):
+        return "tls"
+    if isinstance(exc, (ConnectionError, asyncio.IncompleteReadError, OSError)):
+        return "connect"
+    if isinstance(exc, ValueError):
+        return "protocol"
+    return "other"
+
+
+class ProbeEngine:
+    """并发探测引擎：在一个事件循环上探测多个目标，并发数受 concurrency 限制。
+
+    探测复用按主机分组的 keep-alive 连接池；cold_sample_rate 为按比例抽样的冷连接探测，
+    这部分探测绕过连接池，用于持续观察完整的 DNS/TCP/TLS 建连开销。
+    method 为探测方式（见 PROBE_METHODS），除 get 外都不会下载完整响应体。
+    dns_cache 为各探测共享的 DNS 缓存；assertions 为按目标的内容断言 {url: ContentAssertions}；outcomes 按结果类别（ok 或 ERROR_CLASSES）累计探测次数，
+    用于区分 DNS 解析失败与 HTTP 错误等不同原因的不可达。
+    host_limiter 为按主机的限流（src.host_limiter.HostLimiter），被限流的探测排队等待，等待时间记入 result.queue_wait。
+    certs 为证书缓存（src.certificates.CertCache），新建 TLS 连接时记录握手取得的证书，不额外建立连接。
+    http2 为 True 时 https 目标经 HTTP/2 探测（需安装 h2），同一源站的所有目标复用一条连接，ALPN 未协商出 h2 的源站改用 HTTP/1.1。
+    ssl_context 为 https 目标使用的 TLS 上下文（如只信任自建 CA），为None时使用系统默认证书；http2 为 True 时在其上设置 ALPN 协议。
+    """
+
+    def __init__(self, concurrency=200, timeout_seconds=10, loop=None,
+                 pool_size=4, idle_timeout=120, cold_sample_rate=0.0,
+                 method="get", stream_bytes=0, dns_cache=None, host_limiter=None, http2=False,
+                 certs=None, ssl_context=None):
+        if method not in PROBE_METHODS:
+            raise ValueError("无效的探测方式: {}，可选: {}".format(method, ", ".join(PROBE_METHODS)))
+        self.concurrency = concurrency
+        self.timeout_seconds = timeout_seconds
+        self.cold_sample_rate = cold_sample_rate
+        self.method = method
+        self.stream_bytes = stream_bytes
+        self._method_fallback = {}  # url -> 该目标实际使用的探测方式（如服务器拒绝 HEAD）
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        self.loop = loop
+        self.pool = ConnectionPool(pool_size, idle_timeout) if pool_size > 0 else None
+        self.h2_pool = None
+        if http2:
+            # 只在启用时加载 h2
+            from .http2 import Http2Pool
+
+            self.h2_pool = Http2Pool(idle_timeout)
+            if ssl_context is not None:
+                from .http2 import ALPN_PROTOCOLS
+
+                ssl_context.set_alpn_protocols(ALPN_PROTOCOLS)
+        self.ssl_context = ssl_context
+        self.certs = certs
+        self.dns_cache = dns_cache
+        self.host_limiter = host_limiter if host_limiter is not None and host_limiter.enabled else None
+        self.assertions = {}  # url -> 内容断言（src.assertions.ContentAssertions）
+        self.outcomes = {}  # "ok" / 错误类别 -> 探测次数
+        self._semaphore = None
+        self._inflight = set()  # 正在探测中的目标，到期时仍未完成则跳过本轮
+
+    def inflight_count(self):
+        """正在探测中的目标数。"""
+        return len(self._inflight)
+
+    async def probe(self, url, timeout_seconds=None):
+        """在并发上限内探测单个目标，timeout_seconds 为空时使用引擎的超时设置。"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        timeout_seconds = timeout_seconds or self.timeout_seconds
+        cold = self.cold_sample_rate > 0 and random.random() < self.cold_sample_rate
+        method = self._method_fallback.get(url, self.method)
+        assertions = self.assertions.get(url)
+        # 先等主机放行再占用全局并发名额，被限流主机的排队探测不会挤占其他主机的并发
+        queued = time.monotonic()
+        host = None
+        if self.host_limiter is not None:
+            host = urlsplit(url).hostname or url
+            await self.host_limiter.acquire(host)
+        try:
+            async with self._semaphore:
+                queue_wait = time.monotonic() - queued
+                result = await probe_url(url, timeout_seconds, self.pool, cold, method, self.stream_bytes,
+                                         self.dns_cache, assertions, self.h2_pool, self.ssl_context)
+                if method == "head" and result.status_code in HEAD_REJECTED_STATUS:
+                    # 服务器不支持 HEAD，该目标以后改用 range 探测
+                    self._method_fallback[url] = "range"
+                    result = await probe_url(url, timeout_seconds, self.pool, cold, "range", self.stream_bytes,
+                                             self.dns_cache, assertions, self.h2_pool, self.ssl_context)
+        finally:
+            if host is not None:
+                self.host_limiter.release(host)
+        result.queue_wait = queue_wait
+        if result.tls_object is not None:
+            if self.certs is not None:
+                _, host, port, _ = split_url(url)
+                self.certs.observe(host, port, result.tls_object, url)
+            result.tls_object = None
+        if result.cert_error is not None:
+            if self.certs is not None:
+                _, host, port, _ = split_url(url)
+                self.certs.observe_failure(host, port, result.cert_error, url)
+            result.cert_error = None
+        outcome = result.error_class or "ok"
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        return result
+
+    async def probe_many(self, urls):
+        """并发探测一组目标，结果顺序与 urls 一致。"""
+        self._evict_idle()
+        return await asyncio.gather(*[self.probe(url) for url in urls])
+
+    def run_batch(self, urls):
+        """同步接口：探测一组目标并返回结果列表。"""
+        return self.loop.run_until_complete(self.probe_many(urls))
+
+    async def run_scheduled(self, scheduler, on_result, on_tick=None, max_sleep=1.0, stop=None):
+        """按调度器持续触发探测。
+
+        Args:
+            scheduler: src.scheduler.Scheduler，key 为目标URL
+            on_result: 每个探测结果的回调 on_result(result)，在事件循环线程中调用
+            on_tick: 每轮调度循环调用一次的回调（间隔不超过 max_sleep 秒）
+            stop: threading.Event，被设置后在 max_sleep 秒内返回（未完成的探测由 close() 取消）
+        """
+        last_evict = time.monotonic()
+        while stop is None or not stop.is_set():
+            delay = scheduler.seconds_until_next()
+            await asyncio.sleep(max_sleep if delay is None else min(delay, max_sleep))
+            for url in scheduler.pop_due():
+                if url in self._inflight:
+                    continue
+                self._inflight.add(url)
+                asyncio.ensure_future(self._probe_and_report(url, on_result))
+            if time.monotonic() - last_evict >= max_sleep:
+                self._evict_idle()
+                last_evict = time.monotonic()
+            if on_tick is not None:
+                on_tick()
+
+    def _evict_idle(self):
+        if self.pool is not None:
+            self.pool.evict_idle()
+        if self.h2_pool is not None:
+            self.h2_pool.evict_idle()
+
+    def submit(self, url, on_result, timeout_seconds=None):
+        """在调度之外立即探测一次（如确认复查），目标正在探测中时忽略并返回 False。
+
+        需在事件循环线程中调用（如 on_result 回调内）。
+        """
+        if url in self._inflight:
+            return False
+        self._inflight.add(url)
+        asyncio.ensure_future(self._probe_and_report(url, on_result, timeout_seconds))
+        return True
+
+    async def _probe_and_report(self, url, on_result, timeout_seconds=None):
+        try:
+            result = await self.probe(url, timeout_seconds)
+        finally:
+            self._inflight.discard(url)
+        on_result(result)
+
+    def run_forever(self, scheduler, on_result, on_tick=None, stop=None):
+        """同步接口：按调度器持续探测，直到被中断或 stop 被设置。"""
+        self.loop.run_until_complete(self.run_scheduled(scheduler, on_result, on_tick, stop=stop))
+
+    async def run_all(self, urls, on_result, poll=0.05):
+        """并发探测一组目标各一次，等 on_result 中 submit() 的复查也都完成后返回。"""
+        for url in urls:
+            self.submit(url, on_result)
+        # on_result 在移出 _inflight 之后同步调用，其中提交的复查在下次检查前已重新加入
+        while self._inflight:
+            await asyncio.sleep(poll)
+
+    def run_once(self, urls, on_result):
+        """同步接口：探测一组目标一次（含确认复查）后返回，用于 --once 单次运行。"""
+        self.loop.run_until_complete(self.run_all(urls, on_result))
+
+    def close(self):
+        """取消未完成的探测，关闭连接池与事件循环。"""
+        if self.loop.is_closed():
+            return
+        all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+        pending = [task for task in all_tasks(self.loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        if self.pool is not None:
+            self.pool.close()
+        if self.h2_pool is not None:
+            self.h2_pool.close()
+        # 让已关闭连接的传输层完成清理
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
@@ -0,0 +1,51 @@
+"""
+探测选项模块
+探测方式与耗时阶段的定义及阈值配置解析，不依赖 asyncio/ssl，单目标模式与配置校验直接使用
+"""
+
+
+# 探测方式：
+# - get: 完整 GET，读完整个响应体
+# - head: HEAD 请求，不传输响应体；服务器拒绝 HEAD 时该目标自动改用 range
+# - range: GET 并带 Range: bytes=0-0，服务器忽略 Range 时读完响应头即断开
+# - stream: GET，读取响应头及前 N 字节后断开
+PROBE_METHODS = ("get", "head", "range", "stream")
+
+# 默认探测方式
+DEFAULT_PROBE_METHOD = "stream"
+
+# range/stream 探测时 Content-Length 不超过该字节数的响应体读完，连接归还连接池继续复用；
+# 更大或长度未知的响应体只读前 N 字节后断开
+DRAIN_BYTES = 64 * 1024
+
+# 服务器以这些状态码拒绝 HEAD 时改用 range 探测
+HEAD_REJECTED_STATUS = (405, 501)
+
+# 耗时阶段：DNS解析、TCP建连、TLS握手、首字节、总耗时
+PHASES = ("dns", "connect", "tls", "ttfb", "total")
+PHASE_NAMES = {"dns": "DNS", "connect": "连接", "tls": "TLS", "ttfb": "首字节", "total": "总"}
+
+
+def drain_length(headers):
+    """Content-Length 不超过 DRAIN_BYTES 时返回该长度（读完后连接可复用），否则返回 None。
+
+    headers 为小写键的字典或 requests 不区分大小写的响应头。
+    """
+    value = headers.get("content-length")
+    if value is None or not value.strip().isdigit():
+        return None
+    length = int(value)
+    return length if length <= DRAIN_BYTES else None
+
+
+def parse_thresholds(text):
+    """解析耗时阈值配置，如 "total=3000,ttfb=2000"（毫秒），返回 {阶段: 秒}。"""
+    thresholds = {}
+    for item in (text or "").replace(" ", "").split(","):
+        if not item:
+            continue
+        name, sep, value = item.partition("=")
+        if not sep or name not in PHASES:
+            raise ValueError("无效的耗时阈值: {}（可选阶段: {}）".format(item, ", ".join(PHASES)))
+        thresholds[name] = int(value) / 1000.0
+    return thresholds
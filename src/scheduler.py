@@ -0,0 +1,173 @@
+"""
+调度模块
+按下次到期时间组织的小顶堆调度器，以固定节奏触发检查，不随检查耗时漂移
+"""
+import heapq
+import random
+import time
+
+
+class Scheduler:
+    """固定节奏调度器。
+
+    每个任务按自己的间隔触发，下次到期时间 = 本次到期时间 + 间隔（而非完成时间 + 间隔），
+    因此检查耗时、邮件发送等都不会让实际周期漂移；落后超过一个周期时跳过错过的轮次。
+    首次到期时间可在 [0, jitter] 内随机打散，避免大量目标同时启动造成突发流量。
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []  # [(due, seq, key)]
+        self._entries = {}  # key -> (interval, seq, due)，seq 不匹配的堆元素视为已删除
+        self._seq = 0
+        # 调度延迟统计（实际触发时间 - 到期时间，秒）
+        self.fired = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self.skipped = 0  # 因落后超过一个周期而跳过的轮次
+        # 累计计数，reset_stats() 不清零
+        self.fired_total = 0
+        self.skipped_total = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, interval, jitter=0, delay=0):
+        """添加或重新调度任务，首次在 delay + [0, jitter] 秒后触发。"""
+        if interval <= 0:
+            raise ValueError("调度间隔必须大于0: {}".format(interval))
+        offset = delay + (random.uniform(0, jitter) if jitter > 0 else 0)
+        self._push(key, interval, self._clock() + offset)
+
+    def remove(self, key):
+        """移除任务（堆中元素延迟清理）。"""
+        self._entries.pop(key, None)
+
+    def interval(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def set_interval(self, key, interval):
+        """修改任务的间隔：下次到期时间取原到期时间与 当前时间 + 新间隔 中较早的一个，之后按新间隔触发。"""
+        if interval <= 0:
+            raise ValueError("调度间隔必须大于0: {}".format(interval))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] == interval:
+            return
+        self._push(key, interval, min(entry[2], self._clock() + interval))
+
+    def next_time(self):
+        """最早的到期时间，没有任务时返回 None。"""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def seconds_until_next(self):
+        """距离最早到期任务的秒数（已到期为0），没有任务时返回 None。"""
+        due = self.next_time()
+        if due is None:
+            return None
+        return max(0.0, due - self._clock())
+
+    def pop_due(self):
+        """取出所有已到期的任务并按固定节奏安排下一次，返回 key 列表。"""
+        now = self._clock()
+        due_keys = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            due, seq, key = heapq.heappop(self._heap)
+            interval = self._entries[key][0]
+            self._record_lag(now - due)
+            next_due = due + interval
+            if next_due <= now:
+                # 落后超过一个周期：跳过错过的轮次，对齐到下一个节拍
+                missed = int((now - next_due) // interval) + 1
+                self.skipped += missed
+                self.skipped_total += missed
+                next_due += missed * interval
+            self._push(key, interval, next_due)
+            due_keys.append(key)
+        return due_keys
+
+    def stats(self):
+        """调度延迟统计（秒）。"""
+        return {
+            "fired": self.fired,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "avg_lag": self._lag_total / self.fired if self.fired else 0.0,
+            "skipped": self.skipped,
+        }
+
+    def reset_stats(self):
+        self.fired = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self.skipped = 0
+
+    def _push(self, key, interval, due):
+        self._seq += 1
+        self._entries[key] = (interval, self._seq, due)
+        heapq.heappush(self._heap, (due, self._seq, key))
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap:
+            _, seq, key = heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(heap)
+
+    def _record_lag(self, lag):
+        self.fired += 1
+        self.fired_total += 1
+        self.last_lag = lag
+        self._lag_total += lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+
+class AdaptiveInterval:
+    """自适应检查间隔。
+
+    - 结果发生变化（可达 <-> 不可达）后改用 min_interval 快速复查，连续 stable_after 次结果相同后恢复基础间隔
+    - 持续可达的目标每连续 stable_after 次可达，间隔翻倍，最长 max_interval
+    - 持续不可达的目标保持基础间隔，以便及时发现恢复
+    - 频繁抖动的目标每次变化都会重新进入快速复查
+    """
+
+    def __init__(self, min_interval, max_interval, stable_after=5, factor=2):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stable_after = max(1, stable_after)
+        self.factor = factor
+        self._state = {}  # key -> [上次结果, 连续相同次数, 当前间隔]
+
+    def update(self, key, base, ok):
+        """根据本次结果返回该目标下一次的检查间隔。"""
+        entry = self._state.get(key)
+        if entry is None:
+            self._state[key] = [ok, 1, base]
+            return base
+        if ok != entry[0]:
+            entry[0] = ok
+            entry[1] = 0
+            entry[2] = min(self.min_interval, base)
+            return entry[2]
+        entry[1] += 1
+        if entry[2] < base:
+            if entry[1] >= self.stable_after:
+                entry[2] = base
+        elif ok and entry[1] % self.stable_after == 0:
+            entry[2] = min(max(self.max_interval, base), entry[2] * self.factor)
+        return entry[2]
+
+    def forget(self, key):
+        self._state.pop(key, None)
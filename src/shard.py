@@ -0,0 +1,393 @@
+"""
+分片探测模块
+按一致性哈希把目标分给多个工作进程并发探测，主进程持有单实例锁，统一保存状态与历史、发送告警、汇总指标与日志
+
+工作进程只做探测（含 TLS 握手与结果处理），检查结果产生的状态、历史与告警以批量消息发回主进程；
+日志经队列交给主进程的日志管线写入同一个日志文件。
+"""
+import hashlib
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from bisect import bisect_right
+from urllib.parse import urlsplit
+
+from .log_handlers import AsyncQueueHandler
+
+
+class ShardStopped(Exception):
+    """主进程要求工作进程退出（或主进程已不存在）。"""
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """一致性哈希环：每个节点在环上放 replicas 个虚拟节点，键归属顺时针方向最近的节点。
+
+    同一个键总是落在同一个节点上；节点数变化时只有约 1/N 的键改变归属。
+    """
+
+    def __init__(self, nodes, replicas=160):
+        points = sorted((_hash("{}#{}".format(node, i)), node) for node in nodes for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+        self._distinct = len(set(self._nodes))
+
+    def node_for(self, key):
+        index = bisect_right(self._points, _hash(key))
+        return self._nodes[index % len(self._nodes)]
+
+    def nodes_for(self, key, count):
+        """键顺时针方向上最近的 count 个不同节点，第一个与 node_for() 相同。"""
+        count = min(count, self._distinct)
+        found = []
+        start = bisect_right(self._points, _hash(key))
+        for offset in range(len(self._nodes)):
+            node = self._nodes[(start + offset) % len(self._nodes)]
+            if node not in found:
+                found.append(node)
+                if len(found) >= count:
+                    break
+        return found
+
+
+def split_targets(targets, count):
+    """按主机名的一致性哈希把目标字典 {url: options} 分成 count 份。
+
+    同一主机的目标落在同一分片，按主机的限流与连接复用不会被分片拆散。
+    """
+    ring = HashRing(range(count))
+    shards = [{} for _ in range(count)]
+    for url, options in targets.items():
+        shards[ring.node_for(urlsplit(url).hostname or url)][url] = options
+    return shards
+
+
+class _ShardLogHandler(AsyncQueueHandler):
+    """工作进程的日志处理器：合成消息并加上分片前缀后放入跨进程队列。"""
+
+    def __init__(self, log_queue, prefix):
+        super().__init__(log_queue)
+        self.prefix = prefix
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.msg = record.message = self.prefix + record.message
+        return record
+
+
+class _ShardStore:
+    """工作进程中代替 StateStore：状态保存在内存中，每次更新发回主进程，由主进程写盘。"""
+
+    def __init__(self, worker, data):
+        self._worker = worker
+        self.data = data
+        self.writes = 0  # 本进程不写盘
+
+    def load(self):
+        return self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value, changed=True):
+        self.data[key] = value
+        self._worker.send("state", key, value, changed)
+
+    def prune(self, keys):
+        return 0  # 主进程启动时已清理
+
+    def maybe_flush(self):
+        return False
+
+    def close(self):
+        self._worker.flush()
+
+
+class _ShardHistory:
+    """工作进程中代替 HistoryStore：检查记录发回主进程追加。"""
+
+    def __init__(self, worker):
+        self._worker = worker
+
+    def append(self, *args, **kwargs):
+        self._worker.send("history", *args, **kwargs)
+
+    def maybe_flush(self):
+        pass
+
+    def close(self):
+        self._worker.flush()
+
+
+class _ShardMailer:
+    """工作进程中代替 MailDispatcher：邮件交给主进程的发送队列。"""
+
+    def __init__(self, worker):
+        self._worker = worker
+
+    def submit(self, subject, content):
+        self._worker.send("mail", subject, content)
+        return True
+
+
+class ShardWorker:
+    """工作进程一侧的通道（由主进程创建后传给子进程）。
+
+    消息先在本地缓冲，poll() 时整批放入队列，减少跨进程传递的次数。
+    """
+
+    def __init__(self, index, count, out_queue, cmd_queue, log_queue, states, history=False, metrics=False):
+        self.index = index
+        self.count = count
+        self.out_queue = out_queue
+        self.cmd_queue = cmd_queue
+        self.log_queue = log_queue
+        self.states = states
+        self.history_enabled = history
+        self.metrics_enabled = metrics
+        self.registry = None
+        self.reloaded = None  # 主进程下发的 (新配置, 本分片的目标)，由工作进程取走后置为 None
+        self._buffer = []
+        self._parent_pid = None
+
+    def attach(self, prefix=""):
+        """在子进程中调用：日志改为发往主进程，创建代替状态/历史/邮件/指标的对象。"""
+        self._parent_pid = os.getppid() if os.name == "posix" else None
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_ShardLogHandler(self.log_queue, "[分片{}] ".format(self.index)))
+        root.setLevel(logging.INFO)
+        self.store = _ShardStore(self, self.states)
+        self.history = _ShardHistory(self) if self.history_enabled else None
+        self.mailer = _ShardMailer(self)
+        if self.metrics_enabled:
+            from .metrics import MetricsRegistry
+            self.registry = MetricsRegistry(prefix)
+        return self
+
+    def send(self, kind, *args, **kwargs):
+        self._buffer.append((kind, args, kwargs))
+
+    def flush(self):
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            self.out_queue.put(("batch", self.index, batch))
+
+    def poll(self):
+        """发送缓冲的消息并处理主进程的命令（在事件循环中定期调用）。"""
+        self.flush()
+        while True:
+            try:
+                command = self.cmd_queue.get_nowait()
+            except queue.Empty:
+                break
+            if command[0] == "stop":
+                raise ShardStopped()
+            if command[0] == "config":
+                self.reloaded = command[1:]
+            if command[0] == "metrics":
+                text = self.registry.render(include_errors=False).decode("utf-8") if self.registry else ""
+                self.out_queue.put(("metrics", self.index, command[1], text))
+        if self._parent_pid is not None and os.getppid() != self._parent_pid:
+            raise ShardStopped()
+
+
+def _worker_main(entry, worker, cfg, targets, prefix):
+    worker.attach(prefix)
+    try:
+        entry(worker, cfg, targets)
+    except (KeyboardInterrupt, ShardStopped):
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        worker.flush()
+
+
+class ShardSupervisor:
+    """主进程一侧：启动并看护工作进程，分发它们发回的消息。
+
+    - 工作进程意外退出时按 1、2、4…60 秒退避重启，重启时带上该分片当前的状态
+    - 指标抓取时向各工作进程请求指标文本，加上 shard 标签后合并输出
+    """
+
+    def __init__(self, entry, cfg, shards, states, logger, history=False, metrics_prefix=None,
+                 metrics_timeout=2.0):
+        self.entry = entry  # entry(worker, cfg, targets)，须为可导入的模块级函数
+        self.cfg = cfg
+        self.shards = shards
+        self.states = states  # 合并后的状态（主进程 StateStore.data），重启工作进程时从中取初始状态
+        self.logger = logger
+        self.history = history
+        self.metrics_prefix = metrics_prefix
+        self.metrics_timeout = metrics_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._out_queue = self._ctx.Queue()
+        self._log_queue = self._ctx.Queue()
+        self._log_listener = None
+        self._processes = [None] * len(shards)
+        self._cmd_queues = [None] * len(shards)
+        self._restart_at = {}  # 分片序号 -> 计划重启的时间
+        self._stopping = False
+        self._metrics_cond = threading.Condition()
+        self._metrics_replies = {}  # 请求号 -> {分片序号: 指标文本}
+        self._metrics_seq = 0
+        # 统计
+        self.restarts = [0] * len(shards)
+        self.messages = 0
+
+    def start(self):
+        root = logging.getLogger()
+        self._log_listener = logging.handlers.QueueListener(
+            self._log_queue, *root.handlers, respect_handler_level=True)
+        self._log_listener.start()
+        for index in range(len(self.shards)):
+            self._spawn(index)
+        return self
+
+    def reconfigure(self, cfg, shards):
+        """配置重新加载后，把新配置与各分片的新目标下发给工作进程（之后重启的工作进程也使用新配置）。"""
+        self.cfg = cfg
+        self.shards = shards
+        for index, cmd_queue in enumerate(self._cmd_queues):
+            if cmd_queue is not None and self.alive(index):
+                cmd_queue.put(("config", cfg, shards[index]))
+
+    def alive(self, index):
+        process = self._processes[index]
+        return process is not None and process.is_alive()
+
+    def run(self, handlers, on_tick=None, tick=1.0):
+        """处理工作进程发回的消息，直到被中断。
+
+        Args:
+            handlers: {消息类别: 处理函数}，如 {"state": store.set, "history": history.append, "mail": mailer.submit}
+            on_tick: 每 tick 秒调用一次的回调
+        """
+        last_tick = time.monotonic()
+        while True:
+            self._receive(handlers, timeout=tick)
+            now = time.monotonic()
+            if now - last_tick >= tick:
+                last_tick = now
+                self._watch(now)
+                if on_tick is not None:
+                    on_tick()
+
+    def stop(self, handlers, timeout=10):
+        """通知工作进程退出，处理完它们发回的剩余消息，超时未退出的强制结束。"""
+        self._stopping = True
+        for cmd_queue in self._cmd_queues:
+            if cmd_queue is not None:
+                cmd_queue.put(("stop",))
+        deadline = time.monotonic() + timeout
+        # 工作进程在队列数据发送完之前不会退出，等待期间持续接收
+        while any(self.alive(index) for index in range(len(self.shards))) and time.monotonic() < deadline:
+            self._receive(handlers, timeout=0.2)
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+            if process is not None:
+                process.join(1)
+        while self._receive(handlers, timeout=0.05):
+            pass
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+
+    def collect_metrics(self, writer):
+        """指标采集函数（在指标服务线程中调用）：合并各工作进程的指标与分片状态。"""
+        from .metrics import merge_expositions
+
+        with self._metrics_cond:
+            self._metrics_seq += 1
+            request_id = self._metrics_seq
+            self._metrics_replies[request_id] = {}
+        asked = [index for index in range(len(self.shards)) if self.alive(index)]
+        for index in asked:
+            self._cmd_queues[index].put(("metrics", request_id))
+        deadline = time.monotonic() + self.metrics_timeout
+        with self._metrics_cond:
+            while len(self._metrics_replies[request_id]) < len(asked):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._metrics_cond.wait(remaining)
+            replies = self._metrics_replies.pop(request_id)
+
+        writer.family("shard_worker_up", "gauge", "分片工作进程是否在运行")
+        for index in range(len(self.shards)):
+            writer.sample("shard_worker_up", self.alive(index), "{{shard=\"{}\"}}".format(index))
+        writer.family("shard_worker_restarts_total", "counter", "分片工作进程被重启的次数")
+        for index in range(len(self.shards)):
+            writer.sample("shard_worker_restarts_total", self.restarts[index], "{{shard=\"{}\"}}".format(index))
+        writer.family("shard_targets", "gauge", "分给各工作进程的目标数")
+        for index, shard in enumerate(self.shards):
+            writer.sample("shard_targets", len(shard), "{{shard=\"{}\"}}".format(index))
+        writer.family("shard_metrics_missing", "gauge", "本次抓取中未按时返回指标的工作进程数")
+        writer.sample("shard_metrics_missing", len(asked) - len(replies))
+        writer.lines.append(merge_expositions(
+            ("shard=\"{}\"".format(index), replies[index]) for index in sorted(replies)))
+
+    def _spawn(self, index):
+        cmd_queue = self._ctx.Queue()
+        shard = self.shards[index]
+        states = {url: self.states[url] for url in shard if url in self.states}
+        worker = ShardWorker(index, len(self.shards), self._out_queue, cmd_queue, self._log_queue, states,
+                             history=self.history, metrics=self.metrics_prefix is not None)
+        process = self._ctx.Process(
+            target=_worker_main, args=(self.entry, worker, self.cfg, shard, self.metrics_prefix or ""),
+            name="shard-{}".format(index), daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._cmd_queues[index] = cmd_queue
+
+    def _watch(self, now):
+        """检查工作进程是否意外退出，到时间后重启。"""
+        if self._stopping:
+            return
+        for index, process in enumerate(self._processes):
+            if index in self._restart_at:
+                if now >= self._restart_at[index]:
+                    del self._restart_at[index]
+                    self.restarts[index] += 1
+                    self.logger.info("重启分片工作进程 {}（第 {} 次）".format(index, self.restarts[index]))
+                    self._spawn(index)
+            elif process is not None and not process.is_alive():
+                delay = min(60, 2 ** min(self.restarts[index], 6))
+                self.logger.error("分片工作进程 {} 已退出（退出码 {}），{} 秒后重启".format(
+                    index, process.exitcode, delay))
+                self._restart_at[index] = now + delay
+
+    def _receive(self, handlers, timeout):
+        """接收并处理一条队列消息，没有消息时返回 False。"""
+        try:
+            message = self._out_queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        if message[0] == "metrics":
+            _, index, request_id, text = message
+            with self._metrics_cond:
+                replies = self._metrics_replies.get(request_id)
+                if replies is not None:
+                    replies[index] = text
+                    self._metrics_cond.notify_all()
+            return True
+        for kind, args, kwargs in message[2]:
+            handler = handlers.get(kind)
+            if handler is None:
+                continue
+            try:
+                handler(*args, **kwargs)
+            except Exception as exc:
+                self.logger.error("处理分片消息失败: {} - {}".format(kind, exc))
+        self.messages += len(message[2])
+        return True
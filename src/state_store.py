@@ -0,0 +1,229 @@
+"""
+状态存储模块
+内存中的状态为准，按间隔写回磁盘（write-behind），写入时先写临时文件再原子替换；
+两次写盘之间的关键变化追加到日志文件，进程崩溃后启动时重放，不丢失状态变化与告警时间
+"""
+import json
+import os
+import sys
+import time
+
+
+class TargetState:
+    """一个目标的状态记录（多目标模式每个目标一个）。
+
+    以 __slots__ 保存，比同样内容的字典小一半以上；读取方式与状态字典相同（get() / state["..."]），
+    写盘时由 as_dict() 转回字典，状态文件格式不变。时间戳均为整数秒，last_ok 为 True/False/None（尚未确认）。
+    """
+
+    __slots__ = ("last_ok", "first_ng_ts", "first_ok_ts", "last_update_ts", "last_alert_ts", "degraded", "latency_ms")
+
+    def __init__(self, last_ok=None, first_ng_ts=None, first_ok_ts=None, last_update_ts=None, last_alert_ts=None,
+                 degraded=False, latency_ms=None):
+        self.last_ok = last_ok  # 确认后的状态
+        self.first_ng_ts = first_ng_ts  # 最早发现异常的时间
+        self.first_ok_ts = first_ok_ts  # 最早转为正常的时间
+        self.last_update_ts = last_update_ts  # 最近一次检查的时间
+        self.last_alert_ts = last_alert_ts  # 上次发送告警的时间
+        self.degraded = degraded  # 最近一次检查是否可达但响应变慢
+        self.latency_ms = latency_ms  # 最近一次检查的总耗时（毫秒）
+
+    def get(self, name, default=None):
+        return getattr(self, name, default) if name in self.__slots__ else default
+
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+
+class StateStore:
+    """以 JSON 文件（快照）加追加日志持久化的内存状态。
+
+    - 状态变化只标记为待写入，距上次写入超过 flush_interval 秒时才落盘，磁盘写入次数与变化频率相关而非检查次数
+    - 关键变化（changed=True）同时以一行 JSON 追加到 <文件名>.journal，写快照后清空日志；
+      加载时先读快照再按顺序重放日志，末尾写了一半的行直接忽略
+    - 仅更新时间戳等非关键字段时（changed=False）不触发写入也不记日志，等下一次写入或退出时一并保存
+    - 快照先写 .tmp 临时文件并 fsync，再 os.replace 原子替换，进程或系统中途退出都不会留下半截文件
+    - 快照无法解析时改名为 .corrupt 保留，load_error 记录原因，由调用方记录日志
+    - record 为值的记录类型（如 TargetState，需提供 from_dict / as_dict），加载时把字典转换为记录，写盘时转回字典；
+      键（目标URL）加载时驻留（sys.intern），与目标列表中的同一URL共用一个字符串
+    """
+
+    def __init__(self, path, flush_interval=30, indent=None, journal=True, record=None):
+        self.path = path
+        self.record = record
+        self.flush_interval = flush_interval
+        self.indent = indent
+        self.journal_path = path.with_name(path.name + ".journal") if journal else None
+        self.data = {}
+        self.writes = 0
+        self.replayed = 0  # 加载时重放的日志条数
+        self.load_error = None  # 加载快照失败的原因
+        self._journal = None
+        self._dirty = False  # 有需要尽快落盘的变化
+        self._touched = False  # 有未落盘的更新（含非关键字段）
+        self._last_flush = time.monotonic()
+
+    def load(self):
+        """加载快照并重放日志，文件不存在时为空字典。"""
+        self.load_error = None
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if not isinstance(data, dict):
+                raise ValueError("顶层不是对象")
+            self.data = data
+        except FileNotFoundError:
+            self.data = {}
+        except (OSError, ValueError) as exc:
+            self.data = {}
+            self.load_error = "状态文件 {} 损坏（{}），已改名为 .corrupt".format(self.path, exc)
+            try:
+                os.replace(str(self.path), str(self.path.with_name(self.path.name + ".corrupt")))
+            except OSError:
+                pass
+        self.replayed = self._replay()
+        if self.record is not None:
+            self.data = {sys.intern(key): self.record.from_dict(value) if isinstance(value, dict) else value
+                         for key, value in self.data.items()}
+        # 重放后立即写快照并清空日志，之后追加的日志不会接在写了一半的行后面
+        if self.journal_path is not None and self.journal_path.exists() and self.journal_path.stat().st_size:
+            self.flush()
+        return self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value, changed=True):
+        """更新一个键；changed 为 False 表示只是非关键字段变化。"""
+        self.data[key] = value
+        if changed:
+            self._append(["set", key, value])
+        self._mark(changed)
+
+    def replace(self, data, changed=True):
+        """整体替换状态（单目标模式的状态文件即为一个平铺字典）。"""
+        self.data = data
+        if changed:
+            self._append(["replace", data])
+        self._mark(changed)
+
+    def prune(self, keys):
+        """只保留 keys 中的条目，返回被移除的数量。"""
+        keys = set(keys)
+        removed = [key for key in self.data if key not in keys]
+        for key in removed:
+            del self.data[key]
+            self._append(["del", key])
+        if removed:
+            self._mark(True)
+        return len(removed)
+
+    def maybe_flush(self):
+        """有待写入的变化且距上次写入超过 flush_interval 时写盘，返回是否写入。"""
+        if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """立即写快照（临时文件 + fsync + 原子替换），之后清空日志。"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        separators = None if self.indent else (",", ":")
+        with open(str(tmp_path), "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(json.dumps(self.data, ensure_ascii=False, indent=self.indent, separators=separators,
+                                      default=_encode))
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(str(tmp_path), str(self.path))
+        _fsync_dir(self.path.parent)
+        # 快照已包含日志中的全部变化；在此之前崩溃时重放日志也只是重复设置相同的值
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.journal_path is not None and self.journal_path.exists():
+            self.journal_path.write_bytes(b"")
+        self.writes += 1
+        self._dirty = False
+        self._touched = False
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """退出前保存所有未落盘的更新。"""
+        if self._dirty or self._touched:
+            self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _mark(self, changed):
+        self._touched = True
+        if changed:
+            self._dirty = True
+
+    def _append(self, entry):
+        """追加一条日志并交给操作系统（进程崩溃不丢失；不逐条 fsync，系统掉电时以最近的快照为准）。"""
+        if self.journal_path is None:
+            return
+        try:
+            if self._journal is None:
+                self._journal = open(str(self.journal_path), "a", encoding="utf-8")
+            self._journal.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=_encode) + "\n")
+            self._journal.flush()
+        except OSError:
+            pass
+
+    def _replay(self):
+        if self.journal_path is None:
+            return 0
+        try:
+            # 按行解码：写了一半的行可能截断在多字节字符中间，整体解码会丢掉整个日志
+            lines = self.journal_path.read_bytes().splitlines()
+        except OSError:
+            return 0
+        count = 0
+        for line in lines:
+            try:
+                entry = json.loads(line.decode("utf-8"))
+                op = entry[0]
+            except (ValueError, IndexError, TypeError):
+                break  # 崩溃时写了一半的行
+            if op == "set":
+                self.data[entry[1]] = entry[2]
+            elif op == "replace" and isinstance(entry[1], dict):
+                self.data = entry[1]
+            elif op == "del":
+                self.data.pop(entry[1], None)
+            count += 1
+        return count
+
+
+def _encode(value):
+    """JSON 序列化记录类型（TargetState 等）。"""
+    as_dict = getattr(value, "as_dict", None)
+    if as_dict is None:
+        raise TypeError("无法保存的状态值: {!r}".format(value))
+    return as_dict()
+
+
+def _fsync_dir(directory):
+    """确保目录项（原子替换后的文件名）落盘；Windows 不支持打开目录，忽略。"""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
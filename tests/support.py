@@ -0,0 +1,22 @@
+"""
+测试共用的辅助函数
+"""
+import importlib.util
+import runpy
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_SCRIPT = None
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def load_script():
+    """加载 check-web-alive.py（不执行 main），返回其全局变量；多个测试共用同一份。"""
+    global _SCRIPT
+    if _SCRIPT is None:
+        _SCRIPT = runpy.run_path(str(ROOT / "check-web-alive.py"), run_name="check_web_alive_test")
+    return _SCRIPT
@@ -0,0 +1,116 @@
+"""
+告警状态机的测试
+"""
+import unittest
+
+from src.alert_state import AlertStateMachine
+
+URL = "https://a.example.com/"
+
+
+class AlertStateMachineTest(unittest.TestCase):
+    def feed(self, machine, results, start=0, step=60, key=URL):
+        """按 step 秒的间隔依次记录结果（True/False），返回各次的 Verdict。"""
+        return [machine.observe(key, ok, start + index * step) for index, ok in enumerate(results)]
+
+    def test_invalid_thresholds(self):
+        with self.assertRaises(ValueError):
+            AlertStateMachine(confirm_failures=3, confirm_window=2)
+        with self.assertRaises(ValueError):
+            AlertStateMachine(confirm_failures=0)
+
+    def test_first_success_confirms_immediately(self):
+        verdict = AlertStateMachine().observe(URL, True, 0)
+        self.assertEqual((verdict.ok, verdict.changed), (True, True))
+
+    def test_n_of_m_failures_confirm_down(self):
+        machine = AlertStateMachine(confirm_failures=2, confirm_window=3)
+        self.feed(machine, [True])
+        # 失败、成功、失败：窗口 3 次中 2 次失败即确认
+        verdicts = self.feed(machine, [False, True, False], start=60)
+        self.assertEqual([verdict.pending for verdict in verdicts], [True, False, False])
+        self.assertEqual((verdicts[0].count, verdicts[0].needed), (1, 2))
+        self.assertTrue(verdicts[2].changed)
+        self.assertFalse(verdicts[2].ok)
+        # 确认时 since 为这一轮变化最早出现的时间
+        self.assertEqual(verdicts[2].since, 180)
+
+    def test_isolated_failures_outside_window_ignored(self):
+        machine = AlertStateMachine(confirm_failures=2, confirm_window=3)
+        verdicts = self.feed(machine, [True, False, True, True, False, True, True, False])
+        self.assertTrue(all(verdict.ok for verdict in verdicts))
+        self.assertFalse(any(verdict.changed for verdict in verdicts[1:]))
+
+    def test_recovery_needs_consecutive_successes(self):
+        machine = AlertStateMachine(confirm_failures=1, confirm_window=1, recover_successes=3)
+        self.feed(machine, [True, False])
+        verdicts = self.feed(machine, [True, True, False, True, True, True], start=120)
+        self.assertEqual([verdict.ok for verdict in verdicts], [False] * 5 + [True])
+        # 中途一次失败让连续计数归零
+        self.assertEqual([verdict.count for verdict in verdicts[:2]], [1, 2])
+        self.assertEqual(verdicts[3].count, 1)
+        self.assertTrue(verdicts[5].changed)
+
+    def test_hysteresis_holds_state_near_threshold(self):
+        # 可达与不可达的确认阈值不同：在临界状态交替时确认状态保持不变
+        machine = AlertStateMachine(confirm_failures=2, confirm_window=2, recover_successes=2)
+        self.feed(machine, [True])
+        verdicts = self.feed(machine, [False, True] * 4, start=60)
+        self.assertTrue(all(verdict.ok for verdict in verdicts))
+        self.feed(machine, [False, False], start=600)
+        verdicts = self.feed(machine, [True, False] * 4, start=720)
+        self.assertTrue(all(verdict.ok is False for verdict in verdicts))
+
+    def test_retry_suggested_while_pending(self):
+        machine = AlertStateMachine(confirm_failures=3, confirm_window=3, confirm_retries=1)
+        self.feed(machine, [True])
+        verdicts = self.feed(machine, [False, False, False], start=60)
+        self.assertEqual([verdict.retry for verdict in verdicts], [True, False, False])
+        self.assertTrue(verdicts[2].changed)
+
+    def test_saved_state_used_for_new_target(self):
+        machine = AlertStateMachine(confirm_failures=2, confirm_window=3)
+        verdict = machine.observe(URL, False, 0, confirmed=False)
+        self.assertEqual((verdict.ok, verdict.changed, verdict.pending), (False, False, False))
+
+    def test_flap_start_and_end(self):
+        machine = AlertStateMachine(confirm_failures=1, confirm_window=1, recover_successes=1,
+                                    flap_window=600, flap_threshold=3)
+        self.feed(machine, [True])
+        verdicts = self.feed(machine, [False, True, False], start=60)
+        self.assertEqual([verdict.flap for verdict in verdicts], [None, None, "start"])
+        self.assertTrue(machine.is_flapping(URL))
+        self.assertEqual(machine.transitions(URL), 3)
+        # 抖动期间状态仍照常确认
+        self.assertTrue(machine.observe(URL, True, 240).changed)
+        # 最后一次变化之后 flap_window 秒内不再变化：抖动结束
+        self.assertIsNone(machine.observe(URL, True, 240 + 599).flap)
+        verdict = machine.observe(URL, True, 240 + 600)
+        self.assertEqual((verdict.flap, verdict.flapping), ("end", False))
+        self.assertEqual(machine.transitions(URL), 0)
+
+    def test_transitions_outside_window_do_not_flap(self):
+        machine = AlertStateMachine(confirm_failures=1, confirm_window=1, recover_successes=1,
+                                    flap_window=600, flap_threshold=3)
+        self.feed(machine, [True, False, True, False, True], step=400)
+        self.assertFalse(machine.is_flapping(URL))
+        self.assertEqual(machine.transitions(URL), 2)
+
+    def test_flap_detection_disabled(self):
+        machine = AlertStateMachine(confirm_failures=1, confirm_window=1, recover_successes=1, flap_threshold=0)
+        self.feed(machine, [True, False] * 10)
+        self.assertFalse(machine.is_flapping(URL))
+        self.assertEqual(machine.transitions(URL), 0)
+
+    def test_targets_independent_and_forget(self):
+        machine = AlertStateMachine(confirm_failures=1, confirm_window=1)
+        self.feed(machine, [True, False], key="a")
+        self.feed(machine, [True], key="b")
+        self.assertFalse(machine.observe("a", False, 200).ok)
+        self.assertTrue(machine.observe("b", True, 200).ok)
+        machine.forget("a")
+        self.assertTrue(machine.observe("a", True, 300).changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+内容断言的测试：流式匹配跨越读取块边界、正则只查找新内容、JSON 读取上限与响应头断言
+"""
+import json
+import unittest
+
+from src.assertions import REGEX_OVERLAP, ContentAssertions
+
+
+def run(assertions, chunks):
+    """逐块输入响应体，返回 (读到第几块时停止（None 表示读完）, finish() 的结果)。"""
+    matcher = assertions.matcher()
+    stopped = None
+    for index, chunk in enumerate(chunks):
+        if matcher.feed(chunk):
+            stopped = index
+            break
+    return stopped, matcher.finish()
+
+
+def split(data, size):
+    return [data[pos:pos + size] for pos in range(0, len(data), size)]
+
+
+class BodyMatcherTest(unittest.TestCase):
+    def test_contains_across_chunk_boundaries(self):
+        assertions = ContentAssertions(contains="Welcome")
+        body = b"x" * 100 + b"Welcome" + b"y" * 100
+        for size in (1, 2, 3, 50, 103, 104, 1000):
+            stopped, mismatch = run(assertions, split(body, size))
+            self.assertIsNone(mismatch, size)
+            # 找到即停止读取
+            self.assertEqual(stopped, 106 // size, size)
+        stopped, mismatch = run(assertions, split(b"Welcom e" * 10, 3))
+        self.assertIsNone(stopped)
+        self.assertIn("不包含 Welcome", mismatch)
+
+    def test_contains_utf8_split_inside_character(self):
+        assertions = ContentAssertions(contains="欢迎")
+        body = "<p>欢迎光临</p>".encode("utf-8")
+        self.assertIsNone(run(assertions, split(body, 1))[1])
+
+    def test_regex_across_chunks(self):
+        assertions = ContentAssertions(regex=r"v\d+\.\d+")
+        body = b"<html>" + b"." * 1000 + b"version v12.34</html>"
+        for size in (1, 7, 1000, 1010):
+            self.assertIsNone(run(assertions, split(body, size))[1], size)
+        _, mismatch = run(assertions, split(b"version v12.x", 4))
+        self.assertIn("不匹配正则", mismatch)
+
+    def test_regex_searches_only_new_chunk_and_overlap(self):
+        assertions = ContentAssertions(regex=r"needle")
+        searched = []
+
+        class Recorder:
+            pattern = assertions.regex.pattern
+
+            def search(self, data, pos=0):
+                searched.append(len(data) - pos)
+                return None
+
+        assertions.regex = Recorder()
+        run(assertions, [b"x" * 1000] * 50)
+        # 每次查找的长度有界，不随已读内容增长
+        self.assertEqual(max(searched), 1000 + REGEX_OVERLAP)
+
+    def test_regex_anchor_not_matched_mid_body(self):
+        # 从缓冲区中间开始查找时 ^ 仍然只匹配响应体开头
+        assertions = ContentAssertions(regex=r"^OK")
+        self.assertIn("不匹配正则", run(assertions, split(b"x" * 10000 + b"OK", 100))[1])
+        self.assertIsNone(run(assertions, split(b"OK" + b"x" * 10000, 100))[1])
+
+    def test_scan_bytes_limit(self):
+        assertions = ContentAssertions(contains="late", scan_bytes=100)
+        stopped, mismatch = run(assertions, split(b"x" * 200 + b"late", 10))
+        self.assertEqual(stopped, 9)
+        self.assertIn("已检查 100 字节", mismatch)
+
+    def test_json_at_scan_limit(self):
+        body = json.dumps({"status": "ok", "pad": "x" * 80}).encode("utf-8")
+        # 恰好 scan_bytes 字节的响应体完整，照常检查
+        assertions = ContentAssertions(json_expr="status=ok", scan_bytes=len(body))
+        self.assertEqual(assertions.matcher().limit, len(body) + 1)
+        self.assertEqual(run(assertions, split(body, 7)), (None, None))
+        # 多出的字节说明响应体被截断，不解析
+        assertions = ContentAssertions(json_expr="status=ok", scan_bytes=len(body) - 1)
+        self.assertIn("未检查 JSON", run(assertions, split(body, 7))[1])
+        stopped, mismatch = run(assertions, split(body + b" " * 100, 7))
+        self.assertEqual(stopped, len(body) // 7)
+        self.assertIn("未检查 JSON", mismatch)
+
+    def test_json_values(self):
+        body = b'{"data": {"items": [{"ok": true, "n": null}]}, "status": "ok"}'
+        cases = {
+            "status=ok": None,
+            "data.items.0.ok=true": None,
+            "data.items.0.ok": None,
+            "data.items.0.n": "为 null",
+            "data.items.1.ok": "没有字段",
+            "status=down": "期望 down",
+        }
+        for expr, expected in cases.items():
+            mismatch = run(ContentAssertions(json_expr=expr), split(body, 5))[1]
+            if expected is None:
+                self.assertIsNone(mismatch, expr)
+            else:
+                self.assertIn(expected, mismatch, expr)
+        self.assertIn("不是有效的 JSON", run(ContentAssertions(json_expr="a"), [b"<html>"])[1])
+
+    def test_max_bytes(self):
+        assertions = ContentAssertions(max_bytes=10)
+        self.assertEqual(run(assertions, [b"x" * 5, b"x" * 5]), (None, None))
+        stopped, mismatch = run(assertions, [b"x" * 5, b"x" * 6, b"x"])
+        self.assertEqual(stopped, 1)
+        self.assertIn("超过上限 10 字节", mismatch)
+
+
+class ContentAssertionsTest(unittest.TestCase):
+    def test_from_options(self):
+        self.assertIsNone(ContentAssertions.from_options({"degraded_ms": 100}))
+        self.assertFalse(ContentAssertions.from_options({"header": "Server"}).needs_body)
+        self.assertTrue(ContentAssertions.from_options({"max_bytes": 0}).needs_body)
+        for options in ({"regex": "("}, {"json": "a..b"}, {"header": ":x"}, {"max_bytes": -1}):
+            with self.assertRaises(ValueError):
+                ContentAssertions.from_options(options)
+
+    def test_check_headers(self):
+        assertions = ContentAssertions(header="Content-Type:application/json", max_bytes=100)
+        self.assertIsNone(assertions.check_headers({"content-type": "Application/JSON; charset=utf-8"}))
+        self.assertIn("缺少响应头", assertions.check_headers({}))
+        self.assertIn("不包含", assertions.check_headers({"content-type": "text/html"}))
+        self.assertIn("超过上限", assertions.check_headers(
+            {"content-type": "application/json", "content-length": "101"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+"""
+证书监控的测试：主机名匹配、提醒档位配置、到期提醒的档位推进，以及证书过期导致握手校验失败时的提醒
+"""
+import asyncio
+import hashlib
+import logging
+import ssl
+import time
+import unittest
+from unittest import mock
+
+from src import probe
+from src.certificates import (CERT_HAS_EXPIRED, EXPIRED, CertCache, CertInfo, cert_verify_error, match_hostname,
+                              parse_warn_days)
+from tests.support import load_script
+
+NOW = 1700000000
+DAY = 86400
+HOST = "example.com"
+KEY = "example.com:443"
+
+
+class FakeSSLObject:
+    """只提供证书监控用到的 getpeercert() 与 version()。"""
+
+    def __init__(self, not_after, serial="1"):
+        self.der = serial.encode("ascii")
+        self.cert = {
+            "subject": ((("commonName", HOST),),),
+            "issuer": ((("organizationName", "Test CA"),),),
+            "notAfter": time.strftime("%b %d %H:%M:%S %Y GMT", time.gmtime(not_after)),
+            "subjectAltName": (("DNS", HOST),),
+        }
+
+    def getpeercert(self, binary_form=False):
+        return self.der if binary_form else self.cert
+
+    def version(self):
+        return "TLSv1.3"
+
+
+def expired_error(code=CERT_HAS_EXPIRED):
+    exc = ssl.SSLCertVerificationError(1, "[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed")
+    exc.verify_code = code
+    exc.verify_message = "certificate has expired"
+    return exc
+
+
+class Wrapped(Exception):
+    """类似 urllib3 的 MaxRetryError：原始异常放在 reason 中。"""
+
+    def __init__(self, reason):
+        super().__init__("Max retries exceeded")
+        self.reason = reason
+
+
+class Mailer:
+    def __init__(self):
+        self.sent = []
+
+    def submit(self, subject, content):
+        self.sent.append((subject, content))
+        return True
+
+
+class MatchHostnameTest(unittest.TestCase):
+    def test_exact_and_wildcard(self):
+        self.assertTrue(match_hostname("Example.COM.", ["example.com"]))
+        self.assertTrue(match_hostname("www.example.com", ["other.org", "*.example.com"]))
+        # 通配符只匹配最左一级
+        self.assertFalse(match_hostname("a.b.example.com", ["*.example.com"]))
+        self.assertFalse(match_hostname("example.com", ["*.example.com"]))
+        self.assertFalse(match_hostname("example.com", []))
+
+    def test_ip_address(self):
+        self.assertTrue(match_hostname("192.0.2.1", ["example.com", "192.0.2.1"]))
+        self.assertTrue(match_hostname("::1", ["0:0:0:0:0:0:0:1"]))
+        self.assertFalse(match_hostname("192.0.2.1", ["192.0.2.2", "*.0.2.1"]))
+
+
+class ParseWarnDaysTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_warn_days("30, 14,7,,7"), (7, 14, 30))
+        self.assertEqual(parse_warn_days(""), ())
+        self.assertEqual(parse_warn_days(None), ())
+        for text in ("x", "-1", "1.5"):
+            with self.assertRaises(ValueError):
+                parse_warn_days(text)
+
+
+class ExpiryAlertTest(unittest.TestCase):
+    def test_levels_progress_once_each(self):
+        certs = CertCache()
+        certs.observe(HOST, 443, FakeSSLObject(NOW + 40 * DAY), "https://example.com/")
+        self.assertEqual(certs.pop_changed(), [KEY])
+        alerts = [certs.expiry_alert(KEY, NOW + offset * DAY)
+                  for offset in (0, 10, 10.5, 20, 26, 27, 38, 39.5, 41, 45)]
+        # 每个档位只提醒一次，跨过的档位（7 天）不补发
+        self.assertEqual(alerts, [None, 30, None, None, 14, None, 2, 0, -1, None])
+        self.assertEqual(certs.get(KEY).alerted, EXPIRED)
+
+    def test_changed_certificate_starts_over(self):
+        certs = CertCache(warn_days=(7, 30))
+        certs.observe(HOST, 443, FakeSSLObject(NOW + 5 * DAY), "https://example.com/")
+        self.assertEqual(certs.expiry_alert(KEY, NOW), 5)
+        self.assertEqual(certs.observe(HOST, 443, FakeSSLObject(NOW + 5 * DAY))[1].alerted, 7)
+        self.assertEqual(certs.hits, 1)
+        certs.observe(HOST, 443, FakeSSLObject(NOW + 90 * DAY, serial="2"))
+        self.assertEqual(certs.pop_changed(), [KEY, KEY])
+        self.assertIsNone(certs.expiry_alert(KEY, NOW))
+        self.assertEqual(certs.expiry_alert(KEY, NOW + 61 * DAY), 29)
+
+    def test_disabled_without_warn_days(self):
+        certs = CertCache(warn_days=())
+        certs.observe(HOST, 443, FakeSSLObject(NOW - DAY))
+        self.assertIsNone(certs.expiry_alert(KEY, NOW))
+
+
+@unittest.skipUnless(hasattr(ssl, "SSLCertVerificationError"), "需要 Python 3.7 及以上")
+class VerifyFailureTest(unittest.TestCase):
+    def test_find_verify_error_in_wrapped_exception(self):
+        error = expired_error()
+        try:
+            try:
+                raise Wrapped(error)
+            except Wrapped as exc:
+                raise ConnectionError(exc) from exc
+        except ConnectionError as exc:
+            self.assertIs(cert_verify_error(exc), error)
+        self.assertIsNone(cert_verify_error(ssl.SSLError(1, "handshake failure")))
+        self.assertIsNone(cert_verify_error(OSError("refused")))
+
+    def test_expired_without_cached_certificate(self):
+        certs = CertCache()
+        wrapped = ConnectionError(Wrapped(expired_error()))
+        key, info = certs.observe_failure(HOST, 443, wrapped, "https://example.com/", now=NOW)
+        self.assertEqual((key, info.fingerprint, info.verify_code), (KEY, None, CERT_HAS_EXPIRED))
+        self.assertEqual(certs.pop_changed(), [KEY])
+        self.assertEqual(certs.expiry_alert(KEY, NOW), -1)
+        self.assertIn("证书已过期", info.summary())
+        # 已提醒过 EXPIRED 的证书再次握手失败时不重复取出
+        certs.observe_failure(HOST, 443, expired_error(), now=NOW + 60)
+        self.assertEqual(certs.pop_changed(), [])
+        self.assertIsNone(certs.expiry_alert(KEY, NOW + 60))
+        self.assertEqual(certs.hits, 1)
+        # 换上有效证书后重新从最高档位开始
+        certs.observe(HOST, 443, FakeSSLObject(NOW + 90 * DAY))
+        self.assertIsNone(certs.get(KEY).alerted)
+        self.assertEqual(CertInfo.from_dict(info.as_dict()).verify_code, CERT_HAS_EXPIRED)
+
+    def test_cached_certificate_expired_since_last_handshake(self):
+        certs = CertCache()
+        certs.observe(HOST, 443, FakeSSLObject(NOW + 2 * DAY))
+        self.assertEqual(certs.pop_changed(), [KEY])
+        self.assertEqual(certs.expiry_alert(KEY, NOW), 2)
+        # 复用连接期间证书过期，重新握手时校验失败：沿用缓存中的到期时间，立即检查
+        _, info = certs.observe_failure(HOST, 443, expired_error(), now=NOW + 3 * DAY)
+        self.assertEqual(info.fingerprint, hashlib.sha256(b"1").hexdigest())
+        self.assertEqual(certs.pop_changed(), [KEY])
+        self.assertEqual(certs.expiry_alert(KEY, NOW + 3 * DAY), -1)
+
+    def test_other_verify_errors_ignored(self):
+        certs = CertCache()
+        certs.observe(HOST, 443, FakeSSLObject(NOW + 90 * DAY))
+        certs.pop_changed()
+        # 自签名等其他校验错误不代表证书过期
+        self.assertEqual(certs.observe_failure(HOST, 443, expired_error(code=18), now=NOW), (KEY, None))
+        self.assertEqual(certs.observe_failure(HOST, 443, OSError("refused"), now=NOW), (KEY, None))
+        self.assertEqual(certs.pop_changed(), [])
+        self.assertIsNotNone(certs.get(KEY).fingerprint)
+
+    def test_engine_records_verify_failure(self):
+        certs = CertCache()
+        engine = probe.ProbeEngine(loop=asyncio.new_event_loop(), certs=certs)
+        self.addCleanup(engine.close)
+        with mock.patch.object(probe, "_fetch_following", side_effect=expired_error()):
+            result = engine.loop.run_until_complete(engine.probe("https://example.com:8443/health"))
+        self.assertEqual((result.ok, result.error_class, result.cert_error), (False, "tls", None))
+        self.assertEqual(certs.pop_changed(), ["example.com:8443"])
+        self.assertEqual(certs.get("example.com:8443").url, "https://example.com:8443/health")
+
+    def test_expired_mail_without_expiry_time(self):
+        script = load_script()
+        certs = CertCache()
+        script["observe_certificate_failure"](certs, "https://example.com/", ConnectionError(expired_error()))
+        script["observe_certificate_failure"](certs, "http://example.com/", ConnectionError(expired_error()))
+        mailer = Mailer()
+        script["check_certificates"](mailer, logging.getLogger("test"), certs, NOW)
+        self.assertEqual(len(mailer.sent), 1)
+        subject, content = mailer.sent[0]
+        self.assertIn("已过期", subject)
+        self.assertIn("到期时间: 未知", content)
+        self.assertIn("URL: https://example.com/", content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+单目标模式 check_url() 的测试（需要 requests）：连接复用、HEAD 回退与内容断言
+"""
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from tests.support import has_module, load_script
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path in ("/page", "/nohead"):
+            self._reply(200, b"<p>status: ok</p>" + b"x" * 5000)
+        elif self.path == "/large":
+            self._reply(200, b"x" * (1024 * 1024))
+        else:
+            self._reply(404, b"not found")
+
+    def do_HEAD(self):
+        if self.path == "/nohead":
+            self._reply(405, b"")
+        else:
+            self._head = True
+            self.do_GET()
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not getattr(self, "_head", False):
+            self.wfile.write(body)
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    connections = 0
+
+    def handle_error(self, request, client_address):
+        # 客户端读完响应头即断开时服务端写入失败，属预期情况
+        pass
+
+
+@unittest.skipUnless(has_module("requests"), "未安装 requests")
+class CheckUrlTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.script = load_script()
+        cls.server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = "http://127.0.0.1:{}".format(cls.server.server_port)
+        _, cls.defaults, _ = cls.script["config_keys"]()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.session = self.script["make_session"](self.defaults["POOL_SIZE_PER_HOST"])
+        self.addCleanup(self.session.close)
+
+    def check_twice(self, path, method, stream_bytes=0):
+        before = self.server.connections
+        for _ in range(2):
+            ok, status, error = self.script["check_url"](self.base + path, 5, self.session, method, stream_bytes)
+            self.assertTrue(ok, error)
+        return self.server.connections - before
+
+    def test_default_config_reuses_connection(self):
+        self.assertEqual(self.check_twice("/page", self.defaults["PROBE_METHOD"], self.defaults["STREAM_READ_BYTES"]), 1)
+
+    def test_every_method_reuses_connection_for_small_bodies(self):
+        for method in ("get", "head", "range", "stream"):
+            with self.subTest(method=method):
+                self.session.close()
+                self.assertEqual(self.check_twice("/page", method), 1)
+
+    def test_head_rejected_falls_back_to_range(self):
+        url = self.base + "/nohead"
+        self.assertEqual(self.check_twice("/nohead", "head"), 1)
+        self.assertEqual(self.script["_METHOD_FALLBACK"].pop(url), "range")
+
+    def test_large_body_closes_connection(self):
+        self.assertEqual(self.check_twice("/large", "stream", 100), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+多节点协同的测试：用临时目录代替共享目录，几个 ClusterView 实例代表不同节点
+"""
+import json
+import tempfile
+import time
+import unittest
+
+from src.cluster import ClusterView, validate
+
+URL = "https://a.example.com/"
+NOW = 1700000000
+
+
+class ClusterViewTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def view(self, node_id, **options):
+        options.setdefault("replicas", 3)
+        options.setdefault("quorum", 2)
+        return ClusterView(self.tmp.name, node_id, **options)
+
+    def sync(self, views, now):
+        changed = []
+        for view in views:
+            # 结果文件靠 mtime 与大小判断是否更新，连续写入之间留出文件时间戳的精度
+            time.sleep(0.02)
+            view._urgent = True
+            changed.append(view.sync(now))
+        # 再读一轮，每个节点都看到其他节点本轮写出的结果
+        return [view._read(now) or before for view, before in zip(views, changed)]
+
+    def test_validate(self):
+        with self.assertRaises(ValueError):
+            validate("bad id", 3, 2)
+        with self.assertRaises(ValueError):
+            validate("a", 1, 2)
+        validate("node-1.example", 3, 2)
+
+    def test_quorum_of_failures_needed(self):
+        a, b, c = self.view("a"), self.view("b"), self.view("c")
+        self.sync([a, b, c], NOW)
+        self.assertEqual(a.nodes, ("a", "b", "c"))
+        b.record(URL, True, NOW)
+        c.record(URL, True, NOW)
+        self.sync([a, b, c], NOW)
+        # 只有本节点失败：可能是本节点的网络问题
+        self.assertEqual(a.decide(URL, False, NOW), (True, 1, 3))
+        b.record(URL, False, NOW + 10)
+        self.sync([a, b, c], NOW + 10)
+        self.assertEqual(a.decide(URL, False, NOW + 10), (False, 2, 3))
+        self.assertEqual(a.decide(URL, True, NOW + 10), (True, 1, 3))
+
+    def test_stale_results_do_not_vote(self):
+        a, b = self.view("a", result_max_age=60, node_ttl=1000), self.view("b", result_max_age=60, node_ttl=1000)
+        b.record(URL, True, NOW)
+        self.sync([a, b], NOW)
+        self.assertEqual(a.decide(URL, False, NOW + 30), (True, 1, 2))
+        # b 仍存活但结果超过 result_max_age：只凭本节点的失败不能判定不可达
+        self.assertEqual(a.decide(URL, False, NOW + 61), (None, 1, 1))
+        # b 即使失败也达不到法定数
+        self.assertEqual(a.decide(URL, True, NOW + 61), (True, 0, 1))
+
+    def test_unreachable_peers_cannot_declare_down_alone(self):
+        a, b, c = (self.view(node, result_max_age=60, node_ttl=1000) for node in "abc")
+        b.record(URL, True, NOW)
+        c.record(URL, True, NOW)
+        self.sync([a, b, c], NOW)
+        # 本节点网络故障：所有探测失败，同时读不到其他节点的新结果
+        self.assertEqual(a.decide(URL, False, NOW + 120), (None, 1, 1))
+        # 一个节点的新结果确认失败，达到法定数
+        b.record(URL, False, NOW + 120)
+        self.sync([b, a], NOW + 120)
+        self.assertEqual(a.decide(URL, False, NOW + 120), (False, 2, 2))
+
+    def test_single_surviving_node_decides_alone(self):
+        a, b = self.view("a", node_ttl=30), self.view("b", node_ttl=30)
+        b.record(URL, True, NOW)
+        self.sync([a, b], NOW)
+        self.assertIsNone(a.decide(URL, False, NOW + 200)[0])
+        # b 离线后不再是归属节点，法定数降为存活的归属节点数
+        time.sleep(0.02)
+        a._urgent = True
+        self.assertTrue(a.sync(NOW + 200))
+        self.assertEqual(a.decide(URL, False, NOW + 200), (False, 1, 1))
+
+    def test_node_ttl_expiry(self):
+        a, b = self.view("a", node_ttl=30), self.view("b", node_ttl=30)
+        self.assertEqual(self.sync([a, b], NOW), [True, True])
+        self.assertEqual(a.nodes, ("a", "b"))
+        # b 停止写入，超过 node_ttl 后视为离线
+        time.sleep(0.02)
+        a._urgent = True
+        self.assertFalse(a.sync(NOW + 30))
+        time.sleep(0.02)
+        a._urgent = True
+        self.assertTrue(a.sync(NOW + 31))
+        self.assertEqual(a.nodes, ("a",))
+
+    def test_close_removes_node(self):
+        a, b = self.view("a"), self.view("b")
+        self.sync([a, b], NOW)
+        b.close()
+        self.assertTrue(a.sync(NOW + 1))
+        self.assertEqual(a.nodes, ("a",))
+
+    def test_owners_recomputed_on_membership_change(self):
+        urls = ["https://site{}.example.com/".format(index) for index in range(200)]
+        a = self.view("a", replicas=2, quorum=1)
+        self.assertTrue(all(a.owns(url) and a.is_primary(url) for url in urls))
+        others = [self.view(node, replicas=2, quorum=1) for node in ("b", "c", "d")]
+        self.sync([a] + others, NOW)
+        self.assertEqual(a.nodes, ("a", "b", "c", "d"))
+        owned = [url for url in urls if a.owns(url)]
+        # 四个节点、每个目标两个归属节点：本节点约负责一半目标
+        self.assertTrue(0 < len(owned) < len(urls))
+        for url in urls:
+            owners = a.owners(url)
+            self.assertEqual(len(set(owners)), 2)
+            # 所有节点对归属的计算一致
+            self.assertEqual(owners, others[0].owners(url))
+            # 每个目标只有一个主节点负责告警
+            self.assertEqual(sum(view.is_primary(url) for view in [a] + others), 1)
+        # 节点离开后归属重新计算，目标仍有两个归属节点
+        for view in others[1:]:
+            view.close()
+        self.assertTrue(a.sync(NOW + 1))
+        self.assertTrue(all(set(a.owners(url)) == {"a", "b"} for url in urls))
+
+    def test_results_from_shard_files_merged(self):
+        a = self.view("a", replicas=2, quorum=2)
+        b0, b1 = self.view("b", part=0, replicas=2, quorum=2), self.view("b", part=1, replicas=2, quorum=2)
+        first, second = "https://one.example.com/", "https://two.example.com/"
+        b0.record(first, False, NOW)
+        b1.record(second, False, NOW)
+        self.sync([b0, b1, a], NOW)
+        self.assertEqual(a.nodes, ("a", "b"))
+        self.assertEqual(a.decide(first, False, NOW), (False, 2, 2))
+        self.assertEqual(a.decide(second, False, NOW), (False, 2, 2))
+        # 重新分片后两个分片都发布了同一目标：取探测时间较新的结果
+        b1.record(first, True, NOW + 5)
+        self.sync([b1, b0, a], NOW + 5)
+        self.assertEqual(a.decide(first, False, NOW + 5), (True, 1, 2))
+
+    def test_unreadable_and_malformed_files_ignored(self):
+        a = self.view("a")
+        (a.directory / "broken.json").write_text("{not json", encoding="utf-8")
+        (a.directory / "odd.json").write_text(json.dumps({"node": "b", "ts": NOW, "results": {URL: 1}}),
+                                              encoding="utf-8")
+        a.sync(NOW)
+        self.assertEqual(a.nodes, ("a", "b"))
+        # b 的结果格式不对，视为没有结果
+        self.assertEqual(a.decide(URL, False, NOW), (None, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+"""
+配置热加载的测试：配置文件变化的轮询、BaseApp.reload_config()，以及运行中增删与修改目标、新配置无效时沿用原配置，
+移除的目标同时丢弃其状态与指标标签
+"""
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn
+
+from src.base import BaseApp
+from src.metrics import MetricsRegistry
+from tests.support import has_module, load_script
+
+LOGGER = logging.getLogger("test_config_reload")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"<p>status: ok</p>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class App:
+    """只提供重新加载配置与多目标监控用到的 BaseApp 接口；reloads 非空时 config_changed() 返回 True。
+
+    reloads 中的元素为返回新配置的函数（在重新加载时才写入目标列表文件），抛出的异常即配置无效。
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.metrics = MetricsRegistry()
+        self.reloads = []  # 依次由 reload_config() 调用
+        self.extra_paths = None
+        self.on_poll = None
+
+    def config_changed(self, *extra_paths):
+        self.extra_paths = extra_paths
+        if self.on_poll is not None:
+            self.on_poll()
+        return bool(self.reloads)
+
+    def reload_config(self):
+        return self.reloads.pop(0)()
+
+
+class Mailer:
+    def __init__(self):
+        self.sent = []
+        self.reconnects = 0
+
+    def submit(self, subject, content):
+        self.sent.append(subject)
+        return True
+
+    def reconnect(self):
+        self.reconnects += 1
+
+
+class ConfigChangedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name)
+
+    def test_change_reported_once_file_is_stable(self):
+        app = BaseApp("test", root_path=self.root)
+        app.config_file = self.root / ".env"
+        app.config_file.write_text("A=1\n")
+        targets = self.root / "targets.txt"
+        targets.write_text("https://a.example.com/\n")
+        # 首次调用只记录当前状态
+        self.assertFalse(app.config_changed(targets))
+        self.assertFalse(app.config_changed(targets))
+        targets.write_text("https://a.example.com/\nhttps://b.example.com/\n")
+        # 变化后需在下一次轮询时保持不变
+        self.assertEqual([app.config_changed(targets) for _ in range(3)], [False, True, False])
+        app.config_file.write_text("A=22\n")
+        self.assertFalse(app.config_changed(targets))
+        app.config_file.write_text("A=333\n")
+        self.assertEqual([app.config_changed(targets) for _ in range(3)], [False, True, False])
+        # 文件被删除同样视为变化
+        targets.unlink()
+        self.assertEqual([app.config_changed(targets) for _ in range(2)], [False, True])
+
+
+@unittest.skipUnless(has_module("dotenv"), "未安装 python-dotenv")
+class BaseAppReloadTest(unittest.TestCase):
+    KEYS = ("RELOAD_TEST_NUMBER", "RELOAD_TEST_NAME", "RELOAD_TEST_PRESET")
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for key in self.KEYS:
+            self.assertNotIn(key, os.environ)
+            self.addCleanup(os.environ.pop, key, None)
+        self.path = Path(self.tmp.name) / ".env"
+        self.app = BaseApp("test", root_path=Path(self.tmp.name))
+
+    def load(self, text, reload=True):
+        self.path.write_text(text)
+        # 配置错误时 load_config 会打印错误信息
+        with contextlib.redirect_stdout(io.StringIO()):
+            if reload:
+                return self.app.reload_config()
+            return self.app.load_config(self.path, ["RELOAD_TEST_NUMBER"], {"RELOAD_TEST_NUMBER": "int"},
+                                        {"RELOAD_TEST_NAME": "default", "RELOAD_TEST_PRESET": None})
+
+    def test_reload_config(self):
+        with self.assertRaises(ValueError):
+            self.app.reload_config()
+        os.environ["RELOAD_TEST_PRESET"] = "env"
+        cfg = self.load("RELOAD_TEST_NUMBER=1\nRELOAD_TEST_NAME=first\nRELOAD_TEST_PRESET=file\n", reload=False)
+        self.assertEqual(cfg, {"RELOAD_TEST_NUMBER": 1, "RELOAD_TEST_NAME": "first", "RELOAD_TEST_PRESET": "env"})
+        # 修改的配置项更新、删除的配置项恢复默认值，系统环境变量仍优先
+        cfg = self.load("RELOAD_TEST_NUMBER=2\nRELOAD_TEST_PRESET=file2\n")
+        self.assertEqual(cfg, {"RELOAD_TEST_NUMBER": 2, "RELOAD_TEST_NAME": "default", "RELOAD_TEST_PRESET": "env"})
+        for text in ("RELOAD_TEST_NUMBER=abc\n", "RELOAD_TEST_NAME=x\n"):
+            with self.assertRaises(ValueError):
+                self.load(text)
+        self.assertEqual(self.load("RELOAD_TEST_NUMBER=3\n")["RELOAD_TEST_NUMBER"], 3)
+
+
+class TargetsConfig:
+    """按默认值生成多目标模式配置的辅助方法。"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.script = load_script()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.app = App(self.tmp.name)
+        self.targets_file = self.app.root / "targets.txt"
+        self.mailer = Mailer()
+
+    def make_config(self, targets, **overrides):
+        """写入目标列表并返回按默认值补全、经 prepare_config 处理前的配置。"""
+        self.targets_file.write_text("".join(line + "\n" for line in targets))
+        required_keys, optional_keys, _ = self.script["config_keys"]()
+        cfg = dict(optional_keys)
+        cfg.update({key: "x" for key in required_keys})
+        cfg.update(CHECK_INTERVAL_SECONDS=1, SMTP_PORT=25, SMTP_USE_TLS=False, REQUEST_TIMEOUT_SECONDS=5,
+                   LOG_RETENTION_DAYS=1, TARGETS_FILE="targets.txt", SCHEDULE_JITTER_SECONDS=0,
+                   HISTORY_ENABLED=False, CERT_EXPIRY_WARN_DAYS="", DNS_CACHE_ENABLED=False)
+        cfg.update(overrides)
+        return cfg
+
+    def start_config(self, targets, **overrides):
+        cfg = self.make_config(targets, **overrides)
+        return cfg, self.script["prepare_config"](self.app, cfg)
+
+    def reload(self, cfg):
+        return self.script["reload_config"](self.app, cfg, LOGGER, self.mailer)
+
+
+class ReloadTargetsTest(TargetsConfig, unittest.TestCase):
+    def test_targets_added_removed_changed(self):
+        cfg, targets = self.start_config(["https://a.example.com/", "https://b.example.com/ interval=30"])
+        self.assertEqual(targets, {"https://a.example.com/": {}, "https://b.example.com/": {"interval": 30}})
+        self.assertIsNone(self.reload(cfg))
+        self.app.reloads.append(lambda: self.make_config(
+            ["https://b.example.com/ interval=60 contains=ok", "https://c.example.com/"],
+            CHECK_INTERVAL_SECONDS=2, SMTP_HOST="mail.example.com", PROBE_CONCURRENCY=10))
+        with self.assertLogs(LOGGER, "INFO") as logs:
+            targets = self.reload(cfg)
+        self.assertEqual(self.app.extra_paths, (self.targets_file,))
+        self.assertEqual(targets, {"https://b.example.com/": {"interval": 60, "contains": "ok"},
+                                   "https://c.example.com/": {}})
+        # 可热加载的配置项原地更新，其余配置项重启后生效
+        self.assertEqual((cfg["CHECK_INTERVAL_SECONDS"], cfg["SMTP_HOST"]), (2, "mail.example.com"))
+        self.assertEqual(cfg["PROBE_CONCURRENCY"], 200)
+        self.assertEqual(self.mailer.reconnects, 1)
+        self.assertIn("重启后生效: PROBE_CONCURRENCY", "\n".join(logs.output))
+
+    def test_invalid_config_keeps_old(self):
+        cfg, _ = self.start_config(["https://a.example.com/"])
+        before = dict(cfg)
+
+        def missing_key():
+            raise ValueError("配置文件中缺少必需的配置项: SMTP_HOST")
+
+        invalid = [
+            missing_key,
+            lambda: self.make_config(["https://a.example.com/"], PROBE_METHOD="bogus", CHECK_INTERVAL_SECONDS=9),
+            lambda: self.make_config(["https://a.example.com/ colour=red"]),
+            lambda: self.make_config(["https://a.example.com/"], TARGETS_FILE="missing.txt"),
+            # 运行中不能切换为单目标模式
+            lambda: self.make_config([], TARGETS_FILE=None, TARGET_URL="https://a.example.com/"),
+        ]
+        for reload_config in invalid:
+            self.app.reloads.append(reload_config)
+            with self.assertLogs(LOGGER, "ERROR") as logs:
+                self.assertIsNone(self.reload(cfg))
+            self.assertIn("沿用原配置", logs.output[0])
+        self.assertEqual(cfg, before)
+        self.assertEqual(self.mailer.reconnects, 0)
+
+
+class RunningReloadTest(TargetsConfig, unittest.TestCase):
+    """多目标监控运行中重新加载配置：增删与修改目标只影响变化的目标。"""
+
+    def setUp(self):
+        super().setUp()
+        self.server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def exported(self):
+        """当前导出了状态的目标。"""
+        text = self.app.metrics.render().decode("utf-8")
+        return {path for path in ("/a", "/b", "/c") if 'target_up{{url="{}{}"}}'.format(self.base, path) in text}
+
+    def test_apply_reloaded_targets(self):
+        cfg, targets = self.start_config(["{}/a".format(self.base), "{}/b".format(self.base)],
+                                         CONFIG_RELOAD_SECONDS=0.05)
+        # 移除 b、新增 c；a 改为检查不存在的内容，确认后变为不可达
+        reloaded = ["{}/a contains=missing".format(self.base), "{}/c".format(self.base)]
+        stop = threading.Event()
+        deadline = time.monotonic() + 10
+        steps = []
+
+        def on_poll():
+            if time.monotonic() > deadline:
+                stop.set()
+            elif not steps and self.exported() == {"/a", "/b"}:
+                steps.append("reload")
+                self.app.reloads.append(lambda: self.make_config(reloaded, CONFIG_RELOAD_SECONDS=0.05))
+                self.app.reloads.append(lambda: self.make_config(reloaded, PROBE_METHOD="bogus"))
+            elif steps == ["reload"] and self.exported() == {"/a", "/c"} and self.mailer.sent:
+                steps.append("done")
+                stop.set()
+
+        self.app.on_poll = on_poll
+        with self.assertLogs(LOGGER, "INFO") as logs:
+            self.script["run_multi_target"](self.app, cfg, LOGGER, self.mailer, targets, stop=stop)
+        self.assertEqual(steps, ["reload", "done"])
+        output = "\n".join(logs.output)
+        self.assertIn("新增 1，移除 1，共 2 个目标", output)
+        self.assertIn("重新加载配置失败，沿用原配置", output)
+        # 新配置无效时目标列表不变：c 仍在探测
+        self.assertEqual(self.exported(), {"/a", "/c"})
+        self.assertIn("状态变更: {}/a True -> False".format(self.base), output)
+        # 移除的目标不再导出，也不保留其标签缓存与状态
+        self.assertNotIn(self.base + "/b", self.app.metrics.render().decode("utf-8"))
+        self.assertNotIn((("url", self.base + "/b"),), self.app.metrics._labels)
+        state = (self.app.root / "rundata" / "targets-state.json").read_text(encoding="utf-8")
+        self.assertNotIn(self.base + "/b", state)
+        self.assertIn(self.base + "/c", state)
+
+
+if __name__ == "__main__":
+    unittest.main()
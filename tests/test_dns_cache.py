@@ -0,0 +1,296 @@
+"""
+DNS 缓存的测试：用替换的 resolver 模拟解析结果，用本机 UDP 模拟 DNS 服务器测试报文解析
+"""
+import asyncio
+import socket
+import struct
+import time
+import unittest
+from unittest import mock
+
+from src.dns_cache import DnsCache, _parse_response
+
+
+class Clock:
+    """替换 time.monotonic 的可手动推进的时钟。"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubResolver:
+    """按 answers 返回解析结果的 resolver：值为 (地址列表, TTL) 或异常。"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    async def __call__(self, host):
+        self.calls.append(host)
+        await asyncio.sleep(0)
+        answer = self.answers[host]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def v4(address):
+    return socket.AF_INET, (address, 0)
+
+
+class DnsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.clock = Clock()
+        patcher = mock.patch("src.dns_cache.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def resolve(self, cache, host, port=80, refresh=False):
+        return self.loop.run_until_complete(cache.resolve(host, port, refresh))
+
+    def test_caches_until_ttl_expires(self):
+        resolver = StubResolver({"a.test": ([v4("10.0.0.1")], 60)})
+        cache = DnsCache(ttl=300, resolver=resolver)
+        infos = self.resolve(cache, "a.test", 443)
+        self.assertEqual(infos[0][4], ("10.0.0.1", 443))
+        self.clock.now += 59
+        self.resolve(cache, "a.test")
+        self.assertEqual(len(resolver.calls), 1)
+        self.clock.now += 2
+        self.resolve(cache, "a.test")
+        self.assertEqual(len(resolver.calls), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_ttl_capped_by_config(self):
+        resolver = StubResolver({"a.test": ([v4("10.0.0.1")], 86400)})
+        cache = DnsCache(ttl=30, resolver=resolver)
+        self.resolve(cache, "a.test")
+        self.clock.now += 31
+        self.resolve(cache, "a.test")
+        self.assertEqual(len(resolver.calls), 2)
+
+    def test_refresh_bypasses_cache(self):
+        resolver = StubResolver({"a.test": ([v4("10.0.0.1")], 60)})
+        cache = DnsCache(resolver=resolver)
+        self.resolve(cache, "a.test")
+        self.resolve(cache, "a.test", refresh=True)
+        self.assertEqual(len(resolver.calls), 2)
+
+    def test_literal_address_not_resolved(self):
+        resolver = StubResolver({})
+        cache = DnsCache(resolver=resolver)
+        self.assertEqual(self.resolve(cache, "127.0.0.1", 8080)[0][4], ("127.0.0.1", 8080))
+        self.assertEqual(self.resolve(cache, "::1", 8080)[0][0], socket.AF_INET6)
+        self.assertEqual(resolver.calls, [])
+
+    def test_negative_cache(self):
+        resolver = StubResolver({"gone.test": socket.gaierror(socket.EAI_NONAME, "域名不存在")})
+        cache = DnsCache(negative_ttl=30, resolver=resolver)
+        for _ in range(3):
+            with self.assertRaises(socket.gaierror):
+                self.resolve(cache, "gone.test")
+        self.assertEqual(len(resolver.calls), 1)
+        self.assertEqual((cache.failures, cache.negative_hits), (1, 2))
+        self.clock.now += 31
+        resolver.answers["gone.test"] = ([v4("10.0.0.2")], 60)
+        self.assertEqual(self.resolve(cache, "gone.test")[0][4][0], "10.0.0.2")
+
+    def test_serves_stale_on_failure(self):
+        resolver = StubResolver({"a.test": ([v4("10.0.0.1")], 60)})
+        cache = DnsCache(negative_ttl=10, stale_ttl=300, resolver=resolver)
+        self.resolve(cache, "a.test")
+        resolver.answers["a.test"] = asyncio.TimeoutError()
+        self.clock.now += 61
+        self.assertEqual(self.resolve(cache, "a.test")[0][4][0], "10.0.0.1")
+        self.assertEqual(cache.stale_hits, 1)
+        # 沿用旧结果后 negative_ttl 秒内不再解析
+        self.clock.now += 5
+        self.resolve(cache, "a.test")
+        self.assertEqual(len(resolver.calls), 2)
+
+    def test_stale_window_expires(self):
+        resolver = StubResolver({"a.test": ([v4("10.0.0.1")], 60)})
+        cache = DnsCache(stale_ttl=100, resolver=resolver)
+        self.resolve(cache, "a.test")
+        resolver.answers["a.test"] = OSError("网络不可达")
+        self.clock.now += 60 + 101
+        with self.assertRaises(socket.gaierror):
+            self.resolve(cache, "a.test")
+        self.assertEqual(cache.stale_hits, 0)
+
+    def test_lru_eviction(self):
+        resolver = StubResolver({host: ([v4("10.0.0.{}".format(index))], 60)
+                                 for index, host in enumerate(("a.test", "b.test", "c.test"))})
+        cache = DnsCache(max_entries=2, resolver=resolver)
+        self.resolve(cache, "a.test")
+        self.resolve(cache, "b.test")
+        self.resolve(cache, "a.test")  # a 最近使用，淘汰 b
+        self.resolve(cache, "c.test")
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+        self.resolve(cache, "a.test")
+        self.assertEqual(resolver.calls.count("a.test"), 1)
+        self.resolve(cache, "b.test")
+        self.assertEqual(resolver.calls.count("b.test"), 2)
+
+    def test_concurrent_lookups_coalesced(self):
+        resolver = StubResolver({"a.test": ([v4("10.0.0.1")], 60)})
+        cache = DnsCache(resolver=resolver)
+        results = self.loop.run_until_complete(
+            asyncio.gather(*[cache.resolve("a.test", 80) for _ in range(5)]))
+        self.assertEqual(len(resolver.calls), 1)
+        self.assertEqual(cache.coalesced, 4)
+        self.assertTrue(all(result == results[0] for result in results))
+
+
+def _name(host):
+    return b"".join(bytes([len(label)]) + label for label in host.encode("ascii").split(b".")) + b"\0"
+
+
+def build_response(query, answers=(), rcode=0, truncated=False):
+    """按查询报文构造应答；answers 为 [(类型, TTL, rdata)]，名称用指向问题的压缩指针。"""
+    query_id, _, _, _, _, _ = struct.unpack_from("!HHHHHH", query)
+    question = query[12:]
+    flags = 0x8180 | rcode | (0x0200 if truncated else 0)
+    packet = struct.pack("!HHHHHH", query_id, flags, 1, len(answers), 0, 0) + question
+    for rtype, ttl, rdata in answers:
+        packet += b"\xc0\x0c" + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+    return packet
+
+
+class StubDnsServer(asyncio.DatagramProtocol):
+    """本机 UDP DNS 服务器：zone 为 {(主机, 类型): 应答参数}，未列出的主机返回 NXDOMAIN。"""
+
+    def __init__(self, zone):
+        self.zone = zone
+        self.queries = []
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        pos, labels = 12, []
+        while data[pos]:
+            labels.append(data[pos + 1:pos + 1 + data[pos]].decode("ascii"))
+            pos += 1 + data[pos]
+        qtype = struct.unpack_from("!H", data, pos + 1)[0]
+        host = ".".join(labels)
+        self.queries.append((host, qtype))
+        answer = self.zone.get((host, qtype))
+        if answer == "drop":
+            return
+        if answer == "mismatch":
+            response = build_response(data, [(1, 60, bytes([10, 6, 6, 6]))])
+            self.transport.sendto(struct.pack("!H", (struct.unpack_from("!H", response)[0] + 1) & 0xFFFF)
+                                  + response[2:], addr)
+            return
+        if answer is None:
+            has_other = any(name == host for name, _ in self.zone)
+            self.transport.sendto(build_response(data, rcode=0 if has_other else 3), addr)
+        else:
+            self.transport.sendto(build_response(data, **answer), addr)
+
+
+class DnsWireTest(unittest.TestCase):
+    ZONE = {
+        ("a.test", 1): {"answers": [(5, 300, _name("edge.cdn.test")), (1, 120, bytes([10, 0, 0, 1])),
+                                    (1, 90, bytes([10, 0, 0, 2]))]},
+        ("v6.test", 28): {"answers": [(28, 60, socket.inet_pton(socket.AF_INET6, "2001:db8::1"))]},
+        ("big.test", 1): {"truncated": True},
+        ("fail.test", 1): {"rcode": 2},
+        ("slow.test", 1): "drop",
+    }
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = StubDnsServer(self.ZONE)
+        transport, _ = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: self.server, local_addr=("127.0.0.1", 0)))
+        self.transport = transport
+        self.nameserver = "127.0.0.1:{}".format(transport.get_extra_info("sockname")[1])
+
+    def tearDown(self):
+        self.transport.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def resolve(self, cache, host):
+        return self.loop.run_until_complete(cache.resolve(host, 443))
+
+    def test_a_records_with_cname_chain(self):
+        cache = DnsCache(ttl=300, nameservers=[self.nameserver])
+        infos = self.resolve(cache, "a.test")
+        self.assertEqual([info[4] for info in infos], [("10.0.0.1", 443), ("10.0.0.2", 443)])
+        # 缓存时间取回答（含 CNAME）中最小的 TTL
+        self.assertAlmostEqual(cache._entries["a.test"].expires - time.monotonic(), 90, delta=5)
+
+    def test_falls_back_to_aaaa(self):
+        cache = DnsCache(nameservers=[self.nameserver])
+        infos = self.resolve(cache, "v6.test")
+        self.assertEqual(infos[0][0], socket.AF_INET6)
+        self.assertEqual(infos[0][4][:2], ("2001:db8::1", 443))
+        self.assertEqual(self.server.queries, [("v6.test", 1), ("v6.test", 28)])
+
+    def test_nxdomain_and_server_error(self):
+        cache = DnsCache(nameservers=[self.nameserver])
+        with self.assertRaises(socket.gaierror) as ctx:
+            self.resolve(cache, "missing.test")
+        self.assertIn("域名不存在", str(ctx.exception))
+        with self.assertRaises(socket.gaierror) as ctx:
+            self.resolve(cache, "fail.test")
+        self.assertIn("错误码 2", str(ctx.exception))
+
+    def test_timeout_is_a_failure(self):
+        cache = DnsCache(nameservers=[self.nameserver], timeout=0.2)
+        with self.assertRaises(socket.gaierror) as ctx:
+            self.resolve(cache, "slow.test")
+        self.assertIn("无响应", str(ctx.exception))
+
+    def test_truncated_falls_back_to_system(self):
+        cache = DnsCache(nameservers=[self.nameserver])
+
+        async def system(host):
+            return [(socket.AF_INET, ("10.9.9.9", 0))], 300
+
+        cache._query_system = system
+        self.assertEqual(self.resolve(cache, "big.test")[0][4], ("10.9.9.9", 443))
+
+    def test_mismatched_reply_tries_next_nameserver(self):
+        spoofer = StubDnsServer({("a.test", 1): "mismatch"})
+        transport, _ = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: spoofer, local_addr=("127.0.0.1", 0)))
+        first = "127.0.0.1:{}".format(transport.get_extra_info("sockname")[1])
+        try:
+            cache = DnsCache(nameservers=[first, self.nameserver])
+            infos = self.resolve(cache, "a.test")
+            self.assertEqual([info[4] for info in infos], [("10.0.0.1", 443), ("10.0.0.2", 443)])
+            self.assertEqual(spoofer.queries, [("a.test", 1)])
+            # 只有不匹配的应答时按服务器无响应处理
+            cache = DnsCache(nameservers=[first])
+            with self.assertRaises(socket.gaierror) as ctx:
+                self.resolve(cache, "a.test")
+            self.assertIn("不匹配", str(ctx.exception))
+        finally:
+            transport.close()
+
+    def test_parse_rejects_mismatched_id(self):
+        query = struct.pack("!HHHHHH", 7, 0x0100, 1, 0, 0, 0) + _name("a.test") + struct.pack("!HH", 1, 1)
+        response = build_response(query, [(1, 60, bytes([10, 0, 0, 1]))])
+        self.assertEqual(_parse_response(response, 7, 1), ([(socket.AF_INET, ("10.0.0.1", 0))], 60))
+        with self.assertRaises(socket.gaierror):
+            _parse_response(response, 8, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
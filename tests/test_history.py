@@ -0,0 +1,202 @@
+"""
+检查历史的测试：记录追加、小时索引的按目标查找、重启时只从索引之后重建、迟到记录与压缩
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.history import INDEX_RECORD, RECORD, HistoryStore, _IndexRows
+
+DAY = 19700 * 86400  # 某天 UTC 零点
+URLS = ["https://site{}.example.com/".format(index) for index in range(50)]
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = Path(self.tmp.name)
+
+    def store(self, **options):
+        return HistoryStore(self.directory, retention_days=0, **options)
+
+    def fill(self, store, day_start, hours=24):
+        """每个目标每小时检查两次，第 i 个目标在 (小时 + i) % 3 == 0 的小时第二次失败。"""
+        for hour in range(hours):
+            for index, url in enumerate(URLS):
+                ts = day_start + hour * 3600
+                store.append(url, ts, 200, 10 + index, None, True)
+                ok = (hour + index) % 3 != 0
+                store.append(url, ts + 60, 200 if ok else 503, 20, None if ok else "http", ok)
+
+    def expected(self, index, hours=range(24)):
+        failed = sum(1 for hour in hours if (hour + index) % 3 == 0)
+        return {"total": 2 * len(hours), "ok": 2 * len(hours) - failed}
+
+    def check(self, stats, expected):
+        self.assertEqual({"total": stats["total"], "ok": stats["ok"]}, expected)
+
+    def test_query_round_trip(self):
+        store = self.store()
+        store.append(URLS[0], DAY + 5, 200, 123456, None, True, reused=True, degraded=True)
+        store.append(URLS[0], DAY + 65, None, 5000, "timeout", False)
+        store.append(URLS[1], DAY + 70, 200, 8, None, True)
+        records = list(store.query(URLS[0], DAY, DAY + 3600))
+        self.assertEqual([(r.ts, r.status_code, r.latency_ms, r.error_class, r.ok, r.reused, r.degraded)
+                          for r in records],
+                         [(DAY + 5, 200, 0xFFFF, None, True, True, True),
+                          (DAY + 65, None, 5000, "timeout", False, False, False)])
+        self.assertEqual(list(store.query("https://unknown.example.com/", DAY, DAY + 3600)), [])
+
+    def test_uptime_from_sorted_index(self):
+        store = self.store()
+        self.fill(store, DAY)
+        self.fill(store, DAY + 86400, hours=1)  # 换天写出前一天的索引
+        store.close()
+        data = (self.directory / "2023-12-09.idx").read_bytes()
+        ids = [record[0] for record in INDEX_RECORD.iter_unpack(data)]
+        self.assertEqual(ids[:-1], sorted(ids[:-1]))
+
+        store = self.store()
+        for index in (0, 17, 49):
+            self.check(store.uptime(URLS[index], DAY, DAY + 86400), self.expected(index))
+            # 区间两端按所在的整小时统计
+            self.check(store.uptime(URLS[index], DAY + 5 * 3600 + 10, DAY + 8 * 3600),
+                       self.expected(index, range(5, 8)))
+        # 二分查找目标所在位置，只读取该目标的记录，不解析整个索引文件
+        probe = _IndexRows.__getitem__
+        with mock.patch.object(_IndexRows, "__getitem__", autospec=True, side_effect=probe) as getitem, \
+                mock.patch.object(HistoryStore, "_read_index") as read_index, \
+                mock.patch.object(HistoryStore, "_build_buckets") as build_buckets:
+            self.check(store.uptime(URLS[17], DAY, DAY + 86400), self.expected(17))
+        self.assertLessEqual(getitem.call_count, (len(URLS) * 24).bit_length())
+        self.assertFalse(read_index.called or build_buckets.called)
+        stats = store.uptime(URLS[3], DAY, DAY + 2 * 86400)
+        self.assertEqual(stats["total"], 48 + 2)
+        self.assertEqual(store.uptime("https://unknown.example.com/", DAY, DAY + 86400)["total"], 0)
+
+    def test_stale_index_rebuilt(self):
+        store = self.store()
+        self.fill(store, DAY)
+        store.close()
+        # 关闭后又追加了记录（例如索引写出前进程退出）：索引覆盖的长度与记录文件不符
+        with open(str(self.directory / "2023-12-09.bin"), "ab") as f:
+            f.write(RECORD.pack(DAY + 10, 0, 200, 1, 0, 1))
+        store = self.store()
+        self.assertEqual(store.uptime(URLS[0], DAY, DAY + 3600)["total"], 3)
+
+    def test_old_index_without_trailer(self):
+        store = self.store()
+        self.fill(store, DAY)
+        store.close()
+        idx_path = self.directory / "2023-12-09.idx"
+        idx_path.write_bytes(idx_path.read_bytes()[:-INDEX_RECORD.size])
+        store = self.store()
+        self.check(store.uptime(URLS[5], DAY, DAY + 86400), self.expected(5))
+        # 比记录文件旧的索引不可信，从记录重建
+        bin_stat = (self.directory / "2023-12-09.bin").stat()
+        os.utime(str(idx_path), (bin_stat.st_atime - 10, bin_stat.st_mtime - 10))
+        store = self.store()
+        self.check(store.uptime(URLS[5], DAY, DAY + 86400), self.expected(5))
+
+    def test_restart_rebuilds_only_after_index(self):
+        store = self.store(flush_interval=0, index_interval=0)
+        self.fill(store, DAY, hours=12)
+        store.flush()
+        # index_interval 未到：只追加记录，不写出索引
+        store.index_interval = 3600
+        self.fill(store, DAY + 12 * 3600, hours=2)
+        store.flush()
+        bin_size = (self.directory / "2023-12-09.bin").stat().st_size
+        # 模拟异常退出：最后一条记录只写了一半
+        with open(str(self.directory / "2023-12-09.bin"), "ab") as f:
+            f.write(RECORD.pack(DAY + 14 * 3600, 0, 200, 1, 0, 1)[:5])
+
+        offsets = []
+        iter_day = HistoryStore._iter_day
+
+        def tracking_iter_day(self, day, offset=0):
+            offsets.append(offset)
+            return iter_day(self, day, offset)
+
+        with mock.patch.object(HistoryStore, "_iter_day", tracking_iter_day):
+            store = self.store()
+            store.append(URLS[0], DAY + 14 * 3600, 200, 5, None, True)
+        self.assertEqual(offsets, [12 * len(URLS) * 2 * RECORD.size])
+        self.assertEqual((self.directory / "2023-12-09.bin").stat().st_size, bin_size)
+        stats = store.uptime(URLS[7], DAY, DAY + 14 * 3600)
+        self.check(stats, self.expected(7, range(14)))
+        self.assertEqual(store.uptime(URLS[0], DAY + 14 * 3600, DAY + 15 * 3600)["total"], 1)
+
+    def test_corrupt_index_offset_ignored(self):
+        store = self.store()
+        self.fill(store, DAY, hours=2)
+        store.close()
+        # 记录文件被替换成更短的内容：索引覆盖的长度超出文件，整天重建
+        bin_path = self.directory / "2023-12-09.bin"
+        bin_path.write_bytes(bin_path.read_bytes()[:RECORD.size * 10])
+        store = self.store()
+        store.append(URLS[0], DAY + 7200, 200, 5, None, True)
+        # 剩下的 10 条记录中前两条属于该目标，再加上新追加的一条
+        self.assertEqual(store.uptime(URLS[0], DAY, DAY + 86400)["total"], 3)
+
+    def test_late_record_goes_to_its_own_day(self):
+        store = self.store()
+        store.append(URLS[0], DAY + 100, 200, 5, None, True)
+        store.append(URLS[0], DAY + 86400 + 10, 200, 5, None, True)
+        # 跨零点完成的探测：时间戳属于前一天
+        store.append(URLS[0], DAY + 86399, None, 5000, "timeout", False)
+        self.check(store.uptime(URLS[0], DAY + 86400, DAY + 2 * 86400), {"total": 1, "ok": 1})
+        self.check(store.uptime(URLS[0], DAY, DAY + 86400), {"total": 2, "ok": 1})
+        self.assertEqual([r.ts for r in store.query(URLS[0], DAY, DAY + 2 * 86400)],
+                         [DAY + 100, DAY + 86399, DAY + 86400 + 10])
+        self.assertEqual((self.directory / "2023-12-10.bin").stat().st_size, RECORD.size)
+
+    def test_compaction_keeps_hourly_index(self):
+        store = HistoryStore(self.directory, retention_days=5, raw_days=2)
+        self.fill(store, DAY, hours=2)
+        for offset in (1, 2):
+            store.append(URLS[0], DAY + offset * 86400, 200, 5, None, True)
+        # 压缩前写入的记录使索引过期：压缩时先重建索引
+        with open(str(self.directory / "2023-12-09.bin"), "ab") as f:
+            f.write(RECORD.pack(DAY + 10, 0, 200, 1, 0, 1))
+        for offset in (3, 4):
+            store.append(URLS[0], DAY + offset * 86400, 200, 5, None, True)
+        self.assertEqual(sorted(path.name for path in self.directory.glob("*.bin")),
+                         ["2023-12-11.bin", "2023-12-12.bin"])
+        self.check(store.uptime(URLS[3], DAY, DAY + 86400), self.expected(3, range(2)))
+        self.assertEqual(store.uptime(URLS[0], DAY, DAY + 86400)["total"], 5)
+        self.assertEqual(list(store.query(URLS[0], DAY, DAY + 86400)), [])
+        # 已压缩日期的迟到记录丢弃，不覆盖索引
+        store.append(URLS[0], DAY + 50, 200, 5, None, True)
+        self.assertEqual(store.dropped, 1)
+        self.assertEqual(store.uptime(URLS[0], DAY, DAY + 86400)["total"], 5)
+        # 超过保留天数后全部删除
+        store.append(URLS[0], DAY + 6 * 86400, 200, 5, None, True)
+        self.assertEqual(sorted(self.directory.glob("2023-12-09.*")), [])
+
+    def test_index_rebuild_uses_unique_temp_file(self):
+        store = self.store()
+        self.fill(store, DAY, hours=1)
+        store.flush()
+        written = []
+        write_bytes = Path.write_bytes
+
+        def tracking_write_bytes(path, data):
+            written.append(path.name)
+            return write_bytes(path, data)
+
+        # 命令行查询与运行中的监控同时重建索引时不共用临时文件
+        reader = self.store()
+        with mock.patch.object(Path, "write_bytes", tracking_write_bytes):
+            self.check(reader.uptime(URLS[1], DAY, DAY + 3600), self.expected(1, range(1)))
+        self.assertEqual(written, ["2023-12-09.idx.{}.tmp".format(os.getpid())])
+        # 只重建读取时文件中已有的记录，索引覆盖长度与其一致
+        with mock.patch.object(HistoryStore, "_bin_size", return_value=RECORD.size * 4):
+            self.assertEqual(self.store().uptime(URLS[0], DAY, DAY + 3600)["total"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+按主机限流的测试：令牌桶、并发上限、排队顺序，以及空闲主机状态的清理
+"""
+import asyncio
+import time
+import unittest
+
+from src.host_limiter import HostLimiter
+
+HOST = "a.example.com"
+
+
+class HostLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def complete(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def sleep(self, seconds):
+        self.complete(asyncio.sleep(seconds))
+
+    def test_disabled_without_rate_or_limit(self):
+        self.assertFalse(HostLimiter().enabled)
+        self.assertTrue(HostLimiter(rate=1).enabled)
+        self.assertTrue(HostLimiter(max_active=2).enabled)
+
+    def test_burst_then_rate(self):
+        limiter = HostLimiter(rate=50, burst=2)
+        waits = self.complete(asyncio.gather(*[limiter.acquire(HOST) for _ in range(3)]))
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        # 第三个探测等待一个令牌（1/50 秒）
+        self.assertGreaterEqual(waits[2], 0.015)
+        self.assertEqual(limiter.stats()["waited"], 1)
+        for _ in range(3):
+            limiter.release(HOST)
+        # 令牌补满后不保留该主机的状态
+        self.sleep(0.1)
+        self.assertEqual(limiter._hosts, {})
+
+    def test_max_active_in_arrival_order(self):
+        limiter = HostLimiter(max_active=1)
+        order = []
+
+        async def probe(name):
+            await limiter.acquire(HOST)
+            order.append(name)
+            await asyncio.sleep(0.01)
+            limiter.release(HOST)
+
+        self.complete(asyncio.gather(*[probe(name) for name in "abcd"]))
+        self.assertEqual(order, list("abcd"))
+        self.assertEqual(limiter._hosts, {})
+
+    def test_hosts_independent(self):
+        limiter = HostLimiter(max_active=1)
+        self.complete(limiter.acquire(HOST))
+        self.assertEqual(self.complete(limiter.acquire("b.example.com")), 0.0)
+
+    def test_cancelled_waiters_do_not_leak_on_release(self):
+        limiter = HostLimiter(max_active=1)
+        self.complete(limiter.acquire(HOST))
+        waiter = self.loop.create_task(limiter.acquire(HOST))
+        self.sleep(0)
+        waiter.cancel()
+        self.sleep(0)
+        self.assertEqual(limiter.queued(), 0)
+        limiter.release(HOST)
+        self.assertEqual(limiter._hosts, {})
+
+    def test_cancelled_waiters_do_not_leak_on_timer(self):
+        limiter = HostLimiter(rate=20, burst=1)
+        self.complete(limiter.acquire(HOST))
+        limiter.release(HOST)
+        # 令牌用完：排队的探测等待补充令牌的定时器
+        waiter = self.loop.create_task(limiter.acquire(HOST))
+        self.sleep(0)
+        self.assertIsNotNone(limiter._hosts[HOST].timer)
+        waiter.cancel()
+        self.sleep(0.1)
+        self.assertEqual(limiter._hosts, {})
+
+    def test_idle_cleanup_timer_does_not_delay_next_probe(self):
+        limiter = HostLimiter(rate=10, burst=2)
+        for _ in range(2):
+            self.complete(limiter.acquire(HOST))
+            limiter.release(HOST)
+        # 令牌用完后空闲：在令牌补满（0.2 秒）后清理
+        self.assertIsNotNone(limiter._hosts[HOST].timer)
+        started = time.monotonic()
+        self.complete(limiter.acquire(HOST))
+        # 只需等待一个令牌（0.1 秒），不等清理定时器
+        self.assertLess(time.monotonic() - started, 0.18)
+        limiter.release(HOST)
+        self.sleep(0.25)
+        self.assertEqual(limiter._hosts, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
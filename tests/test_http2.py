@@ -0,0 +1,389 @@
+"""
+HTTP/2 探测的测试：在本进程的事件循环中运行 h2 服务器（未安装 h2 时跳过）
+"""
+import asyncio
+import ssl
+import tempfile
+import time
+import unittest
+
+from src import http2, probe
+from src.probe import Connection, probe_url
+
+if http2.available():
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+    from hyperframe.frame import GoAwayFrame
+
+
+class H2Server:
+    """本机 h2 服务器，按路径返回不同的响应：
+
+    - /delay: 0.2 秒后返回 200
+    - /big: 返回 200 与 256KB 的响应体（按流量控制窗口发送）
+    - /hold: 等到 /goaway 发出 GOAWAY 后才返回 200
+    - /goaway: 发送 GOAWAY（last_stream_id 为上一个流），不响应本流
+    - 其他: 立即返回 200，响应体为路径
+    goaway_after 为 N 时每条连接的第 N 个请求以 GOAWAY 拒绝（如 nginx 的 http2_max_requests 轮换连接）。
+    TLS 握手未协商出 h2 时按 HTTP/1.1 返回 200。
+    """
+
+    def __init__(self, loop, ssl_context=None, goaway_after=None):
+        self.loop = loop
+        self.ssl_context = ssl_context
+        self.goaway_after = goaway_after
+        self.connections = 0
+        self.max_streams = 0
+        self.resets = []  # [(stream_id, error_code)]
+        self._server = None
+        self._released = None
+
+    def start(self):
+        self._released = asyncio.Event()
+        self._server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl_context))
+        return self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        self._server.close()
+        self.loop.run_until_complete(self._server.wait_closed())
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() != "h2":
+            await self._serve_h1(reader, writer)
+            return
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        active = set()
+        tasks = []
+        requests = 0
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests += 1
+                        if self.goaway_after and requests >= self.goaway_after:
+                            self._goaway(writer, event.stream_id - 2)
+                            continue
+                        active.add(event.stream_id)
+                        self.max_streams = max(self.max_streams, len(active))
+                        path = dict(event.headers)[":path"]
+                        tasks.append(asyncio.ensure_future(self._respond(conn, writer, event.stream_id, path, active)))
+                    elif isinstance(event, h2.events.StreamReset):
+                        active.discard(event.stream_id)
+                        self.resets.append((event.stream_id, event.error_code))
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        pass
+                writer.write(conn.data_to_send())
+        except (ConnectionError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _respond(self, conn, writer, stream_id, path, active):
+        try:
+            if path == "/delay":
+                await asyncio.sleep(0.2)
+            elif path == "/hold":
+                await self._released.wait()
+            elif path == "/goaway":
+                self._goaway(writer, stream_id - 2)
+                self._released.set()
+                return
+            body = b"x" * (256 * 1024) if path == "/big" else path.encode("utf-8")
+            conn.send_headers(stream_id, [(":status", "200"), ("content-length", str(len(body)))])
+            offset = 0
+            while offset < len(body) and stream_id in active:
+                window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                if window <= 0:
+                    writer.write(conn.data_to_send())
+                    await asyncio.sleep(0.01)
+                    continue
+                chunk = body[offset:offset + window]
+                offset += len(chunk)
+                conn.send_data(stream_id, chunk, end_stream=offset >= len(body))
+                writer.write(conn.data_to_send())
+                await asyncio.sleep(0)
+            if not body:
+                conn.end_stream(stream_id)
+            writer.write(conn.data_to_send())
+        except (h2.exceptions.StreamClosedError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            active.discard(stream_id)
+
+    def _goaway(self, writer, last_stream_id):
+        # 直接写 GOAWAY 帧，服务端的 h2 状态机保持打开
+        frame = GoAwayFrame(0)
+        frame.last_stream_id = last_stream_id
+        writer.write(frame.serialize())
+
+    async def _serve_h1(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nh1")
+        writer.close()
+
+
+@unittest.skipUnless(http2.available(), "未安装 h2")
+class Http2PoolTest(unittest.TestCase):
+    """在明文 TCP 上直接使用 HTTP/2（不经 TLS），ALPN 的协商结果由 negotiated 指定。"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = H2Server(self.loop)
+        self.port = self.server.start()
+        self.pool = http2.Http2Pool()
+        self.key = ("https", "127.0.0.1", self.port)
+        self.protocol = "h2"
+        self.connects = 0
+        self.fail_connects = 0
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    async def connect(self):
+        self.connects += 1
+        await asyncio.sleep(0.05)
+        if self.fail_connects:
+            self.fail_connects -= 1
+            raise ConnectionError("握手失败")
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        return Connection(reader, writer)
+
+    def negotiated(self, conn):
+        return self.protocol
+
+    async def fetch(self, path):
+        session, conn, reused = await self.pool.get(self.key, self.connect, self.negotiated)
+        stream = session.request("GET", "127.0.0.1", path, "test")
+        try:
+            status, _ = await session.response(stream)
+            complete, size = await session.read_body(stream)
+        finally:
+            session.end(stream)
+        return session, reused, status, size
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_streams_multiplexed_on_one_connection(self):
+        start = time.monotonic()
+        results = self.wait(asyncio.gather(*[self.fetch("/delay") for _ in range(5)]))
+        elapsed = time.monotonic() - start
+        self.assertEqual(self.connects, 1)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.max_streams, 5)
+        self.assertEqual(len({id(session) for session, _, _, _ in results}), 1)
+        self.assertEqual(sorted(reused for _, reused, _, _ in results), [False, True, True, True, True])
+        self.assertEqual({status for _, _, status, _ in results}, {200})
+        # 并发的流同时等待，总耗时接近单个请求
+        self.assertLess(elapsed, 0.6)
+
+    def test_concurrent_callers_wait_for_one_handshake(self):
+        sessions = self.wait(asyncio.gather(*[self.pool.get(self.key, self.connect, self.negotiated)
+                                             for _ in range(4)]))
+        self.assertEqual(self.connects, 1)
+        self.assertEqual(len({id(session) for session, _, _ in sessions}), 1)
+
+    def test_failed_handshake_lets_waiters_retry(self):
+        self.fail_connects = 1
+        results = self.wait(asyncio.gather(*[self.pool.get(self.key, self.connect, self.negotiated)
+                                            for _ in range(3)], return_exceptions=True))
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.connects, 2)
+        self.assertEqual(len({id(result[0]) for result in results if not isinstance(result, Exception)}), 1)
+
+    def test_alpn_fallback_remembers_origin(self):
+        self.protocol = "http/1.1"
+        session, conn, reused = self.wait(self.pool.get(self.key, self.connect, self.negotiated))
+        self.assertIsNone(session)
+        self.assertIsInstance(conn, Connection)
+        conn.close()
+        self.assertIn(self.key, self.pool.h1_origins)
+        # 之后直接走 HTTP/1.1，不再尝试建立连接
+        self.assertEqual(self.wait(self.pool.get(self.key, self.connect, self.negotiated)), (None, None, False))
+        self.assertEqual(self.connects, 1)
+
+    def test_alpn_fallback_expires(self):
+        self.protocol = "http/1.1"
+        self.pool.h1_retry = 0.05
+        _, conn, _ = self.wait(self.pool.get(self.key, self.connect, self.negotiated))
+        conn.close()
+        self.assertTrue(self.pool.is_h1_origin(self.key))
+        self.wait(asyncio.sleep(0.06))
+        # 回退期过后重新协商，源站已支持 h2 时改用 HTTP/2
+        self.protocol = "h2"
+        session, conn, _ = self.wait(self.pool.get(self.key, self.connect, self.negotiated))
+        self.assertIsNotNone(session)
+        self.assertEqual(self.connects, 2)
+        self.assertEqual(self.pool.h1_origins, {})
+        # 连接清理时也删除过期的回退记录
+        self.pool.h1_origins[("https", "old.test", 443)] = 0
+        self.pool.evict_idle()
+        self.assertEqual(self.pool.h1_origins, {})
+
+    def test_end_resets_unread_stream(self):
+        async def scenario():
+            session, _, _ = await self.pool.get(self.key, self.connect, self.negotiated)
+            stream = session.request("GET", "127.0.0.1", "/big", "test")
+            status, _ = await session.response(stream)
+            session.end(stream)
+            await asyncio.sleep(0.1)
+            # 同一连接上的其他流不受影响
+            _, reused, second, size = await self.fetch("/after")
+            return stream.stream_id, status, reused, second, size
+
+        stream_id, status, reused, second, size = self.wait(scenario())
+        self.assertEqual(status, 200)
+        self.assertIn((stream_id, h2.errors.ErrorCodes.CANCEL), self.server.resets)
+        self.assertTrue(reused)
+        self.assertEqual((second, size), (200, len(b"/after")))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_read_body_limit_leaves_connection_usable(self):
+        async def scenario():
+            session, _, _ = await self.pool.get(self.key, self.connect, self.negotiated)
+            stream = session.request("GET", "127.0.0.1", "/big", "test")
+            await session.response(stream)
+            complete, size = await session.read_body(stream, limit=1000)
+            session.end(stream)
+            return session, complete, size
+
+        session, complete, size = self.wait(scenario())
+        self.assertEqual((complete, size), (False, 1000))
+        self.assertTrue(session.is_usable(60))
+
+    def test_goaway_retires_connection(self):
+        async def scenario():
+            session, _, _ = await self.pool.get(self.key, self.connect, self.negotiated)
+            held = session.request("GET", "127.0.0.1", "/hold", "test")
+            refused = session.request("GET", "127.0.0.1", "/goaway", "test")
+            errors = []
+            # h2 收到 GOAWAY 后不再接受任何帧，服务器已接收的流也随之失败
+            for stream in (refused, held):
+                try:
+                    await session.response(stream)
+                except ConnectionError as exc:
+                    errors.append(str(exc))
+                session.end(stream)
+            usable = session.is_usable(60)
+            replacement, _, reused = await self.pool.get(self.key, self.connect, self.negotiated)
+            return errors, usable, replacement is session, reused
+
+        errors, usable, same, reused = self.wait(scenario())
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all("GOAWAY" in error for error in errors))
+        self.assertFalse(usable)
+        self.assertFalse(same)
+        self.assertFalse(reused)
+        self.assertEqual(self.connects, 2)
+
+
+@unittest.skipUnless(http2.available(), "未安装 h2")
+class Http2ProbeTest(unittest.TestCase):
+    """经 TLS 与 ALPN 的完整探测；需要 openssl 命令生成自签名证书。"""
+
+    @classmethod
+    def setUpClass(cls):
+        from src.benchmark import make_certificate
+
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.cert = make_certificate(cls.workdir.name)
+        if cls.cert is None:
+            cls.workdir.cleanup()
+            raise unittest.SkipTest("需要 openssl 命令生成证书")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ssl_context = ssl.create_default_context(cafile=self.cert[0])
+        self.ssl_context.set_alpn_protocols(http2.ALPN_PROTOCOLS)
+        self.servers = []
+        self.pool = http2.Http2Pool()
+
+    def tearDown(self):
+        self.pool.close()
+        for server in self.servers:
+            server.stop()
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def start_server(self, protocols, goaway_after=None):
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(*self.cert)
+        context.set_alpn_protocols(protocols)
+        server = H2Server(self.loop, context, goaway_after)
+        self.servers.append(server)
+        return server, server.start()
+
+    def probe(self, url):
+        return self.loop.run_until_complete(probe_url(url, 5, pool=probe.ConnectionPool(), h2_pool=self.pool,
+                                                      ssl_context=self.ssl_context))
+
+    def test_h2_origin_probed_over_http2(self):
+        server, port = self.start_server(["h2", "http/1.1"])
+        results = [self.probe("https://localhost:{}/p{}".format(port, index)) for index in range(3)]
+        self.assertTrue(all(result.ok and result.http2 for result in results))
+        self.assertEqual([result.reused for result in results], [False, True, True])
+        self.assertEqual(server.connections, 1)
+
+    def test_goaway_on_reused_connection_retried(self):
+        server, port = self.start_server(["h2"], goaway_after=3)
+        results = [self.probe("https://localhost:{}/p{}".format(port, index)) for index in range(4)]
+        self.assertEqual([(result.ok, result.error) for result in results], [(True, None)] * 4)
+        # 第三次探测在复用的连接上被 GOAWAY 拒绝，换新连接重试成功，之后复用新连接
+        self.assertEqual([result.reused for result in results], [False, True, False, True])
+        self.assertEqual(server.connections, 2)
+
+    def test_h1_origin_falls_back(self):
+        server, port = self.start_server(["http/1.1"])
+        result = self.probe("https://localhost:{}/".format(port))
+        self.assertTrue(result.ok, result.error)
+        self.assertFalse(result.http2)
+        self.assertIn(("https", "localhost", port), self.pool.h1_origins)
+        # 回退时复用 ALPN 握手建立的连接，不重新握手
+        self.assertEqual(server.connections, 1)
+
+    def test_engine_sets_alpn_on_given_context(self):
+        server, port = self.start_server(["h2", "http/1.1"])
+        engine = probe.ProbeEngine(loop=self.loop, http2=True,
+                                   ssl_context=ssl.create_default_context(cafile=self.cert[0]))
+        try:
+            results = engine.run_batch(["https://localhost:{}/p{}".format(port, index) for index in range(3)])
+        finally:
+            # 事件循环由本测试共用，只关闭引擎的连接
+            engine.pool.close()
+            engine.h2_pool.close()
+        self.assertTrue(all(result.ok and result.http2 for result in results), [r.error for r in results])
+        self.assertEqual(server.connections, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+日志处理的测试：按天切分的日志文件，以及日志保留的按天数、按大小清理与压缩（含压缩中途退出的残留文件）
+"""
+import gzip
+import logging
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from src.log_handlers import DailyFileHandler, LogRetention
+
+PREFIX = "app"
+TODAY = date(2024, 3, 10)
+
+
+def record(message, created):
+    item = logging.LogRecord("test", logging.INFO, __file__, 1, message, None, None)
+    item.created = created
+    return item
+
+
+class DailyFileHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = Path(self.tmp.name)
+
+    def test_rollover_at_midnight(self):
+        closed = []
+        handler = DailyFileHandler(self.directory, PREFIX, on_rollover=closed.append)
+        self.addCleanup(handler.close)
+        first = Path(handler.baseFilename)
+        self.assertEqual(first, handler.path_for(datetime.now()))
+        handler.emit(record("before", handler._next_rollover - 1))
+        next_day = handler._next_rollover + 5
+        handler.emit(record("after", next_day))
+        handler.emit(record("later", next_day + 60))
+        second = handler.path_for(datetime.fromtimestamp(next_day))
+        self.assertEqual(closed, [str(first)])
+        self.assertEqual(handler.baseFilename, str(second))
+        self.assertEqual(first.read_text(encoding="utf-8"), "before\n")
+        handler.flush()
+        self.assertEqual(second.read_text(encoding="utf-8"), "after\nlater\n")
+        # 回调出错不影响写日志
+        handler.on_rollover = lambda path: 1 / 0
+        handler.emit(record("next", handler._next_rollover))
+        self.assertEqual(len(list(self.directory.glob("app-*.log"))), 3)
+
+
+class LogRetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = Path(self.tmp.name)
+
+    def write(self, days_ago, size=100, suffix=".log"):
+        day = TODAY - timedelta(days=days_ago)
+        path = self.directory / "{}-{}{}".format(PREFIX, day.strftime("%Y-%m-%d"), suffix)
+        if suffix == ".log.gz":
+            with gzip.open(str(path), "wb") as f:
+                f.write(b"x" * size)
+        else:
+            path.write_bytes(b"x" * size)
+        return path
+
+    def names(self):
+        return sorted(path.name for path in self.directory.iterdir())
+
+    def test_retention_days(self):
+        for days_ago in range(5):
+            self.write(days_ago)
+        (self.directory / "other-2024-01-01.log").write_bytes(b"x")
+        (self.directory / "app-notadate.log").write_bytes(b"x")
+        retention = LogRetention(self.directory, PREFIX, retention_days=2)
+        self.assertEqual(retention.run(TODAY), 3)
+        self.assertEqual(self.names(), ["app-2024-03-09.log", "app-2024-03-10.log", "app-notadate.log",
+                                        "other-2024-01-01.log"])
+        # 换天后只检查新出现的日期文件，当天的文件不计入索引
+        self.assertEqual(retention.run(TODAY + timedelta(days=1)), 1)
+        self.assertEqual([item[0] for item in retention._files], [TODAY])
+        self.assertEqual(retention.deleted, 4)
+
+    def test_max_total_bytes_keeps_today(self):
+        for days_ago in range(4):
+            self.write(days_ago, size=100)
+        retention = LogRetention(self.directory, PREFIX, retention_days=0, max_total_bytes=250)
+        self.assertEqual(retention.run(TODAY), 2)
+        self.assertEqual(self.names(), ["app-2024-03-09.log", "app-2024-03-10.log"])
+        retention = LogRetention(self.directory, PREFIX, retention_days=0, max_total_bytes=50)
+        self.assertEqual(retention.run(TODAY), 1)
+        self.assertEqual(self.names(), ["app-2024-03-10.log"])
+
+    def test_compress_closed_days(self):
+        for days_ago in range(3):
+            self.write(days_ago, size=10000)
+        retention = LogRetention(self.directory, PREFIX, retention_days=0, compress=True)
+        retention.run(TODAY)
+        self.assertEqual(self.names(), ["app-2024-03-08.log.gz", "app-2024-03-09.log.gz", "app-2024-03-10.log"])
+        self.assertEqual(retention.compressed, 2)
+        with gzip.open(str(self.directory / "app-2024-03-09.log.gz")) as f:
+            self.assertEqual(f.read(), b"x" * 10000)
+        self.assertEqual(retention.oldest(), self.directory / "app-2024-03-08.log.gz")
+
+    def test_leftover_log_after_interrupted_compression(self):
+        # 压缩写完 .log.gz 后、删除 .log 前进程退出：同一天两个文件只算一天
+        for days_ago in (1, 2, 3):
+            self.write(days_ago, size=1000)
+            self.write(days_ago, size=1000, suffix=".log.gz")
+        self.write(0)
+        retention = LogRetention(self.directory, PREFIX, retention_days=3)
+        self.assertEqual(retention.run(TODAY), 1)
+        self.assertEqual([item[1].name for item in retention._files],
+                         ["app-2024-03-08.log.gz", "app-2024-03-09.log.gz"])
+        # 按天清理时一并删除残留的 .log
+        self.assertEqual(self.names(), ["app-2024-03-08.log", "app-2024-03-08.log.gz",
+                                        "app-2024-03-09.log", "app-2024-03-09.log.gz", "app-2024-03-10.log"])
+        # 压缩时删除残留的 .log，大小只计 .log.gz
+        retention.compress = True
+        retention.run(TODAY)
+        self.assertEqual(self.names(), ["app-2024-03-08.log.gz", "app-2024-03-09.log.gz", "app-2024-03-10.log"])
+        self.assertEqual(retention.compressed, 0)
+        self.assertEqual([item[2] for item in retention._files],
+                         [(self.directory / name).stat().st_size
+                          for name in ("app-2024-03-08.log.gz", "app-2024-03-09.log.gz")])
+
+    def test_new_day_with_both_files_added_once(self):
+        self.write(0)
+        retention = LogRetention(self.directory, PREFIX, retention_days=0, compress=True)
+        retention.run(TODAY)
+        self.write(0, suffix=".log.gz")
+        self.write(-1)
+        retention.compress = False
+        retention.run(TODAY + timedelta(days=1))
+        self.assertEqual(len(retention._files), 1)
+        self.assertEqual(retention._files[0][1].name, "app-2024-03-10.log.gz")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+邮件发送队列的测试：用假的 SMTP 连接代替邮件服务器
+"""
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.mail_queue import MailDispatcher
+
+
+class FakeServer:
+    def __init__(self, sent, release=None):
+        self.sent = sent
+        self.release = release  # 设置后 send_message 等待该事件，模拟无响应的邮件服务器
+        self.quit_threads = []
+
+    def send_message(self, msg):
+        if self.release is not None:
+            self.release.wait(5)
+        self.sent.append(msg)
+
+    def noop(self):
+        pass
+
+    def quit(self):
+        self.quit_threads.append(threading.current_thread().name)
+
+
+class FakeApp:
+    """按 config["MAIL_TO"] 构造邮件的假应用，MAIL_TO 为空时与 base 一样抛出 RuntimeError。"""
+
+    logger = None
+
+    def __init__(self):
+        self.sent = []
+        self.release = None
+        self.servers = []
+
+    def is_mail_configured(self, config):
+        return True
+
+    def build_mail(self, config, subject, content):
+        if not config["MAIL_TO"]:
+            raise RuntimeError("SMTP配置不完整")
+        return subject
+
+    def open_smtp(self, config):
+        server = FakeServer(self.sent, self.release)
+        self.servers.append(server)
+        return server
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class MailDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.app = FakeApp()
+        self.config = {"MAIL_TO": "ops@example.com"}
+        self.dispatcher = MailDispatcher(self.app, self.config, coalesce_seconds=0.05, retry_backoff=0).start()
+
+    def tearDown(self):
+        self.dispatcher.close()
+
+    def test_coalesces_burst(self):
+        for index in range(3):
+            self.assertTrue(self.dispatcher.submit("告警{}".format(index), "内容"))
+        self.assertTrue(wait_until(lambda: self.dispatcher.sent == 3))
+        self.assertEqual(self.app.sent, ["监控告警汇总（3 条）"])
+
+    def test_build_error_counts_failed_and_keeps_worker(self):
+        # 热加载把 MAIL_TO 清空后构造邮件失败：计为失败，发送线程继续处理之后的邮件
+        self.config["MAIL_TO"] = ""
+        self.dispatcher.submit("告警1", "内容")
+        self.assertTrue(wait_until(lambda: self.dispatcher.failed == 1))
+        self.config["MAIL_TO"] = "ops@example.com"
+        self.dispatcher.submit("告警2", "内容")
+        self.assertTrue(wait_until(lambda: self.dispatcher.sent == 1))
+        self.assertEqual(self.app.sent, ["告警2"])
+
+    def test_worker_survives_unexpected_error(self):
+        calls = []
+
+        def broken(batch):
+            calls.append(batch)
+            raise AssertionError("意外错误")
+
+        self.dispatcher._deliver = broken
+        self.dispatcher.submit("告警1", "内容")
+        self.assertTrue(wait_until(lambda: calls))
+        del self.dispatcher._deliver
+        self.dispatcher.submit("告警2", "内容")
+        self.assertTrue(wait_until(lambda: self.dispatcher.sent == 1))
+        self.assertTrue(self.dispatcher._thread.is_alive())
+
+    def test_worker_closes_connection_on_close(self):
+        self.dispatcher.submit("告警1", "内容")
+        self.assertTrue(wait_until(lambda: self.dispatcher.sent == 1))
+        self.dispatcher.close()
+        self.assertEqual(self.app.servers[0].quit_threads, ["mail-dispatcher"])
+
+    def test_close_timeout_leaves_connection_to_worker(self):
+        self.app.release = threading.Event()
+        self.app.logger = mock.Mock()
+        self.dispatcher.submit("告警1", "内容")
+        self.assertTrue(wait_until(lambda: self.app.servers))
+        server = self.app.servers[0]
+        # 邮件服务器无响应：close() 超时后不在调用线程关闭正在发送的连接
+        self.dispatcher.close(timeout=0.1)
+        self.assertTrue(self.dispatcher._thread.is_alive())
+        self.assertEqual(server.quit_threads, [])
+        self.assertIn("未在 0.1s 内结束", self.app.logger.warning.call_args[0][0])
+        # 发送完成后由后台线程自己关闭连接
+        self.app.release.set()
+        self.dispatcher._thread.join(5)
+        self.assertEqual(self.dispatcher.sent, 1)
+        self.assertEqual(server.quit_threads, ["mail-dispatcher"])
+
+
+if __name__ == "__main__":
+    unittest.main()
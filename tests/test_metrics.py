@@ -0,0 +1,107 @@
+"""
+指标导出的测试：标签缓存与转义、Prometheus 文本格式、直方图、多份指标合并、/metrics 端点，
+以及目标移除时丢弃其标签缓存
+"""
+import gzip
+import unittest
+import urllib.request
+
+from src.metrics import CONTENT_TYPE, Histogram, MetricsRegistry, MetricsServer, merge_expositions
+from tests.support import load_script
+
+
+class Scheduler:
+    last_lag = 0.5
+    fired_total = 10
+    skipped_total = 0
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_labels_cached_and_escaped(self):
+        registry = MetricsRegistry()
+        text = registry.labels(url='https://a/"x"\\\n', kind="b")
+        self.assertEqual(text, '{kind="b",url="https://a/\\"x\\"\\\\\\n"}')
+        self.assertIs(registry.labels(kind="b", url='https://a/"x"\\\n'), text)
+        registry.forget_labels(url='https://a/"x"\\\n', kind="b")
+        self.assertEqual(registry._labels, {})
+
+    def test_render_format(self):
+        registry = MetricsRegistry(prefix="cwa_")
+
+        def collect(writer):
+            writer.family("up", "gauge", "是否可达")
+            writer.sample("up", True, registry.labels(url="https://a"))
+            writer.sample("up", False, registry.labels(url="https://b"))
+            writer.sample("up", None, registry.labels(url="https://c"))
+
+        def broken(writer):
+            raise RuntimeError("boom")
+
+        registry.register(collect)
+        registry.register(broken)
+        self.assertEqual(registry.render().decode("utf-8"), (
+            "# HELP cwa_up 是否可达\n# TYPE cwa_up gauge\n"
+            'cwa_up{url="https://a"} 1\ncwa_up{url="https://b"} 0\n'
+            "# HELP cwa_metrics_collector_errors 本次抓取中出错的采集函数数量\n"
+            "# TYPE cwa_metrics_collector_errors gauge\ncwa_metrics_collector_errors 1\n"))
+        registry.unregister(broken)
+        self.assertNotIn(b"errors", registry.render(include_errors=False))
+
+    def test_histogram_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = Histogram(registry, "latency_seconds", "耗时", buckets=(0.1, 1.0), label_name="phase")
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "total")
+        lines = registry.render(include_errors=False).decode("utf-8").splitlines()
+        self.assertEqual(lines[2:], [
+            'latency_seconds_bucket{phase="total",le="0.1"} 2',
+            'latency_seconds_bucket{phase="total",le="1.0"} 3',
+            'latency_seconds_bucket{phase="total",le="+Inf"} 4',
+            'latency_seconds_sum{phase="total"} 3.65',
+            'latency_seconds_count{phase="total"} 4',
+        ])
+        histogram.remove("total")
+        self.assertEqual(len(registry.render(include_errors=False).splitlines()), 2)
+
+    def test_merge_expositions(self):
+        first = "# HELP up 可达\n# TYPE up gauge\nup{url=\"a\"} 1\n# HELP total 次数\n# TYPE total counter\ntotal 3\n"
+        second = "# HELP up 可达\n# TYPE up gauge\nup{url=\"b\"} 0\n"
+        self.assertEqual(merge_expositions([('shard="0"', first), ('shard="1"', second)]), (
+            "# HELP up 可达\n# TYPE up gauge\n"
+            'up{shard="0",url="a"} 1\nup{shard="1",url="b"} 0\n'
+            '# HELP total 次数\n# TYPE total counter\ntotal{shard="0"} 3\n'))
+
+    def test_metrics_server(self):
+        registry = MetricsRegistry()
+        registry.register(lambda writer: writer.sample("up", 1))
+        server = MetricsServer(registry, port=0).start()
+        self.addCleanup(server.close)
+        url = "http://127.0.0.1:{}/metrics".format(server.port)
+        with urllib.request.urlopen(url) as resp:
+            self.assertEqual(resp.headers["Content-Type"], CONTENT_TYPE)
+            self.assertIn(b"up 1\n", resp.read())
+        request = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(request) as resp:
+            self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+            self.assertIn(b"up 1\n", gzip.decompress(resp.read()))
+
+
+class TargetMetricsTest(unittest.TestCase):
+    def test_forget_removed_target(self):
+        script = load_script()
+        registry = MetricsRegistry()
+        urls = {"https://a": {}, "https://b": {}}
+        states = {url: {"last_ok": True, "latency_ms": 120} for url in urls}
+        _, forget = script["register_target_metrics"](registry, urls, states.get, Scheduler())
+        text = registry.render().decode("utf-8")
+        self.assertIn('target_up{url="https://b"} 1\n', text)
+        self.assertIn('target_latency_seconds{url="https://a"} 0.12\n', text)
+        # 重新加载配置移除目标：不再导出，也不保留其标签缓存
+        del urls["https://b"]
+        forget("https://b")
+        self.assertNotIn("https://b", registry.render().decode("utf-8"))
+        self.assertEqual(list(registry._labels), [(("url", "https://a"),)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+异步探测的测试：在本机线程中运行 http.server 作为被探测的网站
+"""
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from src.assertions import ContentAssertions
+from src.probe import MAX_REDIRECTS, ConnectionPool, ProbeEngine, probe_url
+from src.probe_options import DEFAULT_PROBE_METHOD
+from src.scheduler import Scheduler
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/":
+            self._reply(301, b"", {"Location": "/home"})
+        elif self.path == "/home":
+            self._reply(200, b"<h1>Welcome home</h1>", {"Content-Type": "text/html"})
+        elif self.path == "/loop":
+            self._reply(302, b"", {"Location": "/loop"})
+        elif self.path == "/page":
+            self._reply(200, b"x" * 5000)
+        elif self.path == "/large":
+            self._reply(200, b"x" * (1024 * 1024))
+        elif self.path == "/away":
+            self._reply(302, b"", {"Location": "http://127.0.0.1:{}/home".format(self.server.server_port)})
+        else:
+            self._reply(404, b"not found")
+
+    def do_HEAD(self):
+        self._head = True
+        self.do_GET()
+
+    def _reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not getattr(self, "_head", False):
+            self.wfile.write(body)
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    connections = 0  # 已接受的连接数
+
+
+class ServerTestCase(unittest.TestCase):
+    """在本机启动测试网站，self.base 为其地址。"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(("127.0.0.1", 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = "http://127.0.0.1:{}".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+
+class ProbeRedirectTest(ServerTestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.loop.close()
+
+    def probe(self, path, **options):
+        assertions = ContentAssertions.from_options(options) if options else None
+        return self.loop.run_until_complete(probe_url(self.base + path, 5, pool=self.pool, assertions=assertions))
+
+    def test_redirect_without_assertions_is_reachable(self):
+        result = self.probe("/")
+        self.assertTrue(result.ok)
+        self.assertEqual(result.status_code, 301)
+
+    def test_assertions_checked_on_redirect_target(self):
+        result = self.probe("/", contains="Welcome")
+        self.assertTrue(result.ok, result.error)
+        self.assertEqual(result.status_code, 200)
+        self.assertIsNone(result.mismatch)
+
+    def test_absolute_redirect_and_mismatch_on_final_page(self):
+        result = self.probe("/away", contains="Goodbye")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.error_class, "content")
+
+    def test_redirect_loop_is_bounded(self):
+        result = self.probe("/loop", contains="Welcome")
+        self.assertFalse(result.ok)
+        self.assertIn(str(MAX_REDIRECTS), result.error)
+
+
+class ConnectionReuseTest(ServerTestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.loop.close()
+
+    def probe_twice(self, path, method, stream_bytes=0):
+        before = self.server.connections
+        results = [self.loop.run_until_complete(
+            probe_url(self.base + path, 5, pool=self.pool, method=method, stream_bytes=stream_bytes))
+            for _ in range(2)]
+        self.assertTrue(all(result.ok for result in results))
+        return [result.reused for result in results], self.server.connections - before
+
+    def test_default_method_reuses_connection(self):
+        # 默认配置：探测方式 DEFAULT_PROBE_METHOD，STREAM_READ_BYTES=0
+        self.assertEqual(self.probe_twice("/page", DEFAULT_PROBE_METHOD), ([False, True], 1))
+
+    def test_small_bodies_drained_for_every_method(self):
+        for method in ("get", "head", "range", "stream"):
+            with self.subTest(method=method):
+                self.pool.close()
+                # 测试服务器忽略 Range，range 方式同样收到完整响应体
+                self.assertEqual(self.probe_twice("/page", method), ([False, True], 1))
+
+    def test_large_body_not_downloaded(self):
+        reused, connections = self.probe_twice("/large", "stream", stream_bytes=100)
+        self.assertEqual((reused, connections), ([False, False], 2))
+
+
+class ProbeEngineStopTest(ServerTestCase):
+    def test_run_forever_returns_when_stop_set(self):
+        engine = ProbeEngine(loop=asyncio.new_event_loop())
+        self.addCleanup(engine.close)
+        scheduler = Scheduler()
+        scheduler.add(self.base + "/home", 0.05)
+        results = []
+        stop = threading.Event()
+
+        def on_result(result):
+            results.append(result)
+            if len(results) == 3:
+                stop.set()
+
+        started = time.monotonic()
+        engine.run_forever(scheduler, on_result, stop=stop)
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertTrue(all(result.ok for result in results[:3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+调度器的测试：按到期时间排序、固定节奏不漂移、落后时跳过错过的轮次、首次触发的随机打散范围，
+以及自适应检查间隔的逐步放宽、状态变化后的快速复查与恢复
+"""
+import random
+import unittest
+
+from src.scheduler import AdaptiveInterval, Scheduler
+
+
+class Clock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = Scheduler(clock=self.clock)
+
+    def advance_to(self, now):
+        self.clock.now = now
+        return self.scheduler.pop_due()
+
+    def test_fires_in_due_order(self):
+        self.scheduler.add("slow", 30)
+        self.scheduler.add("b", 10, delay=5)
+        self.scheduler.add("a", 10, delay=5)
+        self.scheduler.add("fast", 10, delay=2)
+        self.assertEqual(self.scheduler.pop_due(), ["slow"])
+        self.assertEqual(self.scheduler.seconds_until_next(), 2)
+        # 到期时间相同时按加入顺序
+        self.assertEqual(self.advance_to(105), ["fast", "b", "a"])
+        self.assertEqual(self.advance_to(112), ["fast"])
+        self.assertEqual(self.advance_to(130), ["b", "a", "fast", "slow"])
+        self.assertEqual(self.scheduler.stats()["fired"], 9)
+
+    def test_fixed_cadence_does_not_drift(self):
+        self.scheduler.add("a", 10, delay=10)
+        fired = []
+        # 每次都晚 0.5 秒触发，下次到期时间仍按 110、120、130 推进
+        for due in (110, 120, 130):
+            self.assertEqual(self.advance_to(due + 0.5), ["a"])
+            fired.append(self.scheduler.next_time())
+        self.assertEqual(fired, [120, 130, 140])
+        self.assertEqual(self.scheduler.stats()["last_lag"], 0.5)
+
+    def test_skips_missed_rounds(self):
+        self.scheduler.add("a", 10, delay=10)
+        # 落后 3.5 个周期：只触发一次，跳过 120、130、140，对齐到 150
+        self.assertEqual(self.advance_to(145), ["a"])
+        self.assertEqual(self.scheduler.next_time(), 150)
+        self.assertEqual(self.scheduler.stats()["skipped"], 3)
+        self.assertEqual(self.scheduler.stats()["max_lag"], 35)
+        self.scheduler.reset_stats()
+        self.assertEqual(self.scheduler.stats(), {"fired": 0, "last_lag": 0.0, "max_lag": 0.0, "avg_lag": 0.0,
+                                                  "skipped": 0})
+        self.assertEqual((self.scheduler.fired_total, self.scheduler.skipped_total), (1, 3))
+
+    def test_remove_and_reschedule(self):
+        self.scheduler.add("a", 10)
+        self.scheduler.add("b", 10, delay=1)
+        self.scheduler.remove("a")
+        self.scheduler.remove("missing")
+        self.assertNotIn("a", self.scheduler)
+        self.assertEqual(self.scheduler.next_time(), 101)
+        # 重新加入时旧的堆元素作废，不会触发两次
+        self.scheduler.add("b", 10, delay=3)
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.advance_to(101), [])
+        self.assertEqual(self.advance_to(103), ["b"])
+        self.scheduler.remove("b")
+        self.assertIsNone(self.scheduler.seconds_until_next())
+
+    def test_set_interval(self):
+        self.scheduler.add("a", 60, delay=60)
+        self.scheduler.set_interval("a", 10)
+        # 缩短间隔：不必等到原定的 160
+        self.assertEqual(self.scheduler.next_time(), 110)
+        self.assertEqual(self.advance_to(110), ["a"])
+        self.scheduler.set_interval("a", 120)
+        # 延长间隔：保持原到期时间，之后按新间隔
+        self.assertEqual(self.scheduler.next_time(), 120)
+        self.assertEqual(self.advance_to(120), ["a"])
+        self.assertEqual(self.scheduler.next_time(), 240)
+        self.scheduler.set_interval("missing", 10)
+        self.assertEqual(self.scheduler.interval("a"), 120)
+        self.assertIsNone(self.scheduler.interval("missing"))
+
+    def test_invalid_interval(self):
+        for interval in (0, -1):
+            with self.assertRaises(ValueError):
+                self.scheduler.add("a", interval)
+        self.scheduler.add("a", 10)
+        with self.assertRaises(ValueError):
+            self.scheduler.set_interval("a", 0)
+
+    def test_jitter_bounds(self):
+        random.seed(7)
+        for index in range(500):
+            self.scheduler.add(index, 60, jitter=10, delay=5)
+        dues = [self.scheduler._entries[index][2] for index in range(500)]
+        self.assertTrue(all(105 <= due <= 115 for due in dues))
+        # 打散到整个区间，而不是集中在一处
+        self.assertLess(min(dues), 106)
+        self.assertGreater(max(dues), 114)
+        self.assertEqual(len(self.advance_to(110)), sum(1 for due in dues if due <= 110))
+        self.scheduler.add("now", 60, jitter=0)
+        self.assertEqual(self.scheduler._entries["now"][2], 110)
+
+
+class AdaptiveIntervalTest(unittest.TestCase):
+    def setUp(self):
+        self.adaptive = AdaptiveInterval(min_interval=10, max_interval=240, stable_after=3)
+
+    def run_results(self, results, key="a", base=60):
+        return [self.adaptive.update(key, base, ok) for ok in results]
+
+    def test_backoff_while_stable(self):
+        # 每连续 3 次可达翻倍，最长 max_interval
+        self.assertEqual(self.run_results([True] * 10), [60, 60, 120, 120, 120, 240, 240, 240, 240, 240])
+
+    def test_fast_recheck_then_recover(self):
+        self.run_results([True] * 6)
+        # 状态变化后快速复查，连续 3 次相同后恢复基础间隔；持续不可达时保持基础间隔
+        self.assertEqual(self.run_results([False] * 6), [10, 10, 10, 60, 60, 60])
+        # 恢复可达后同样先快速复查，之后重新逐步放宽
+        self.assertEqual(self.run_results([True] * 7), [10, 10, 10, 60, 60, 60, 120])
+
+    def test_flapping_stays_fast(self):
+        self.run_results([True])
+        self.assertEqual(self.run_results([False, True, False, True, True, False]), [10] * 6)
+
+    def test_base_below_min_interval(self):
+        self.assertEqual(self.run_results([True, False, False, False, False], base=5), [5, 5, 5, 5, 5])
+        # max_interval 小于基础间隔时不缩短基础间隔
+        adaptive = AdaptiveInterval(min_interval=10, max_interval=30, stable_after=1)
+        self.assertEqual([adaptive.update("a", 60, True) for _ in range(3)], [60, 60, 60])
+
+    def test_keys_independent_and_forget(self):
+        self.run_results([True] * 3)
+        self.assertEqual(self.run_results([False], key="b"), [60])
+        self.assertEqual(self.run_results([True]), [120])
+        self.adaptive.forget("a")
+        self.adaptive.forget("missing")
+        self.assertEqual(self.run_results([False]), [60])
+
+
+if __name__ == "__main__":
+    unittest.main()
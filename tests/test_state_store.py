@@ -0,0 +1,146 @@
+"""
+状态存储的测试：快照 + 追加日志，含进程被强制结束后的恢复
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+from src.state_store import StateStore, TargetState
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 子进程：写入若干状态后不经 close() 直接被 SIGKILL（没有 SIGKILL 的系统用 os._exit）
+KILLED_WRITER = textwrap.dedent("""
+    import os, signal, sys
+    from pathlib import Path
+    sys.path.insert(0, sys.argv[2])
+    from src.state_store import StateStore
+    store = StateStore(Path(sys.argv[1]), flush_interval=3600)
+    store.load()
+    store.set("https://a.example.com/", {"last_ok": True, "latency_ms": 12})
+    store.flush()
+    store.set("https://b.example.com/", {"last_ok": False, "error": "连接超时"})
+    store.set("https://a.example.com/", {"last_ok": False, "latency_ms": None})
+    store.set("https://c.example.com/", {"last_ok": True}, changed=False)
+    store.prune(["https://a.example.com/", "https://b.example.com/"])
+    os.kill(os.getpid(), signal.SIGKILL) if hasattr(signal, "SIGKILL") else os._exit(1)
+""")
+
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "state.json"
+        self.journal = Path(self.tmp.name) / "state.json.journal"
+
+    def store(self, **options):
+        store = StateStore(self.path, **options)
+        store.load()
+        return store
+
+    def test_missing_file_loads_empty(self):
+        store = self.store()
+        self.assertEqual(store.data, {})
+        self.assertIsNone(store.load_error)
+
+    def test_replay_after_hard_kill(self):
+        process = subprocess.run([sys.executable, "-c", KILLED_WRITER, str(self.path), str(ROOT)])
+        self.assertNotEqual(process.returncode, 0)
+        # 快照只有第一次写入，之后的变化都在日志中
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")),
+                         {"https://a.example.com/": {"last_ok": True, "latency_ms": 12}})
+        store = self.store()
+        self.assertEqual(store.replayed, 3)
+        self.assertEqual(store.data, {
+            "https://a.example.com/": {"last_ok": False, "latency_ms": None},
+            "https://b.example.com/": {"last_ok": False, "error": "连接超时"},
+        })
+        # 重放后立即写快照并清空日志
+        self.assertEqual(self.journal.read_bytes(), b"")
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), store.data)
+
+    def test_torn_last_line_ignored(self):
+        store = self.store(flush_interval=3600)
+        store.set("a", {"last_ok": True})
+        store.set("b", {"last_ok": False})
+        store._journal.close()
+        data = self.journal.read_bytes()
+        self.journal.write_bytes(data[:-7])
+        store = self.store()
+        self.assertEqual(store.replayed, 1)
+        self.assertEqual(store.data, {"a": {"last_ok": True}})
+
+    def test_torn_multibyte_character_ignored(self):
+        store = self.store(flush_interval=3600)
+        store.set("https://例子.测试/", {"error": "连接超时"})
+        store.set("https://例子.测试/", {"error": "证书已过期"})
+        store._journal.close()
+        data = self.journal.read_bytes()
+        # 截断在最后一个汉字的 UTF-8 编码中间
+        self.journal.write_bytes(data[:data.rindex("期".encode("utf-8")) + 1])
+        store = self.store()
+        self.assertEqual(store.replayed, 1)
+        self.assertEqual(store.data, {"https://例子.测试/": {"error": "连接超时"}})
+
+    def test_replace_and_delete_replayed(self):
+        store = self.store(flush_interval=3600)
+        store.set("a", 1)
+        store.replace({"b": 2, "c": 3})
+        store.prune(["b"])
+        store._journal.close()
+        self.assertEqual(self.store().data, {"b": 2})
+
+    def test_corrupt_snapshot_kept_aside(self):
+        self.path.write_text("{broken", encoding="utf-8")
+        store = self.store()
+        self.assertEqual(store.data, {})
+        self.assertIn("损坏", store.load_error)
+        self.assertTrue(self.path.with_name("state.json.corrupt").exists())
+
+    def test_flush_interval_and_untracked_changes(self):
+        store = self.store(flush_interval=3600)
+        store.set("a", 1, changed=False)
+        self.assertFalse(store.maybe_flush())
+        self.assertFalse(self.journal.exists())
+        store.set("b", 2)
+        self.assertFalse(store.maybe_flush())
+        store.flush_interval = 0
+        self.assertTrue(store.maybe_flush())
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), {"a": 1, "b": 2})
+        # 只有非关键字段的更新在退出时保存
+        store.set("a", 3, changed=False)
+        store.close()
+        self.assertEqual(self.store().data, {"a": 3, "b": 2})
+        self.assertEqual(store.writes, 2)
+
+    def test_records_round_trip(self):
+        store = self.store(record=TargetState)
+        store.set("https://a.example.com/", TargetState(last_ok=False, first_ng_ts=100, latency_ms=35))
+        store._journal.close()
+        # 日志与快照中都是普通字典，格式与不使用记录类型时相同
+        entry = json.loads(self.journal.read_text(encoding="utf-8").splitlines()[0])
+        self.assertEqual(entry[2]["first_ng_ts"], 100)
+        store = self.store(record=TargetState)
+        state = store.get("https://a.example.com/")
+        self.assertIsInstance(state, TargetState)
+        self.assertEqual((state.last_ok, state.get("first_ng_ts"), state["latency_ms"]), (False, 100, 35))
+        self.assertIsNone(state.get("unknown"))
+        with self.assertRaises(KeyError):
+            state["unknown"]
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8"))["https://a.example.com/"],
+                         state.as_dict())
+
+    def test_unserializable_value_rejected(self):
+        store = self.store()
+        store.set("a", object(), changed=False)
+        with self.assertRaises(TypeError):
+            store.flush()
+
+
+if __name__ == "__main__":
+    unittest.main()